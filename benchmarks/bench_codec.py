@@ -0,0 +1,184 @@
+"""
+JSON decode throughput of each codec, and the event loop lag caused by decoding
+large payloads on the loop, in a thread, or in a process.
+
+Payloads are shaped like Sportsbet, TAB and Ladbrokes market responses, and scaled
+up to the given size. Recorded payloads (any directory of .json files, e.g. saved
+responses) can be used instead.
+
+Event loop lag is measured by a coroutine which sleeps for 1ms at a time, as the
+time it wakes up late by.
+
+Usage:
+    python -m benchmarks.bench_codec [size_kb] [repeats] [payload_directory]
+"""
+import asyncio
+import glob
+import json
+import os
+import random
+import statistics
+import sys
+import timeit
+from concurrent.futures import ProcessPoolExecutor
+
+from src.web.codec import CODECS, get_codec, JSONDecoder
+
+
+def sportsbet_market(i: int) -> dict:
+    return {
+        "id": 100000 + i,
+        "name": "Match Betting" if i == 0 else f"Alternate Line {i}",
+        "displayOrder": i,
+        "isOpenForBetting": True,
+        "selections": [
+            {
+                "id": 1000000 + i * 10 + j,
+                "name": f"Team {j}",
+                "price": {"winPrice": round(random.uniform(1.01, 20), 2)},
+                "resultType": None,
+            }
+            for j in range(3)
+        ],
+    }
+
+
+def tab_market(i: int) -> dict:
+    return {
+        "betOption": "Head To Head" if i == 0 else f"Pick Your Own Line {i}",
+        "betOptionSpectrumId": 200 + i,
+        "isFuture": False,
+        "propositions": [
+            {
+                "name": f"Team {j}",
+                "returnWin": round(random.uniform(1.01, 20), 2),
+                "number": j,
+                "isOpen": True,
+            }
+            for j in range(3)
+        ],
+    }
+
+
+def ladbrokes_market(i: int) -> dict:
+    return {
+        "market": {
+            "id": str(300000 + i),
+            "name": f"Match Result {i}",
+            "children": [
+                {
+                    "outcome": {
+                        "id": str(3000000 + i * 10 + j),
+                        "name": f"Team {j}",
+                        "children": [
+                            {"price": {"priceDec": str(random.uniform(1, 20))}}
+                        ],
+                    }
+                }
+                for j in range(3)
+            ],
+        }
+    }
+
+
+def create_payloads(size: int) -> dict:
+    payloads = dict()
+    for name, create_market, wrap in [
+        ("sportsbet", sportsbet_market, lambda markets: markets),
+        ("tab", tab_market, lambda markets: {"markets": markets}),
+        (
+            "ladbrokes",
+            ladbrokes_market,
+            lambda markets: {
+                "SSResponse": {"children": [{"event": {"children": markets}}]}
+            },
+        ),
+    ]:
+        marketSize = len(json.dumps(create_market(0)))
+        markets = [create_market(i) for i in range(max(size // marketSize, 1))]
+        payloads[name] = json.dumps(wrap(markets)).encode("utf-8")
+    return payloads
+
+
+def load_payloads(directory: str) -> dict:
+    payloads = dict()
+    for filepath in sorted(glob.glob(os.path.join(directory, "**/*.json"))):
+        with open(filepath, "rb") as file:
+            payloads[os.path.relpath(filepath, directory)] = file.read()
+    return payloads
+
+
+def measure_throughput(payloads: dict, repeats: int):
+    print("throughput (MB/s):")
+    print(" " * 14 + "".join(f"{name:>14}" for name in payloads))
+    for codec in CODECS.values():
+        row = []
+        for payload in payloads.values():
+            duration = min(
+                timeit.repeat(lambda: codec.loads(payload), number=1, repeat=repeats)
+            )
+            row.append(len(payload) / duration / 1e6)
+        print(f"{codec.name:<14}" + "".join(f"{value:>14.1f}" for value in row))
+
+
+async def measure_lag(decoder: JSONDecoder, payloads: list, repeats: int):
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            startTime = timeit.default_timer()
+            await asyncio.sleep(0.001)
+            lags.append(timeit.default_timer() - startTime - 0.001)
+
+    tick = asyncio.create_task(ticker())
+    startTime = timeit.default_timer()
+    for _ in range(repeats):
+        for payload in payloads:
+            await decoder.decode(payload)
+            await asyncio.sleep(0)
+    duration = timeit.default_timer() - startTime
+    done.set()
+    await tick
+    return duration, lags
+
+
+async def main(size: int, repeats: int, directory: str = None):
+    payloads = load_payloads(directory) if directory else create_payloads(size)
+    print(
+        "payloads: "
+        + ", ".join(
+            f"{name} ({len(data) / 1e6:.2f}MB)" for name, data in payloads.items()
+        )
+    )
+    print("")
+    measure_throughput(payloads, repeats)
+    print("")
+
+    codec = get_codec()
+    with ProcessPoolExecutor(max_workers=1) as processes:
+        # start the process ahead of time
+        await asyncio.get_running_loop().run_in_executor(processes, int)
+
+        print(f"event loop lag while decoding with {codec.name}:")
+        for name, decoder in [
+            ("on the loop", JSONDecoder(codec, threshold=None)),
+            ("thread", JSONDecoder(codec, threshold=0)),
+            ("process", JSONDecoder(codec, threshold=0, executor=processes)),
+        ]:
+            duration, lags = await measure_lag(
+                decoder, list(payloads.values()), repeats
+            )
+            lags.sort()
+            print(f"    {name}:")
+            print(f"        total:    {duration:.3f}s")
+            print(f"        mean lag: {statistics.mean(lags) * 1000:.2f}ms")
+            print(f"        p99 lag:  {lags[int(len(lags) * 0.99)] * 1000:.2f}ms")
+            print(f"        max lag:  {lags[-1] * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) * 1000 if len(sys.argv) > 1 else 5_000_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    directory = sys.argv[3] if len(sys.argv) > 3 else None
+    asyncio.run(main(size, repeats, directory))
@@ -0,0 +1,100 @@
+"""
+Cost of resolving the rate limit key (top-level domain) of each request.
+
+Startup: the time for a fresh interpreter to import tldextract and resolve its first
+domain, fetching the public suffix list over the network (as the previous default
+TLDExtract() did with an empty cache) versus reading the bundled snapshot.
+
+Per request: the time to resolve the key of a request, parsing the url with
+tldextract every time (the previous implementation) versus the memoized lookup by
+host, and a key precomputed by the caller (the "rate_limit_key" extension).
+
+Usage:
+    python -m benchmarks.bench_domains [num_requests] [fetch_timeout]
+"""
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+
+import httpx
+import tldextract
+
+from src.web.api.utils import get_base_urls
+from src.web.client import get_rate_limit_key
+
+STARTUP = """
+import time
+startTime = time.perf_counter()
+import tldextract
+extract = tldextract.TLDExtract({arguments})
+extract("https://www.sportsbet.com.au/apigw")
+print(time.perf_counter() - startTime)
+"""
+
+
+def time_startup(arguments: str, repeats: int = 3) -> float:
+    durations = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP.format(arguments=arguments)],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        durations.append(float(output.stdout.strip().splitlines()[-1]))
+    return statistics.median(durations)
+
+
+def main(num_requests: int, fetch_timeout: float):
+    with tempfile.TemporaryDirectory() as directory:
+        network = time_startup(
+            f"cache_dir={directory!r}, cache_fetch_timeout={fetch_timeout}", 1
+        )
+    snapshot = time_startup("suffix_list_urls=(), cache_dir=None")
+
+    print("startup (import and first resolution):")
+    print(f"    network suffix list: {network * 1000:.1f}ms")
+    print(f"    bundled snapshot:    {snapshot * 1000:.1f}ms")
+    print("")
+
+    extract = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+    requests = [
+        httpx.Request("GET", f"{url}/events/{i}", params={"jurisdiction": "NSW"})
+        for i in range(num_requests // len(get_base_urls()))
+        for url in get_base_urls()
+    ]
+    keyed = [
+        httpx.Request("GET", request.url, extensions={"rate_limit_key": "precomputed"})
+        for request in requests
+    ]
+
+    def parse_every_time():
+        for request in requests:
+            extract(str(request.url)).domain
+
+    def memoized():
+        for request in requests:
+            get_rate_limit_key(request)
+
+    def precomputed():
+        for request in keyed:
+            get_rate_limit_key(request)
+
+    print(f"per request ({len(requests)} requests to {len(get_base_urls())} hosts):")
+    for name, function in [
+        ("tldextract per request", parse_every_time),
+        ("memoized by host", memoized),
+        ("precomputed key", precomputed),
+    ]:
+        function()  # warm up
+        duration = min(timeit.repeat(function, number=1, repeat=5))
+        label = name + ":"
+        print(f"    {label:<26}{duration / len(requests) * 1e6:.2f}us")
+
+
+if __name__ == "__main__":
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    fetch_timeout = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    main(num_requests, fetch_timeout)
@@ -0,0 +1,195 @@
+"""
+Request latency of the client against a local HTTPS stand-in for a bookmaker API,
+with and without connection reuse and HTTP/2.
+
+Compares:
+    - HTTP/1.1 without keep-alive (a TCP and TLS handshake per request)
+    - HTTP/1.1 with the connection pool sized from ClientSettings
+    - HTTP/2, multiplexing every request over a single connection
+
+The server runs locally, so handshakes only cost CPU time. Over a real network each
+handshake also costs two to three round trips, so the difference is larger.
+
+Requires hypercorn (poetry install --with benchmark), h2 and openssl.
+
+Usage:
+    python -m benchmarks.bench_http2 [num_requests] [concurrency] [server_delay]
+"""
+import asyncio
+import json
+import os
+import socket
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import timeit
+
+import httpx
+
+from src.web.client import ClientSettings, RateLimitedClient
+
+try:
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+except ImportError:
+    sys.exit("hypercorn is required: poetry install --with benchmark")
+
+
+def create_certificate(directory: str):
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-keyout",
+            keyfile,
+            "-out",
+            certfile,
+            "-days",
+            "1",
+            "-subj",
+            "/CN=localhost",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return certfile, keyfile
+
+
+def create_app(delay: float):
+    body = json.dumps({"markets": [{"name": "Head to Head"}] * 20}).encode()
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        await asyncio.sleep(delay)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/json")],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+class Server(threading.Thread):
+    """
+    Runs hypercorn (HTTP/1.1 and HTTP/2 over TLS) in a thread with its own loop.
+    """
+
+    def __init__(self, app, certfile: str, keyfile: str):
+        super().__init__(daemon=True)
+        self.app = app
+        # find a free port to bind to
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.url = f"https://localhost:{port}"
+
+        self.config = Config()
+        self.config.bind = [f"127.0.0.1:{port}"]
+        self.config.certfile = certfile
+        self.config.keyfile = keyfile
+        self.config.alpn_protocols = ["h2", "http/1.1"]
+        self.config.accesslog = None
+        self.config.errorlog = None
+        self.started = threading.Event()
+
+    def run(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self._shutdown = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._loop.call_soon(self.started.set)
+        await serve(self.app, self.config, shutdown_trigger=self._shutdown.wait)
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._shutdown.set)
+        self.join()
+
+
+async def run(client: RateLimitedClient, url: str, num_requests: int, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    versions = set()
+
+    async def request(i: int):
+        async with semaphore:
+            startTime = timeit.default_timer()
+            response = await client.get(url, params={"event": i})
+            latencies.append(timeit.default_timer() - startTime)
+            versions.add(response.http_version)
+
+    startTime = timeit.default_timer()
+    await asyncio.gather(*[request(i) for i in range(num_requests)])
+    return timeit.default_timer() - startTime, latencies, versions
+
+
+async def main(num_requests: int, concurrency: int, delay: float):
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = create_certificate(directory)
+        server = Server(create_app(delay), certfile, keyfile)
+        server.start()
+        server.started.wait()
+        # wait for hypercorn to start listening
+        await asyncio.sleep(0.5)
+
+        verify = ssl.create_default_context(cafile=certfile)
+
+        print(
+            f"{num_requests} requests, concurrency {concurrency}, "
+            f"server delay {delay * 1000:.0f}ms"
+        )
+        print("")
+
+        configurations = [
+            ("HTTP/1.1, no keep-alive", False, 0),
+            ("HTTP/1.1, pooled", False, None),
+            ("HTTP/2", True, None),
+        ]
+        for name, http2, keepalive in configurations:
+            clientSettings = ClientSettings(None, None)
+            clientSettings.coalesce_requests = False
+            clientSettings.set_http2(http2)
+            limits = clientSettings.get_limits()
+            if keepalive is not None:
+                limits = httpx.Limits(
+                    max_connections=limits.max_connections,
+                    max_keepalive_connections=keepalive,
+                )
+
+            async with RateLimitedClient(
+                clientSettings, limits=limits, verify=verify
+            ) as client:
+                duration, latencies, versions = await run(
+                    client, server.url, num_requests, concurrency
+                )
+
+            latencies.sort()
+            print(f"{name} ({', '.join(sorted(versions))}):")
+            print(f"    total:  {duration:.3f}s")
+            print(f"    mean:   {statistics.mean(latencies) * 1000:.2f}ms")
+            print(f"    median: {statistics.median(latencies) * 1000:.2f}ms")
+            p95 = latencies[int(len(latencies) * 0.95)]
+            print(f"    p95:    {p95 * 1000:.2f}ms")
+
+        server.stop()
+
+
+if __name__ == "__main__":
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    delay = float(sys.argv[3]) if len(sys.argv) > 3 else 0.005
+    asyncio.run(main(num_requests, concurrency, delay))
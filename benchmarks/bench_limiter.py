@@ -0,0 +1,80 @@
+"""
+Scheduler overhead of the client rate limiter with a large number of queued requests.
+
+Compares the token bucket RateLimiter against the previous approach, where every
+request held a semaphore and spawned an asyncio.sleep task to release it later.
+The rate is set high enough that the ideal duration is small, so the difference
+between the measured and ideal durations is the scheduling overhead.
+
+Usage:
+    python -m benchmarks.bench_limiter [num_requests] [rate] [concurrency]
+"""
+import asyncio
+import sys
+import timeit
+
+from src.web.limiter import RateLimiter
+
+
+class SemaphoreLimiter:
+    """
+    The previous implementation: hold a semaphore per request, and release it in a
+    background task once the interval has elapsed.
+    """
+
+    def __init__(self, rate, concurrency):
+        self.interval = concurrency / rate
+        self._lock = asyncio.Semaphore(concurrency)
+        self._background_tasks = set()
+        self.created_tasks = 0
+
+    async def acquire(self):
+        await self._lock.acquire()
+
+    def release(self):
+        def release_lock(task):
+            self._lock.release()
+            self._background_tasks.discard(task)
+
+        wait = asyncio.create_task(asyncio.sleep(self.interval))
+        self._background_tasks.add(wait)
+        wait.add_done_callback(release_lock)
+        self.created_tasks += 1
+
+
+async def run(limiter, num_requests: int):
+    async def request():
+        await limiter.acquire()
+        limiter.release()
+
+    startTime = timeit.default_timer()
+    await asyncio.gather(*[request() for _ in range(num_requests)])
+    return timeit.default_timer() - startTime
+
+
+async def main(num_requests: int, rate: float, concurrency: int):
+    ideal = (num_requests - concurrency) / rate
+
+    print(f"{num_requests} queued requests, {rate} req/s, concurrency {concurrency}")
+    print(f"ideal duration: {ideal:.3f}s")
+
+    for name, limiter in [
+        ("semaphore + sleep tasks", SemaphoreLimiter(rate, concurrency)),
+        ("token bucket", RateLimiter(rate, concurrency)),
+    ]:
+        elapsed = await run(limiter, num_requests)
+        overhead = elapsed - ideal
+        print(
+            f"{name:>24}: {elapsed:.3f}s total, {overhead:.3f}s overhead, "
+            f"{overhead / num_requests * 1e6:.1f}us per request"
+        )
+        if isinstance(limiter, SemaphoreLimiter):
+            print(f"{'':>24}  background tasks created: {limiter.created_tasks}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    num_requests = int(args[0]) if len(args) > 0 else 20000
+    rate = float(args[1]) if len(args) > 1 else 10000
+    concurrency = int(args[2]) if len(args) > 2 else 10
+    asyncio.run(main(num_requests, rate, concurrency))
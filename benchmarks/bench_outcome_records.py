@@ -0,0 +1,160 @@
+"""
+Time to write outcome records (the returns of every outcome, each time its market
+is refreshed) through the ORM, as tasks previously did, and in bulk: as multi-row
+INSERTs (insertmanyvalues), with either driver, and with COPY through asyncpg.
+
+Records are written RECORDS_PER_TASK at a time, each in its own transaction, as a
+task writes the records of its markets.
+
+Requires a PostgreSQL database (tables are created, and emptied afterwards).
+
+Usage:
+    python -m benchmarks.bench_outcome_records [records] [url]
+"""
+import asyncio
+import datetime
+import sys
+import timeit
+
+import sqlalchemy
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+import config
+from src.database.core import copy_outcome_records, insert_outcome_records
+from src.database.models import (
+    Bookmaker,
+    DatabaseModel,
+    OutcomeRecord,
+    ReferenceContest,
+    ReferenceEvent,
+    ReferenceOutcome,
+    ReferenceSport,
+)
+from src.database.records import MarketData, OutcomeData
+
+MARKETS = 1000
+OUTCOMES = ["Home", "Away"]
+RECORDS_PER_TASK = 2000  # one record for each outcome
+
+
+def create_outcomes(session: Session) -> list:
+    bookmaker = Bookmaker("Ladbrokes")
+    sport = ReferenceSport(bookmaker, refnum="6", refname="Basketball")
+    contest = ReferenceContest(sport, refnum="35", refname="NBL")
+    event = ReferenceEvent(contest, refnum="1", refname="A v B")
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    markets = [
+        MarketData(
+            str(i),
+            f"Market {i}",
+            tuple(OutcomeData(name, 1.9, timestamp) for name in OUTCOMES),
+        ).create(event)
+        for i in range(MARKETS)
+    ]
+    session.add_all([bookmaker, sport, contest, event] + markets)
+    session.commit()
+    return session.scalars(select(ReferenceOutcome)).all()
+
+
+def create_records(outcomes: list, numRecords: int):
+    """
+    Yield the (outcome, timestamp, returns) of each task's records.
+    """
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    for start in range(0, numRecords, RECORDS_PER_TASK):
+        timestamp += datetime.timedelta(seconds=1)
+        yield [
+            (outcomes[i % len(outcomes)], timestamp, 1.5 + i % 100 / 100)
+            for i in range(start, min(start + RECORDS_PER_TASK, numRecords))
+        ]
+
+
+async def run_orm(engine, outcomes: list, numRecords: int) -> float:
+    with Session(engine, expire_on_commit=False) as session:
+        session.add_all(outcomes)
+        startTime = timeit.default_timer()
+        for records in create_records(outcomes, numRecords):
+            session.add_all([OutcomeRecord(*record) for record in records])
+            session.commit()
+            # the records would be discarded with the task's session
+            for outcome in outcomes:
+                session.expire(outcome, ["records"])
+        return timeit.default_timer() - startTime
+
+
+async def run_insert(engine, outcomes: list, numRecords: int) -> float:
+    with Session(engine) as session:
+        startTime = timeit.default_timer()
+        for records in create_records(outcomes, numRecords):
+            rows = [OutcomeRecord.get_row(*record) for record in records]
+            insert_outcome_records(session, rows)
+            session.commit()
+        return timeit.default_timer() - startTime
+
+
+async def run_async_insert(url, outcomes: list, numRecords: int) -> float:
+    engine = create_async_engine(url)
+    sessionmaker = async_sessionmaker(engine)
+    try:
+        startTime = timeit.default_timer()
+        for records in create_records(outcomes, numRecords):
+            rows = [OutcomeRecord.get_row(*record) for record in records]
+            async with sessionmaker() as session:
+                await session.run_sync(insert_outcome_records, rows)
+                await session.commit()
+        return timeit.default_timer() - startTime
+    finally:
+        await engine.dispose()
+
+
+async def run_copy(url, outcomes: list, numRecords: int) -> float:
+    engine = create_async_engine(url)
+    sessionmaker = async_sessionmaker(engine)
+    try:
+        startTime = timeit.default_timer()
+        for records in create_records(outcomes, numRecords):
+            rows = [OutcomeRecord.get_row(*record) for record in records]
+            async with sessionmaker() as session:
+                await copy_outcome_records(session, rows)
+                await session.commit()
+        return timeit.default_timer() - startTime
+    finally:
+        await engine.dispose()
+
+
+def main(numRecords: int, url: str):
+    syncUrl = sqlalchemy.engine.make_url(url).set(drivername=config.DATABASE_DRIVER)
+    asyncUrl = syncUrl.set(drivername=config.ASYNC_DATABASE_DRIVER)
+    engine = sqlalchemy.create_engine(syncUrl)
+    DatabaseModel.metadata.create_all(engine)
+    try:
+        print(f"{'method':>18}{'seconds':>10}{'records/s':>12}")
+        for name, implementation, implementationUrl in [
+            ("orm (psycopg2)", run_orm, engine),
+            ("insert (psycopg2)", run_insert, engine),
+            ("insert (asyncpg)", run_async_insert, asyncUrl),
+            ("copy (asyncpg)", run_copy, asyncUrl),
+        ]:
+            with Session(engine, expire_on_commit=False) as session:
+                outcomes = create_outcomes(session)
+            duration = asyncio.run(
+                implementation(implementationUrl, outcomes, numRecords)
+            )
+            with Session(engine) as session:
+                # the records created with the markets, and those written
+                count = session.scalar(select(func.count(OutcomeRecord.id)))
+                assert count == len(outcomes) + numRecords
+                for table in reversed(DatabaseModel.metadata.sorted_tables):
+                    session.execute(table.delete())
+                session.commit()
+            print(f"{name:>18}{duration:>10.2f}{numRecords / duration:>12.0f}")
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    numRecords = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    url = sys.argv[2] if len(sys.argv) > 2 else config.TEST_DATABASE_CONNECT_STRING
+    main(numRecords, url)
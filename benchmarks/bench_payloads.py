@@ -0,0 +1,141 @@
+"""
+Size of task payloads, and the throughput of enqueueing, dequeueing and
+deserializing them, for the previous payloads (pickled select statements, hex
+encoded) and the current ones ("ReferenceEvent:42").
+
+Enqueueing serializes the event and formats the task message as the broker does,
+and dequeueing parses the message. Deserializing loads the events from an
+in-memory SQLite database, one query per event previously, and one query per
+MARKETS_PER_TASK events now (as add_markets_batch does).
+
+Usage:
+    python -m benchmarks.bench_payloads [tasks] [events]
+"""
+import sys
+import timeit
+import uuid
+
+import sqlalchemy
+from sqlalchemy import select
+from sqlalchemy.ext.serializer import dumps, loads
+from sqlalchemy.orm import Session
+from taskiq import TaskiqMessage
+from taskiq.formatters.json_formatter import JSONFormatter
+
+import config
+from src.database.models import (
+    Bookmaker,
+    DatabaseModel,
+    ReferenceContest,
+    ReferenceEvent,
+    ReferenceSport,
+)
+from src.database.utils import deserialize_models, serialize_model
+
+
+def serialize_model_pickled(model) -> str:
+    """
+    The previous serialization, for comparison.
+    """
+    modelClass = model.__class__
+    query = select(modelClass).where(modelClass.id == model.id)
+    return dumps(query).hex()
+
+
+def deserialize_model_pickled(serialized_model: str, session: Session):
+    statement = loads(
+        bytes.fromhex(serialized_model), metadata=DatabaseModel.metadata
+    )
+    return session.scalars(statement).all()[0]
+
+
+def deserialize_batched(serialized_models: list, session: Session) -> list:
+    batchSize = config.MARKETS_PER_TASK
+    models = []
+    for i in range(0, len(serialized_models), batchSize):
+        models += deserialize_models(serialized_models[i : i + batchSize], session)
+    return models
+
+
+def deserialize_pickled(serialized_models: list, session: Session) -> list:
+    return [deserialize_model_pickled(model, session) for model in serialized_models]
+
+
+def create_events(session: Session, numEvents: int) -> list:
+    bookmaker = Bookmaker("Ladbrokes")
+    sport = ReferenceSport(bookmaker, refnum="6", refname="Basketball")
+    contest = ReferenceContest(sport, refnum="35", refname="NBL")
+    events = [
+        ReferenceEvent(contest, refnum=str(i), refname=f"Event {i}")
+        for i in range(numEvents)
+    ]
+    session.add_all([bookmaker, sport, contest] + events)
+    session.commit()
+    return events
+
+
+def enqueue_dequeue(events: list, numTasks: int, serialize) -> tuple:
+    """
+    Returns:
+        tuple: the seconds taken to enqueue and dequeue, and the bytes enqueued
+    """
+    formatter = JSONFormatter()
+    messages = []
+    startTime = timeit.default_timer()
+    for i in range(numTasks):
+        message = TaskiqMessage(
+            task_id=uuid.uuid4().hex,
+            task_name="src.tasks:add_events",
+            labels={},
+            args=[serialize(events[i % len(events)])],
+            kwargs={},
+        )
+        messages.append(formatter.dumps(message).message)
+    enqueueTime = timeit.default_timer() - startTime
+
+    startTime = timeit.default_timer()
+    for message in messages:
+        formatter.loads(message)
+    dequeueTime = timeit.default_timer() - startTime
+
+    return enqueueTime, dequeueTime, sum(len(message) for message in messages)
+
+
+def main(numTasks: int, numEvents: int):
+    engine = sqlalchemy.create_engine("sqlite://")
+    DatabaseModel.metadata.create_all(engine)
+    implementations = [
+        ("pickled", serialize_model_pickled, deserialize_pickled),
+        ("id", serialize_model, deserialize_batched),
+    ]
+
+    with Session(engine) as session:
+        events = create_events(session, numEvents)
+
+        print(
+            f"{'payload':>8}{'arg bytes':>11}{'msg bytes':>11}"
+            f"{'enqueue/s':>12}{'dequeue/s':>12}{'deserialize/s':>15}"
+        )
+        for name, serialize, deserialize in implementations:
+            argBytes = len(serialize(events[0]))
+            enqueueTime, dequeueTime, totalBytes = enqueue_dequeue(
+                events, numTasks, serialize
+            )
+
+            serializedEvents = [serialize(event) for event in events]
+            session.expunge_all()
+            startTime = timeit.default_timer()
+            deserialize(serializedEvents, session)
+            deserializeTime = timeit.default_timer() - startTime
+
+            print(
+                f"{name:>8}{argBytes:>11}{totalBytes // numTasks:>11}"
+                f"{numTasks / enqueueTime:>12.0f}{numTasks / dequeueTime:>12.0f}"
+                f"{numEvents / deserializeTime:>15.0f}"
+            )
+
+
+if __name__ == "__main__":
+    numTasks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    numEvents = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    main(numTasks, numEvents)
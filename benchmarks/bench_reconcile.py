@@ -0,0 +1,148 @@
+"""
+Time to reconcile the markets retrieved for an event with those recorded, for
+events with thousands of markets.
+
+Half of the retrieved markets have been recorded (and get new outcome records), the
+other half are new, and half of the recorded markets weren't retrieved. The time
+per market stays flat as the number of markets grows, whereas the previous nested
+loops (matching every retrieved market against every recorded market, then every
+outcome against every outcome) grow linearly per market.
+
+Uses an in-memory SQLite database, and includes the query for the recorded markets.
+
+Usage:
+    python -m benchmarks.bench_reconcile [max_markets] [repeats]
+"""
+import datetime
+import sys
+import timeit
+
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+from src.database.core import get_recorded_entities
+from src.database.models import (
+    Bookmaker,
+    DatabaseModel,
+    ReferenceContest,
+    ReferenceEvent,
+    ReferenceMarket,
+    ReferenceSport,
+)
+from src.database.records import MarketData, OutcomeData
+from src.tasks import record_entities
+from src.web.enums import WebRequestStatus
+
+OUTCOMES = ["Home", "Draw", "Away"]
+NESTED_MAX_MARKETS = 2000  # the nested loops take too long beyond this
+
+
+def create_markets(start: int, stop: int) -> list:
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    return [
+        MarketData(
+            str(i),
+            f"Market {i}",
+            tuple(OutcomeData(name, 1.9, timestamp) for name in OUTCOMES),
+        )
+        for i in range(start, stop)
+    ]
+
+
+def create_event(session: Session, numMarkets: int) -> ReferenceEvent:
+    bookmaker = Bookmaker("Ladbrokes")
+    sport = ReferenceSport(bookmaker, refnum="6", refname="Basketball")
+    contest = ReferenceContest(sport, refnum="35", refname="NBL")
+    event = ReferenceEvent(contest, refnum="1", refname="A v B")
+    markets = [market.create(event) for market in create_markets(0, numMarkets)]
+    for market in markets:
+        market.added()
+    session.add_all([bookmaker, sport, contest, event] + markets)
+    session.commit()
+    return event
+
+
+def reconcile_nested(session: Session, event: ReferenceEvent, novelMarkets: list):
+    """
+    The previous reconciliation, for comparison.
+    """
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    recordedMarkets = get_recorded_entities(session, ReferenceMarket, parent=event)
+    for novelMarket in novelMarkets:
+        for recordedMarket in recordedMarkets:
+            if novelMarket.natural_key == recordedMarket.natural_key:
+                for outcome in recordedMarket.outcomes:
+                    for novelOutcome in novelMarket.outcomes:
+                        if outcome.natural_key == novelOutcome.natural_key:
+                            session.add(novelOutcome.create_record(outcome))
+    novelKeys = {market.natural_key for market in novelMarkets}
+    recordedKeys = {market.natural_key for market in recordedMarkets}
+    for market in recordedMarkets:
+        if market.natural_key in novelKeys:
+            market.found(timestamp)
+        else:
+            market.not_found(timestamp)
+    for market in novelMarkets:
+        if market.natural_key not in recordedKeys:
+            session.add(market.create(event))
+
+
+def reconcile(session: Session, event: ReferenceEvent, novelMarkets: list):
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    record_entities(
+        session,
+        event,
+        ReferenceMarket,
+        WebRequestStatus.SUCCESS,
+        novelMarkets,
+        timestamp,
+    )
+
+
+def measure(numMarkets: int, repeats: int) -> dict:
+    engine = sqlalchemy.create_engine("sqlite://")
+    DatabaseModel.metadata.create_all(engine)
+    results = dict()
+    with Session(engine, autoflush=False) as session:
+        event = create_event(session, numMarkets)
+        # half recorded, half new
+        novelMarkets = create_markets(numMarkets // 2, numMarkets + numMarkets // 2)
+        implementations = [("keyed", reconcile)]
+        if numMarkets <= NESTED_MAX_MARKETS:
+            implementations.append(("nested", reconcile_nested))
+        for name, implementation in implementations:
+            durations = []
+            for _ in range(repeats):
+                # start from the recorded markets every time
+                session.expire_all()
+                startTime = timeit.default_timer()
+                implementation(session, event, novelMarkets)
+                durations.append(timeit.default_timer() - startTime)
+                session.rollback()
+            results[name] = min(durations)
+    return results
+
+
+def main(maxMarkets: int, repeats: int):
+    print(
+        f"{'markets':>8}"
+        + "".join(f"{name:>12}{'per market':>12}" for name in ["keyed", "nested"])
+    )
+    numMarkets = 500
+    while numMarkets <= maxMarkets:
+        results = measure(numMarkets, repeats)
+        row = f"{numMarkets:>8}"
+        for name in ["keyed", "nested"]:
+            if name in results:
+                duration = results[name]
+                row += f"{duration:>11.3f}s{duration / numMarkets * 1e6:>10.1f}us"
+            else:
+                row += f"{'-':>12}{'-':>12}"
+        print(row)
+        numMarkets *= 2
+
+
+if __name__ == "__main__":
+    maxMarkets = int(sys.argv[1]) if len(sys.argv) > 1 else 16000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    main(maxMarkets, repeats)
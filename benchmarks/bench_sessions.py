@@ -0,0 +1,171 @@
+"""
+Throughput of concurrent tasks with a synchronous session (psycopg2, shared by
+every task, as tasks previously used) and with an async session per task
+(asyncpg, from a pool), under realistic database latency.
+
+Each task loads an event, makes a request (a sleep), then records a few markets for
+the event and commits, like add_markets_batch. Database latency is added on the
+server, with a pg_sleep before each of the two database phases, so it is felt
+however the driver waits: the synchronous driver blocks the event loop (and every
+other task's requests) while it waits, and the async driver doesn't.
+
+Requires a PostgreSQL database (tables are created, and emptied afterwards).
+
+Usage:
+    python -m benchmarks.bench_sessions [tasks] [db_latency_ms] [request_ms] [url]
+"""
+import asyncio
+import datetime
+import sys
+import timeit
+
+import sqlalchemy
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+import config
+from src.database.models import (
+    Bookmaker,
+    DatabaseModel,
+    ReferenceContest,
+    ReferenceEvent,
+    ReferenceMarket,
+    ReferenceSport,
+)
+from src.database.records import MarketData, OutcomeData
+from src.database.utils import deserialize_model, serialize_model
+from src.tasks import record_entities
+from src.web.enums import WebRequestStatus
+
+CONCURRENCY = 50  # tasks run at once (as a worker would)
+MARKETS = 5  # recorded per task
+
+
+def create_events(session: Session, numEvents: int) -> list:
+    bookmaker = Bookmaker("Ladbrokes")
+    sport = ReferenceSport(bookmaker, refnum="6", refname="Basketball")
+    contest = ReferenceContest(sport, refnum="35", refname="NBL")
+    events = [
+        ReferenceEvent(contest, refnum=str(i), refname=f"Event {i}")
+        for i in range(numEvents)
+    ]
+    for entity in [sport, contest] + events:
+        entity.added()
+    session.add_all([bookmaker, sport, contest] + events)
+    session.commit()
+    return [serialize_model(event) for event in events]
+
+
+def create_markets() -> list:
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    return [
+        MarketData(
+            str(i),
+            f"Market {i}",
+            tuple(OutcomeData(name, 1.9, timestamp) for name in ["Home", "Away"]),
+        )
+        for i in range(MARKETS)
+    ]
+
+
+def load_event(session: Session, model: str, latency: float) -> ReferenceEvent:
+    session.execute(text("SELECT pg_sleep(:latency)"), {"latency": latency})
+    return deserialize_model(model, session)
+
+
+def record_markets(session: Session, event: ReferenceEvent, latency: float):
+    session.execute(text("SELECT pg_sleep(:latency)"), {"latency": latency})
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    record_entities(
+        session,
+        event,
+        ReferenceMarket,
+        WebRequestStatus.SUCCESS,
+        create_markets(),
+        timestamp,
+    )
+
+
+async def run_tasks(models: list, task) -> float:
+    slots = asyncio.Semaphore(CONCURRENCY)
+
+    async def run(model: str):
+        async with slots:
+            await task(model)
+
+    startTime = timeit.default_timer()
+    await asyncio.gather(*[run(model) for model in models])
+    return timeit.default_timer() - startTime
+
+
+async def run_sync_session(
+    engine, models: list, latency: float, requestTime: float
+) -> float:
+    session = Session(engine)
+
+    async def task(model: str):
+        event = load_event(session, model, latency)
+        await asyncio.sleep(requestTime)
+        record_markets(session, event, latency)
+        session.commit()
+
+    try:
+        return await run_tasks(models, task)
+    finally:
+        session.close()
+
+
+async def run_async_sessions(
+    url: str, models: list, latency: float, requestTime: float
+) -> float:
+    engine = create_async_engine(
+        url, pool_size=config.DATABASE_POOL_SIZE, max_overflow=CONCURRENCY
+    )
+    sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def task(model: str):
+        async with sessionmaker() as session:
+            event = await session.run_sync(load_event, model, latency)
+            await session.commit()
+            await asyncio.sleep(requestTime)
+            await session.run_sync(record_markets, event, latency)
+            await session.commit()
+
+    try:
+        return await run_tasks(models, task)
+    finally:
+        await engine.dispose()
+
+
+def main(numTasks: int, latency: float, requestTime: float, url: str):
+    syncUrl = sqlalchemy.engine.make_url(url).set(drivername=config.DATABASE_DRIVER)
+    asyncUrl = syncUrl.set(drivername=config.ASYNC_DATABASE_DRIVER)
+    engine = sqlalchemy.create_engine(syncUrl)
+    DatabaseModel.metadata.create_all(engine)
+    try:
+        print(f"{'session':>14}{'seconds':>10}{'tasks/s':>10}")
+        for name, implementation, implementationUrl in [
+            ("sync (shared)", run_sync_session, engine),
+            ("async (task)", run_async_sessions, asyncUrl),
+        ]:
+            with Session(engine) as session:
+                models = create_events(session, numTasks)
+            duration = asyncio.run(
+                implementation(implementationUrl, models, latency, requestTime)
+            )
+            print(f"{name:>14}{duration:>10.2f}{numTasks / duration:>10.0f}")
+            with Session(engine) as session:
+                for table in reversed(DatabaseModel.metadata.sorted_tables):
+                    session.execute(table.delete())
+                session.commit()
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    numTasks = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.005
+    requestTime = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.1
+    url = sys.argv[4] if len(sys.argv) > 4 else config.TEST_DATABASE_CONNECT_STRING
+    main(numTasks, latency, requestTime, url)
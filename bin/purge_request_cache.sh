@@ -1 +1 @@
-rm .request_cache/*
\ No newline at end of file
+rm -rf .request_cache/*
\ No newline at end of file
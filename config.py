@@ -8,7 +8,60 @@ GLOBAL_RATE_LIMIT = 100  # requests per second (amortized)
 DOMAIN_RATE_LIMIT = 0.5  # requests per second (amortized)
 GLOBAL_CONCURRENCY_LIMIT = 10  # number of concurrent requests globally
 DOMAIN_CONCURRENCY_LIMIT = 2  # number of concurrent requests per domain
+# adjust each domain's rate (starting at DOMAIN_RATE_LIMIT) up while responses are
+# healthy, and down when throttled (429/403/503) or slow. With the "redis" backend
+# the adjusted rate is held next to the domain's bucket, shared by every worker
+ADAPTIVE_DOMAIN_RATE = True
+DOMAIN_RATE_FLOOR = 0.1  # requests per second
+DOMAIN_RATE_CEILING = 2  # requests per second
 MAX_RETRIES_PER_REQUEST = 1  # number of retries maximum per request
+RETRY_BACKOFF_BASE = 1  # seconds, doubled for each retry (with jitter)
+RETRY_BACKOFF_MAX = 30  # seconds, longer Retry-After requests aren't retried
+COALESCE_REQUESTS = True  # identical concurrent GET requests share a response
+COALESCE_WINDOW = 2  # seconds a response is reused for identical requests
+# requests for markets are prioritised by how soon their event starts. This is the
+# most (in seconds) a request can be delayed by more urgent requests
+PRIORITY_MAX_SLACK = 300
+# multiplex requests to each bookmaker over a single connection (requires h2, falls
+# back to HTTP/1.1 if it isn't installed). Off, as it was slower in benchmarks
+HTTP2 = False
+KEEPALIVE_EXPIRY = 30  # seconds an idle connection is kept open for
+WARM_UP_CONNECTIONS = False  # connect to each bookmaker when a worker starts
+# per-domain client metrics, written in the Prometheus text format ({pid} is the
+# worker's process id). None -> not written
+METRICS_TEXTFILE = "logs/client-metrics-{pid}.prom"
+METRICS_EXPORT_INTERVAL = 60  # seconds
+# JSON codec: "orjson", "simplejson", "json" or None (the fastest installed)
+JSON_CODEC = None
+JSON_DECODE_THRESHOLD = 1 << 20  # bytes, larger responses are decoded off the loop
+JSON_DECODE_EXECUTOR = "thread"  # "thread" or "process" (see src/web/codec.py)
+# where rate limit token buckets are held:
+#   "redis" - shared by every worker connected to REDIS_URL
+#   "local" - held by each worker (the effective rate scales with worker count)
+RATE_LIMIT_BACKEND = "redis"
+RATE_LIMIT_KEY_PREFIX = "ratelimit"
+
+
+# task details
+MAX_TASKS_IN_FLIGHT = 50  # tasks index.py (or schedule.py) waits on at once
+PROGRESS_REPORT_INTERVAL = 10  # seconds between index.py's progress reports
+ENTITIES_PER_PAGE = 1000  # entities per get_sports/get_contests/get_events result
+# events per add_markets_batch task. Events are grouped by bookmaker within a task,
+# so bookmakers with batch endpoints need fewer requests for larger tasks
+MARKETS_PER_TASK = 100
+# retrieve markets along with events (in add_events) for bookmakers which allow it,
+# instead of requesting the markets of each event separately
+INLINE_MARKETS = True
+# schedule.py refreshes each entity when it is next due (from when it was last
+# checked). Markets are refreshed more often as their event approaches: every
+# MARKET_REFRESH_FRACTION of the time until it starts, within the min and max
+CONTEST_REFRESH_INTERVAL = 6 * 60 * 60  # seconds between a sport's contests
+EVENT_REFRESH_INTERVAL = 30 * 60  # seconds between a contest's events
+MARKET_REFRESH_MIN_INTERVAL = 30  # seconds, for events starting soon (or started)
+MARKET_REFRESH_MAX_INTERVAL = 60 * 60  # seconds, for events far off
+MARKET_REFRESH_FRACTION = 0.02
+MARKET_REFRESH_AFTER_START = 3 * 60 * 60  # seconds until started events are dropped
+SCHEDULER_RELOAD_INTERVAL = 60  # seconds between loading new entities
 
 
 # database details
@@ -23,8 +76,37 @@ DATABASE_NAME = "arbitrage-agent"  # change this (per project)
 TEST_DATABASE_NAME = "test-database"
 DATABASE_CONNECT_STRING = f"{DATABASE_DRIVER}://{DATABASE_USER}:{DATABASE_PASS}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"  # noqa
 TEST_DATABASE_CONNECT_STRING = f"{DATABASE_DRIVER}://{DATABASE_USER}:{DATABASE_PASS}@{DATABASE_HOST}:{DATABASE_PORT}/{TEST_DATABASE_NAME}"  # noqa
+# tasks use an async engine (so queries don't block the event loop), with a
+# session per task from a pool of DATABASE_POOL_SIZE (+ DATABASE_MAX_OVERFLOW)
+ASYNC_DATABASE_DRIVER = "postgresql+asyncpg"
+ASYNC_DATABASE_CONNECT_STRING = f"{ASYNC_DATABASE_DRIVER}://{DATABASE_USER}:{DATABASE_PASS}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"  # noqa
+DATABASE_POOL_SIZE = 10
+DATABASE_MAX_OVERFLOW = 10
+# the outcome records (returns) of markets which have already been recorded are
+# inserted in bulk, once per task: with COPY (asyncpg only), or as multi-row INSERTs
+# of up to OUTCOME_RECORD_BATCH_SIZE rows
+OUTCOME_RECORD_COPY = True
+OUTCOME_RECORD_BATCH_SIZE = 1000
 
 
 # client details
 
 REQUEST_CACHE_LOCATION = ".request_cache"
+REQUEST_CACHING = False  # serve repeated requests from the cache (dev/replay)
+REQUEST_CACHE_MAX_BYTES = 256 * 1024 * 1024  # least recently used evicted past this
+REQUEST_CACHE_DEFAULT_TTL = 60 * 60  # seconds
+REQUEST_CACHE_TTLS = [  # (url path regex, seconds), first match wins
+    # contests
+    (r"(?i)/competitions$|/ClassToSubType$", 24 * 60 * 60),
+    # events
+    (r"(?i)/events$|/matches$|/Event$", 60 * 60),
+    # markets
+    (r"(?i)/markets$|/EventToOutcomeForEvent/", 60),
+]
+# record responses to cassettes, or replay them instead of using the network:
+#   "live"   - requests go to the bookmakers
+#   "record" - requests go to the bookmakers, and are recorded to CASSETTE_LOCATION
+#   "replay" - requests are served from the cassettes in CASSETTE_LOCATION
+CLIENT_MODE = "live"
+CASSETTE_LOCATION = ".cassettes"  # one cassette per worker process
+REPLAY_LATENCY_SCALE = 1.0  # multiplies recorded latencies, 0 -> no latency
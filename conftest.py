@@ -7,3 +7,8 @@ def pytest_addoption(parser):
                      action='store',
                      default=config.TEST_DATABASE_CONNECT_STRING,
                      help='url of the database to use for tests')
+    parser.addoption('--soak-tasks',
+                     action='store',
+                     type=int,
+                     default=1000,
+                     help='number of tasks soak tests run (e.g. 10000)')
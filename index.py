@@ -1,14 +1,9 @@
 import asyncio
 import logging
 
-from src.tasks import (
-    add_contests,
-    add_events,
-    add_markets,
-    get_contests,
-    get_events,
-    get_sports,
-)
+import config
+from src.orchestrator import iterate_pages, Orchestrator, Stage
+from src.tasks import add_contests, add_events, add_markets_batch, get_sports
 from src.worker.broker import broker
 
 logging.basicConfig(
@@ -20,65 +15,22 @@ logging.basicConfig(
 )
 
 
-async def do_contests():
-    task = await get_sports.kiq()
-    result = await task.wait_result()
-    sports = result.return_value
-
-    tasks = []
-
-    for sport in sports:
-        tasks.append(await add_contests.kiq(sport))
-
-    results = []
-    for task in tasks:
-        results.append(await task.wait_result())
-
-    print(results)
-
-
-async def do_events():
-    task = await get_contests.kiq()
-    result = await task.wait_result()
-    contests = result.return_value
-
-    tasks = []
-
-    for contest in contests:
-        tasks.append(await add_events.kiq(contest))
-
-    results = []
-    for task in tasks:
-        results.append(await task.wait_result())
-
-    print(results)
-
-
-async def do_markets():
-    task = await get_events.kiq()
-    result = await task.wait_result()
-    events = result.return_value
-
-    tasks = []
-
-    for event in events:
-        tasks.append(await add_markets.kiq(event))
-
-    results = []
-    for task in tasks:
-        results.append(await task.wait_result())
-
-    print(results)
-
-
 async def main():
     await broker.startup()
 
-    await do_contests()
-
-    await do_events()
-
-    await do_markets()
+    # contests, events and markets are added as soon as their parent has been
+    stages = [
+        Stage("contests", add_contests),
+        Stage("events", add_events),
+        # the markets of several events are requested at once where possible
+        Stage("markets", add_markets_batch, batchSize=config.MARKETS_PER_TASK),
+    ]
+    orchestrator = Orchestrator(stages, maxInFlight=config.MAX_TASKS_IN_FLIGHT)
+    # sports are read a page at a time, and their contests added as they arrive
+    sports = iterate_pages(get_sports, config.ENTITIES_PER_PAGE)
+    await orchestrator.run(sports, reportInterval=config.PROGRESS_REPORT_INTERVAL)
+
+    print(orchestrator.progress)
 
     await broker.shutdown()
 
@@ -0,0 +1,49 @@
+import asyncio
+import logging
+
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+import config
+from src.scheduler import RefreshPolicy, Scheduler
+from src.worker.broker import broker
+
+logging.basicConfig(
+    filename="logs/scheduler.log",
+    level=logging.getLevelName("INFO"),
+    format=(
+        "[%(asctime)s][%(name)s]" "[%(levelname)-7s][%(processName)s]" " %(message)s"
+    ),
+)
+
+
+async def main():
+    await broker.startup()
+
+    engine = sqlalchemy.create_engine(config.DATABASE_CONNECT_STRING)
+
+    # unlike index.py, keeps refreshing whatever is due until stopped
+    policy = RefreshPolicy(
+        contest_interval=config.CONTEST_REFRESH_INTERVAL,
+        event_interval=config.EVENT_REFRESH_INTERVAL,
+        market_min_interval=config.MARKET_REFRESH_MIN_INTERVAL,
+        market_max_interval=config.MARKET_REFRESH_MAX_INTERVAL,
+        market_interval_fraction=config.MARKET_REFRESH_FRACTION,
+        market_refresh_after_start=config.MARKET_REFRESH_AFTER_START,
+    )
+    scheduler = Scheduler(
+        sessionmaker(bind=engine),
+        policy,
+        maxInFlight=config.MAX_TASKS_IN_FLIGHT,
+        marketsPerTask=config.MARKETS_PER_TASK,
+        reloadInterval=config.SCHEDULER_RELOAD_INTERVAL,
+    )
+    try:
+        await scheduler.run()
+    finally:
+        engine.dispose()
+        await broker.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,10 @@
-from typing import Optional, Type
+from typing import List, Optional, Type
 
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, Session
 
+import config
 import src.database.models as models
 from src.database.enums import Status
 
@@ -15,5 +17,74 @@ def get_recorded_entities(
     stmt = select(model).where(model.status != Status.EXPIRED)
     if parent:
         stmt = stmt.where(model.parentid == parent.id)
-    models = session.scalars(stmt).all()
-    return models
+    if model is models.ReferenceMarket:
+        # the outcomes of every market are needed to record their returns
+        stmt = stmt.options(selectinload(models.ReferenceMarket.outcomes))
+    entities = session.scalars(stmt).all()
+    return entities
+
+
+def get_recorded_entities_page(
+    session: Session,
+    model: Type[models.DatabaseModel],
+    afterId: int = 0,
+    limit: Optional[int] = None,
+):
+    """
+    Get recorded entities in order of id, starting after `afterId` (keyset
+    pagination), so that large tables can be read a page at a time.
+
+    Args:
+        afterId (int): the id of the last entity of the previous page
+        limit (Optional[int]): the most entities returned. None -> all of them
+    """
+    stmt = (
+        select(model)
+        .where(model.status != Status.EXPIRED, model.id > afterId)
+        .order_by(model.id)
+        .limit(limit)
+    )
+    entities = session.scalars(stmt).all()
+    return entities
+
+
+def insert_outcome_records(session: Session, rows: List[tuple]):
+    """
+    Insert outcome records in bulk, as multi-row INSERTs of up to
+    config.OUTCOME_RECORD_BATCH_SIZE rows (SQLAlchemy's insertmanyvalues), bypassing the
+    unit of work: no ORM objects are created, and the records aren't added to the
+    `records` of their outcomes in the session.
+
+    Args:
+        rows (List[tuple]): the (outcomeid, timestamp, returns) of each record (see
+            OutcomeRecord.get_row)
+    """
+    if not rows:
+        return
+    session.execute(
+        insert(models.OutcomeRecord),
+        [dict(zip(models.OUTCOME_RECORD_COLUMNS, row)) for row in rows],
+        execution_options={
+            "insertmanyvalues_page_size": config.OUTCOME_RECORD_BATCH_SIZE
+        },
+    )
+
+
+async def copy_outcome_records(session: AsyncSession, rows: List[tuple]):
+    """
+    Insert outcome records in bulk with PostgreSQL's COPY, within the session's
+    transaction. Requires the asyncpg driver.
+
+    Args:
+        rows (List[tuple]): the (outcomeid, timestamp, returns) of each record (see
+            OutcomeRecord.get_row)
+    """
+    if not rows:
+        return
+    connection = await session.connection()
+    rawConnection = await connection.get_raw_connection()
+    await rawConnection.driver_connection.copy_records_to_table(
+        models.OutcomeRecord.__tablename__,
+        records=rows,
+        columns=models.OUTCOME_RECORD_COLUMNS,
+    )
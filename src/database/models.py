@@ -81,36 +81,43 @@ class ReferenceEntity:
 
 
 class HashMixin:
+    # the attributes which identify the entity among its parent's entities (the same
+    # as those of the scraped entity, see src/database/records.py)
+    __natural_key_fields__ = ("refnum", "refname")
+
+    @property
+    def natural_key(self) -> tuple:
+        """
+        The values of `__natural_key_fields__`, computed on first access (or set by
+        the scraped entity the entity was created from).
+        """
+        key = self.__dict__.get("_natural_key", None)
+        if key is None:
+            key = tuple(getattr(self, field) for field in self.__natural_key_fields__)
+            self._natural_key = key
+        return key
+
+    @natural_key.setter
+    def natural_key(self, key: tuple):
+        self._natural_key = key
+
+    def get_bookmaker_id(self) -> Optional[int]:
+        # the foreign key doesn't need the bookmaker to be loaded, but is only set
+        # once the entity has been flushed
+        if self.bookmaker_id is not None:
+            return self.bookmaker_id
+        return self.bookmaker.id
+
     def __eq__(self, other):
-        if hasattr(self, "starttime"):
-            return (
-                self.refnum == other.refnum
-                and self.refname == other.refname
-                and self.bookmaker.id == other.bookmaker.id
-                and self.starttime == other.starttime
-            )
-
-        else:
-            return (
-                self.refnum == other.refnum
-                and self.refname == other.refname
-                and self.bookmaker.id == other.bookmaker.id
-            )
+        return (
+            self.natural_key == other.natural_key
+            and self.get_bookmaker_id() == other.get_bookmaker_id()
+        )
 
     # just don't alter any of these attributes during runtime!!
     # you should be fine though...
     def __hash__(self):
-        if hasattr(self, "starttime"):
-            return hash(
-                (
-                    self.refnum,
-                    self.refname,
-                    self.bookmaker.id,
-                    self.starttime,
-                )
-            )
-        else:
-            return hash((self.refnum, self.refname, self.bookmaker.id))
+        return hash((*self.natural_key, self.get_bookmaker_id()))
 
 
 class SourceSport(DatabaseModel):
@@ -168,6 +175,7 @@ class ReferenceSport(DatabaseModel, ReferenceEntity):
 
 class ReferenceContest(DatabaseModel, ReferenceEntity, HashMixin):
     id: Mapped[int] = mapped_column(primary_key=True)
+    __natural_key_fields__ = ("refnum", "refname", "starttime")
 
     parentid: Mapped[int] = mapped_column(ForeignKey("ReferenceSport.id"))
     sourceid: Mapped[Optional[int]] = mapped_column(ForeignKey("SourceContest.id"))
@@ -196,6 +204,7 @@ class ReferenceContest(DatabaseModel, ReferenceEntity, HashMixin):
 
 class ReferenceEvent(DatabaseModel, ReferenceEntity, HashMixin):
     id: Mapped[int] = mapped_column(primary_key=True)
+    __natural_key_fields__ = ("refnum", "refname", "starttime")
 
     parentid: Mapped[int] = mapped_column(ForeignKey("ReferenceContest.id"))
     sourceid: Mapped[Optional[int]] = mapped_column(ForeignKey("SourceEvent.id"))
@@ -240,14 +249,30 @@ class ReferenceMarket(DatabaseModel, ReferenceEntity, HashMixin):
         self.bookmaker = parent.bookmaker
         self.parent = parent
 
-    def copy_records(self, other: ReferenceEntity):
-        if not hasattr(other, "outcomes"):
-            raise Exception(f"{other} is not of type ReferenceMarket")
-
+    def get_record_rows(self, other) -> List[tuple]:
+        """
+        Record the returns of the outcomes of `other` (a scraped MarketData with the
+        same natural key) against the matching outcomes of this market. Records are
+        returned as rows rather than ORM objects, to be inserted in bulk (see
+        src.database.core.insert_outcome_records and copy_outcome_records).
+
+        Returns:
+            List[tuple]: the (outcomeid, timestamp, returns) of the new records
+        """
+        return [
+            otherOutcome.create_record_row(outcome)
+            for outcome, otherOutcome in self.match_outcomes(other)
+        ]
+
+    def match_outcomes(self, other):
+        """
+        Pair the outcomes of this market with the matching outcomes of `other`.
+        """
+        otherOutcomes = {outcome.natural_key: outcome for outcome in other.outcomes}
         for outcome in self.outcomes:
-            for otherOutcome in other.outcomes:
-                if outcome == otherOutcome:
-                    outcome.records.extend(otherOutcome.records)
+            otherOutcome = otherOutcomes.get(outcome.natural_key, None)
+            if otherOutcome is not None:
+                yield outcome, otherOutcome
 
 
 class ReferenceOutcome(DatabaseModel, ReferenceEntity, HashMixin):
@@ -281,4 +306,24 @@ class OutcomeRecord(DatabaseModel):
     def __init__(self, outcome, timestamp, returns):
         self.refoutcome = outcome
         self.timestamp = timestamp
-        self.returns = returns
+        self.returns = to_decimal(returns)
+
+    @staticmethod
+    def get_row(outcome, timestamp, returns) -> tuple:
+        """
+        The values of a record which is inserted in bulk rather than added to the
+        session, in the order of OUTCOME_RECORD_COLUMNS.
+        """
+        return (outcome.id, timestamp, to_decimal(returns))
+
+
+# the columns of the rows inserted in bulk (see OutcomeRecord.get_row)
+OUTCOME_RECORD_COLUMNS = ("outcomeid", "timestamp", "returns")
+
+
+def to_decimal(returns) -> Decimal:
+    # by way of str (the shortest repr of floats), as drivers which bind floats
+    # exactly (asyncpg) would otherwise store their binary expansion (1.8999999...)
+    if isinstance(returns, Decimal):
+        return returns
+    return Decimal(str(returns))
@@ -0,0 +1,131 @@
+import datetime
+from typing import NamedTuple, Optional, Tuple, Union
+
+from src.database.models import (
+    OutcomeRecord,
+    ReferenceContest,
+    ReferenceEvent,
+    ReferenceMarket,
+    ReferenceOutcome,
+    ReferenceSport,
+)
+
+
+# Scraped entities, as returned by the APIs. These are plain (immutable) tuples;
+# ORM objects are only created (with `create`) for entities which haven't already
+# been recorded. Each has the same natural key as the entity it corresponds to
+# (see HashMixin.natural_key).
+
+
+class KeyedData:
+    """
+    Base of the scraped entity tuples, whose last field is their natural key: the
+    values of `__natural_key_fields__`, computed once when the tuple is constructed
+    (or replaced), rather than on every lookup.
+    """
+
+    __slots__ = ()
+    __natural_key_fields__ = ("refnum", "refname")
+
+    def __new__(cls, *args, **kwargs):
+        data = super().__new__(cls, *args, **kwargs)
+        key = tuple(getattr(data, field) for field in cls.__natural_key_fields__)
+        return tuple.__new__(cls, (*data[:-1], key))
+
+    @classmethod
+    def _make(cls, iterable):
+        # used by _replace, which would otherwise keep the previous key
+        return cls(*list(iterable)[:-1])
+
+
+class _ContestFields(NamedTuple):
+    refnum: Optional[str]
+    refname: Optional[str]
+    starttime: Optional[datetime.datetime] = None
+    natural_key: tuple = ()
+
+
+class ContestData(KeyedData, _ContestFields):
+    __slots__ = ()
+    __natural_key_fields__ = ("refnum", "refname", "starttime")
+
+    def create(self, referenceSport: ReferenceSport) -> ReferenceContest:
+        referenceContest = ReferenceContest(
+            referenceSport,
+            refnum=self.refnum,
+            refname=self.refname,
+            starttime=self.starttime,
+        )
+        referenceContest.natural_key = self.natural_key
+        return referenceContest
+
+
+class _EventFields(NamedTuple):
+    refnum: Optional[str]
+    refname: Optional[str]
+    starttime: Optional[datetime.datetime] = None
+    natural_key: tuple = ()
+
+
+class EventData(KeyedData, _EventFields):
+    __slots__ = ()
+    __natural_key_fields__ = ("refnum", "refname", "starttime")
+
+    def create(self, referenceContest: ReferenceContest) -> ReferenceEvent:
+        referenceEvent = ReferenceEvent(
+            referenceContest,
+            refnum=self.refnum,
+            refname=self.refname,
+            starttime=self.starttime,
+        )
+        referenceEvent.natural_key = self.natural_key
+        return referenceEvent
+
+
+class _OutcomeFields(NamedTuple):
+    refname: Optional[str]
+    returns: float
+    timestamp: datetime.datetime
+    refnum: Optional[str] = None
+    natural_key: tuple = ()
+
+
+class OutcomeData(KeyedData, _OutcomeFields):
+    __slots__ = ()
+
+    def create(self, referenceMarket: ReferenceMarket) -> ReferenceOutcome:
+        referenceOutcome = ReferenceOutcome(
+            referenceMarket, refnum=self.refnum, refname=self.refname
+        )
+        referenceOutcome.natural_key = self.natural_key
+        self.create_record(referenceOutcome)
+        return referenceOutcome
+
+    def create_record(self, referenceOutcome: ReferenceOutcome) -> OutcomeRecord:
+        return OutcomeRecord(referenceOutcome, self.timestamp, self.returns)
+
+    def create_record_row(self, referenceOutcome: ReferenceOutcome) -> tuple:
+        return OutcomeRecord.get_row(referenceOutcome, self.timestamp, self.returns)
+
+
+class _MarketFields(NamedTuple):
+    refnum: Optional[str]
+    refname: Optional[str]
+    outcomes: Tuple[OutcomeData, ...] = ()
+    natural_key: tuple = ()
+
+
+class MarketData(KeyedData, _MarketFields):
+    __slots__ = ()
+
+    def create(self, referenceEvent: ReferenceEvent) -> ReferenceMarket:
+        referenceMarket = ReferenceMarket(
+            referenceEvent, refnum=self.refnum, refname=self.refname
+        )
+        referenceMarket.natural_key = self.natural_key
+        for outcome in self.outcomes:
+            outcome.create(referenceMarket)
+        return referenceMarket
+
+
+EntityData = Union[ContestData, EventData, MarketData]
@@ -1,23 +1,91 @@
+from collections import defaultdict
+from typing import Dict, List, Type
+
 from sqlalchemy import select
-from sqlalchemy.ext.serializer import dumps, loads
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import selectinload, Session
 
 import src.database.models as models
 
 
+def get_model_classes() -> Dict[str, Type[models.DatabaseModel]]:
+    return {
+        mapper.class_.__name__: mapper.class_
+        for mapper in models.DatabaseModel.registry.mappers
+    }
+
+
 def serialize_model(model: models.DatabaseModel) -> str:
+    """
+    Serialize a model as its class name and id (e.g. "ReferenceEvent:42"), for
+    passing to tasks.
+    """
     modelClass = model.__class__
     if not hasattr(modelClass, "id"):
         raise ValueError(
             f"{modelClass} has no id attribute, and so cannot be serialized!"
         )
-    query = select(modelClass).where(modelClass.id == model.id)
-    encodedquery = dumps(query).hex()
-    return encodedquery
+    return serialize_id(modelClass, model.id)
+
+
+def serialize_id(modelClass: Type[models.DatabaseModel], modelId: int) -> str:
+    """
+    Serialize a model from its class and id, without loading it.
+    """
+    return f"{modelClass.__name__}:{modelId}"
+
+
+def get_serialized_id(serialized_model: str) -> int:
+    return int(serialized_model.rsplit(":", 1)[1])
+
+
+def get_parents_loader(modelClass: Type[models.DatabaseModel]):
+    """
+    Get the loader option which eagerly loads the chain of parents of a model class
+    (e.g. the contest and sport of an event), or None if it has no parent.
+    """
+    loader = None
+    while hasattr(modelClass, "parent"):
+        parent = modelClass.parent
+        if loader is None:
+            loader = selectinload(parent)
+        else:
+            loader = loader.selectinload(parent)
+        modelClass = parent.property.mapper.class_
+    return loader
+
+
+def deserialize_models(serialized_models: List[str], session: Session) -> list:
+    """
+    Deserialize several models, with one query per model class. Their parents are
+    loaded too, as they can't be lazy loaded once the models are used outside of
+    the session (e.g. by an API, outside of an AsyncSession's run_sync).
+
+    Returns:
+        list: the models, in the same order as they were given
+    """
+    modelClasses = get_model_classes()
+    ids = defaultdict(set)
+    for serialized_model in serialized_models:
+        className, modelId = serialized_model.split(":", 1)
+        if className not in modelClasses:
+            raise ValueError(f"{className} is not a model, and cannot be deserialized!")
+        ids[className].add(int(modelId))
+
+    loaded = dict()
+    for className, classIds in ids.items():
+        modelClass = modelClasses[className]
+        stmt = select(modelClass).where(modelClass.id.in_(classIds))
+        loader = get_parents_loader(modelClass)
+        if loader is not None:
+            stmt = stmt.options(loader)
+        for model in session.scalars(stmt):
+            loaded[f"{className}:{model.id}"] = model
+
+    missing = [model for model in serialized_models if model not in loaded]
+    if missing:
+        raise ValueError(f"{', '.join(missing)} could not be found!")
+    return [loaded[serialized_model] for serialized_model in serialized_models]
 
 
 def deserialize_model(serialized_model: str, session: Session):
-    statement = bytes.fromhex(serialized_model)
-    statement = loads(statement, metadata=models.DatabaseModel.metadata)
-    model = session.scalars(statement).all()[0]
-    return model
+    return deserialize_models([serialized_model], session)[0]
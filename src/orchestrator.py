@@ -0,0 +1,173 @@
+import asyncio
+import collections
+import logging
+import timeit
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterable, List, Optional, Union
+
+from taskiq import AsyncTaskiqDecoratedTask
+
+from src.database.utils import get_serialized_id
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    name: str
+    # returns the inputs of the next stage (e.g. add_contests returns contests)
+    task: AsyncTaskiqDecoratedTask
+    # None -> one input per task, otherwise lists of up to batchSize inputs
+    batchSize: Optional[int] = None
+
+
+async def iterate_pages(
+    task: AsyncTaskiqDecoratedTask, pageSize: int, **kwargs
+) -> AsyncIterator[List[str]]:
+    """
+    Get the serialized entities of a paginated task (e.g. get_events) a page at a
+    time, each page starting after the last entity of the previous one.
+
+    Args:
+        task (AsyncTaskiqDecoratedTask): a task taking `afterId` and `limit`
+        pageSize (int): the most entities per page
+        kwargs: passed to the task
+    """
+    afterId = 0
+    while True:
+        pageTask = await task.kiq(afterId=afterId, limit=pageSize, **kwargs)
+        result = await pageTask.wait_result()
+        result.raise_for_error()
+        page = result.return_value
+        if page:
+            yield page
+        if len(page) < pageSize:
+            return
+        afterId = get_serialized_id(page[-1])
+
+
+class Progress:
+    """
+    The number of tasks of each stage submitted, running, completed and failed.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = [stage.name for stage in stages]
+        self.submitted = collections.Counter()
+        self.running = collections.Counter()
+        self.completed = collections.Counter()
+        self.failed = collections.Counter()
+        self.startTime = timeit.default_timer()
+
+    def __str__(self):
+        elapsed = timeit.default_timer() - self.startTime
+        return f"[{elapsed:.0f}s] " + ", ".join(
+            f"{name}: {self.completed[name]}/{self.submitted[name]} done"
+            f" ({self.running[name]} running, {self.failed[name]} failed)"
+            for name in self.stages
+        )
+
+
+class Orchestrator:
+    """
+    Runs a chain of task stages, where the result of each task is the inputs of the
+    next stage. Each task's results are submitted as soon as it completes, rather
+    than once every task of its stage has, so a slow task only holds up its own
+    descendants.
+
+    At most `maxInFlight` tasks are awaited at once. Tasks that fail are logged,
+    and their descendants skipped.
+    """
+
+    def __init__(self, stages: List[Stage], maxInFlight: int = 50):
+        """
+        Args:
+            stages (List[Stage]): the stages, in order
+            maxInFlight (int): the most tasks submitted to the broker at once
+        """
+        self.stages = stages
+        self.maxInFlight = maxInFlight
+        self.slots = asyncio.Semaphore(maxInFlight)
+        self.progress = Progress(stages)
+        self._pending = set()
+
+    async def run(
+        self,
+        inputs: Union[Iterable[Any], AsyncIterator[List[Any]]],
+        reportInterval: Optional[float] = None,
+    ):
+        """
+        Run every stage, starting from the inputs of the first.
+
+        Args:
+            inputs (Union[Iterable[Any], AsyncIterator[List[Any]]]): the inputs of
+                the first stage, or pages of them (e.g. from iterate_pages). Pages
+                are submitted as they arrive, and only read while fewer than
+                `maxInFlight` tasks are waiting
+            reportInterval (Optional[float]): the seconds between progress reports.
+                None -> only reported once finished
+        """
+        reporter = None
+        if reportInterval is not None:
+            reporter = asyncio.create_task(self._report(reportInterval))
+        try:
+            if hasattr(inputs, "__aiter__"):
+                async for page in inputs:
+                    self.submit(0, page)
+                    while len(self._pending) >= self.maxInFlight:
+                        await asyncio.wait(
+                            set(self._pending), return_when=asyncio.FIRST_COMPLETED
+                        )
+            else:
+                self.submit(0, inputs)
+            while self._pending:
+                await asyncio.wait(set(self._pending))
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+        logger.info("Finished. %s", self.progress)
+
+    def submit(self, stageIndex: int, inputs: Iterable[Any]):
+        if stageIndex >= len(self.stages):
+            return
+        stage = self.stages[stageIndex]
+        inputs = list(inputs)
+        if stage.batchSize is not None:
+            inputs = [
+                inputs[i : i + stage.batchSize]
+                for i in range(0, len(inputs), stage.batchSize)
+            ]
+        for taskInput in inputs:
+            self.progress.submitted[stage.name] += 1
+            task = asyncio.create_task(self._run(stageIndex, taskInput))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _run(self, stageIndex: int, taskInput: Any):
+        stage = self.stages[stageIndex]
+        async with self.slots:
+            self.progress.running[stage.name] += 1
+            try:
+                task = await stage.task.kiq(taskInput)
+                result = await task.wait_result()
+            except Exception:
+                logger.exception("Failed to run %s task.", stage.name)
+                self.progress.failed[stage.name] += 1
+                return
+            finally:
+                self.progress.running[stage.name] -= 1
+
+        if result.is_err:
+            logger.error("%s task failed: %s", stage.name, result.error)
+            self.progress.failed[stage.name] += 1
+            return
+
+        self.progress.completed[stage.name] += 1
+        # the next stage starts on these results straight away
+        self.submit(stageIndex + 1, result.return_value or [])
+
+    async def _report(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            logger.info("%s", self.progress)
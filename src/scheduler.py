@@ -0,0 +1,338 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from taskiq import AsyncTaskiqDecoratedTask
+
+from src.database.enums import Status
+from src.database.models import (
+    Bookmaker,
+    ReferenceContest,
+    ReferenceEvent,
+    ReferenceSport,
+)
+from src.database.utils import serialize_id
+from src.tasks import add_contests, add_events, add_markets_batch, uses_inline_markets
+from src.web.api.utils import get_bookmaker_api
+
+logger = logging.getLogger(__name__)
+
+# what is refreshed: the contests of a sport, the events of a contest, or the
+# markets of an event
+CONTESTS = "contests"
+EVENTS = "events"
+MARKETS = "markets"
+
+
+@dataclass
+class RefreshPolicy:
+    contest_interval: float = 6 * 60 * 60  # seconds between a sport's contests
+    event_interval: float = 30 * 60  # seconds between a contest's events
+    market_min_interval: float = 30.0  # seconds, for events starting soon
+    market_max_interval: float = 60 * 60.0  # seconds, for events far off
+    market_interval_fraction: float = 0.02  # of the time until the event starts
+    # seconds after an event starts that its markets stop being refreshed
+    market_refresh_after_start: float = 3 * 60 * 60
+
+    def get_market_interval(
+        self, starttime: Optional[datetime.datetime], now: float
+    ) -> Optional[float]:
+        """
+        Get the interval between refreshes of an event's markets, which shrinks as
+        the event approaches (to the minimum once it has started).
+
+        Returns:
+            Optional[float]: the interval, or None if the event finished long enough
+                ago that its markets needn't be refreshed
+        """
+        if starttime is None:
+            return self.market_max_interval
+        untilStart = starttime.timestamp() - now
+        if untilStart < -self.market_refresh_after_start:
+            return None
+        interval = untilStart * self.market_interval_fraction
+        return min(max(interval, self.market_min_interval), self.market_max_interval)
+
+
+@dataclass
+class ScheduledEntity:
+    kind: str
+    model: str  # serialized
+    bookmakerId: int
+    lastChecked: Optional[datetime.datetime]
+    # events: the start time, contests: the start time of the soonest event
+    starttime: Optional[datetime.datetime] = None
+    # contests: whether their events' markets are retrieved with the events
+    inlineMarkets: bool = False
+
+
+class Scheduler:
+    """
+    Keeps refreshing the contests, events and markets in the database, each when it
+    is next due. Markets are refreshed more often as their event approaches, and
+    contests and events are discovered on slower cadences.
+
+    Due times are kept in a heap, and derived from `lastChecked` when an entity is
+    first seen. Entities are reloaded from the database every `reloadInterval`
+    seconds, to pick up new (and drop expired) entities. At most `maxInFlight` tasks
+    are awaited at once; due entities wait until there is room.
+    """
+
+    def __init__(
+        self,
+        sessionFactory: Callable[[], Session],
+        policy: Optional[RefreshPolicy] = None,
+        maxInFlight: int = 50,
+        marketsPerTask: int = 100,
+        reloadInterval: float = 60.0,
+        tasks: Optional[Dict[str, AsyncTaskiqDecoratedTask]] = None,
+    ):
+        """
+        Args:
+            sessionFactory (Callable[[], Session]): makes the session each load of
+                entities uses (e.g. a sessionmaker)
+            policy (Optional[RefreshPolicy]): how often entities are refreshed
+            maxInFlight (int): the most tasks awaited at once
+            marketsPerTask (int): the most events per add_markets_batch task
+            reloadInterval (float): the seconds between reloading entities
+            tasks (Optional[Dict[str, AsyncTaskiqDecoratedTask]]): the task run for
+                each kind of refresh (defaults to add_contests, add_events and
+                add_markets_batch)
+        """
+        self.sessionFactory = sessionFactory
+        self.policy = policy or RefreshPolicy()
+        self.maxInFlight = maxInFlight
+        self.marketsPerTask = marketsPerTask
+        self.reloadInterval = reloadInterval
+        self.tasks = tasks or {
+            CONTESTS: add_contests,
+            EVENTS: add_events,
+            MARKETS: add_markets_batch,
+        }
+
+        self.entities: Dict[Hashable, ScheduledEntity] = dict()
+        # (due time, sequence, key), entries are stale if the key is due at
+        # another time (or no longer scheduled)
+        self._queue: List[Tuple[float, int, Hashable]] = []
+        self._due: Dict[Hashable, float] = dict()
+        self._sequence = itertools.count()
+        self._inFlight = set()
+        self._running = set()
+        self._wake = asyncio.Event()
+
+    def load(self, now: Optional[float] = None):
+        """
+        Load the entities to be refreshed from the database, scheduling any which
+        weren't already (when they were last checked plus their interval).
+        """
+        now = time.time() if now is None else now
+        self.merge(self.query(now), now)
+
+    def query(self, now: float) -> Dict[Hashable, ScheduledEntity]:
+        """
+        Query the entities to be refreshed. Only the database is touched (not the
+        schedule), so this can run in a thread while tasks are being rescheduled.
+        """
+        # a session per load, so nothing is held on to between loads
+        with self.sessionFactory() as session:
+            return self._load_entities(session, now)
+
+    def merge(self, entities: Dict[Hashable, ScheduledEntity], now: float):
+        """
+        Replace the entities to be refreshed, scheduling any which weren't already.
+        Entities which are scheduled (or being refreshed) keep their due time, as
+        their `lastChecked` may have been loaded before they were last refreshed.
+        """
+        # drop entities which have expired (or finished)
+        for key in self.entities.keys() - entities.keys():
+            self._due.pop(key, None)
+        for key, entity in entities.items():
+            if key not in self._due and key not in self._inFlight:
+                if entity.lastChecked is None:
+                    self.schedule(key, now)
+                else:
+                    lastTime = entity.lastChecked.timestamp()
+                    self.schedule(key, lastTime + self.get_interval(entity, now))
+        self.entities = entities
+
+        logger.info("Loaded %d entities to refresh.", len(entities))
+
+    def _load_entities(
+        self, session: Session, now: float
+    ) -> Dict[Hashable, ScheduledEntity]:
+        entities = dict()
+
+        for sport in self._get_rows(session, ReferenceSport):
+            entities[(CONTESTS, sport.id)] = ScheduledEntity(
+                CONTESTS,
+                serialize_id(ReferenceSport, sport.id),
+                sport.bookmaker_id,
+                sport.lastChecked,
+            )
+
+        contests = dict()
+        for contest in self._get_rows(session, ReferenceContest):
+            inlineMarkets = uses_inline_markets(get_bookmaker_api(contest.name))
+            contests[contest.id] = entities[(EVENTS, contest.id)] = ScheduledEntity(
+                EVENTS,
+                serialize_id(ReferenceContest, contest.id),
+                contest.bookmaker_id,
+                contest.lastChecked,
+                inlineMarkets=inlineMarkets,
+            )
+
+        eventColumns = [ReferenceEvent.parentid, ReferenceEvent.starttime]
+        for event in self._get_rows(session, ReferenceEvent, *eventColumns):
+            contest = contests.get(event.parentid, None)
+            if contest is None:
+                continue
+            if self.policy.get_market_interval(event.starttime, now) is None:
+                continue
+            if contest.inlineMarkets:
+                # markets are refreshed with the contest's events, as often as
+                # those of its soonest event
+                if event.starttime is not None and (
+                    contest.starttime is None or event.starttime < contest.starttime
+                ):
+                    contest.starttime = event.starttime
+                continue
+            entities[(MARKETS, event.id)] = ScheduledEntity(
+                MARKETS,
+                serialize_id(ReferenceEvent, event.id),
+                event.bookmaker_id,
+                event.lastChecked,
+                starttime=event.starttime,
+            )
+
+        return entities
+
+    def _get_rows(self, session: Session, model, *columns) -> list:
+        """
+        Get only the columns the scheduler uses (the id, bookmaker, bookmaker name,
+        when it was last checked, and `columns`) of the entities which haven't
+        expired, rather than whole entities.
+        """
+        stmt = (
+            select(
+                model.id,
+                model.bookmaker_id,
+                model.lastChecked,
+                Bookmaker.name,
+                *columns,
+            )
+            .join(model.bookmaker)
+            .where(model.status != Status.EXPIRED)
+        )
+        return session.execute(stmt).all()
+
+    def get_interval(self, entity: ScheduledEntity, now: float) -> float:
+        if entity.kind == CONTESTS:
+            return self.policy.contest_interval
+        if entity.kind == EVENTS:
+            if not entity.inlineMarkets:
+                return self.policy.event_interval
+            marketInterval = self.policy.get_market_interval(entity.starttime, now)
+            return min(self.policy.event_interval, marketInterval or float("inf"))
+        marketInterval = self.policy.get_market_interval(entity.starttime, now)
+        return marketInterval or self.policy.market_max_interval
+
+    def schedule(self, key: Hashable, due: float):
+        self._due[key] = due
+        heapq.heappush(self._queue, (due, next(self._sequence), key))
+
+    def next_due(self) -> Optional[float]:
+        while self._queue:
+            due, _, key = self._queue[0]
+            if self._due.get(key, None) == due:
+                return due
+            heapq.heappop(self._queue)
+        return None
+
+    def pop_due(self, now: float) -> Optional[Hashable]:
+        due = self.next_due()
+        if due is None or due > now:
+            return None
+        _, _, key = heapq.heappop(self._queue)
+        del self._due[key]
+        return key
+
+    def dispatch_due(self, now: Optional[float] = None):
+        """
+        Submit the tasks of every due entity, earliest first, while there is room.
+        Due markets are batched by bookmaker.
+        """
+        now = time.time() if now is None else now
+        markets = defaultdict(list)
+        while len(self._running) + len(markets) < self.maxInFlight:
+            key = self.pop_due(now)
+            if key is None:
+                break
+            entity = self.entities[key]
+            if entity.kind != MARKETS:
+                self.submit(entity.kind, [key])
+                continue
+            batch = markets[entity.bookmakerId]
+            batch.append(key)
+            if len(batch) == self.marketsPerTask:
+                self.submit(MARKETS, markets.pop(entity.bookmakerId))
+        for batch in markets.values():
+            self.submit(MARKETS, batch)
+
+    def submit(self, kind: str, keys: List[Hashable]):
+        self._inFlight.update(keys)
+        task = asyncio.create_task(self._run(kind, keys))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, kind: str, keys: List[Hashable]):
+        models = [self.entities[key].model for key in keys]
+        try:
+            task = await self.tasks[kind].kiq(models if kind == MARKETS else models[0])
+            result = await task.wait_result()
+            if result.is_err:
+                logger.error("%s task failed: %s", kind, result.error)
+        except Exception:
+            logger.exception("Failed to run %s task.", kind)
+        finally:
+            # the next refresh is due an interval after this one, even if it failed
+            now = time.time()
+            for key in keys:
+                self._inFlight.discard(key)
+                entity = self.entities.get(key, None)
+                if entity is not None:
+                    self.schedule(key, now + self.get_interval(entity, now))
+            self._wake.set()
+
+    async def run(self):
+        """
+        Refresh entities as they are due, indefinitely.
+        """
+        nextReload = time.time()
+        while True:
+            now = time.time()
+            if now >= nextReload:
+                # only the query runs in a thread: the schedule is only changed on
+                # the event loop (where tasks are rescheduled as they finish)
+                entities = await asyncio.to_thread(self.query, now)
+                self.merge(entities, now)
+                nextReload = now + self.reloadInterval
+            self.dispatch_due(now)
+
+            # wait until the next entity is due, a task finishes or it's time to
+            # reload (whichever is first)
+            wakeTime = min(nextReload, self.next_due() or nextReload)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(
+                    self._wake.wait(), max(wakeTime - time.time(), 0)
+                )
+            except asyncio.TimeoutError:
+                pass
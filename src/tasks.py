@@ -1,12 +1,22 @@
+import asyncio
 import datetime
+from collections import defaultdict
 from logging import getLogger
-from typing import Type
+from typing import List, Optional, Tuple, Type
 
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.serializer import dumps, loads
+from sqlalchemy.orm import Session
 from taskiq import Context, TaskiqDepends
 
-from src.database.core import get_recorded_entities
+import config
+from src.database.core import (
+    copy_outcome_records,
+    get_recorded_entities,
+    get_recorded_entities_page,
+    insert_outcome_records,
+)
 
 from src.database.models import (
     Bookmaker,
@@ -18,7 +28,8 @@ from src.database.models import (
     ReferenceOutcome,
     ReferenceSport,
 )
-from src.database.utils import deserialize_model, serialize_model
+from src.database.records import EntityData
+from src.database.utils import deserialize_model, deserialize_models, serialize_model
 from src.web.api.utils import get_bookmaker_api
 from src.web.enums import WebRequestStatus
 from src.worker import dependencies
@@ -29,73 +40,130 @@ logger = getLogger(__name__)
 
 
 @broker.task
-async def get_bookmakers(context: Context = TaskiqDepends()):
-    session = dependencies.get_session(context)
-
+async def get_bookmakers(
+    session: AsyncSession = TaskiqDepends(dependencies.get_session),
+):
     stmt = select(Bookmaker)
-    bookmakers = session.scalars(stmt).all()
+    bookmakers = (await session.scalars(stmt)).all()
     return bookmakers
 
 
 @broker.task
-async def get_sports(context: Context = TaskiqDepends()):
-    return await get_entities(ReferenceSport, context)
+async def get_sports(
+    afterId: int = 0,
+    limit: Optional[int] = None,
+    session: AsyncSession = TaskiqDepends(dependencies.get_session),
+):
+    return await get_entities(session, ReferenceSport, afterId, limit)
 
 
 @broker.task
-async def get_contests(context: Context = TaskiqDepends()):
-    return await get_entities(ReferenceContest, context)
+async def get_contests(
+    afterId: int = 0,
+    limit: Optional[int] = None,
+    session: AsyncSession = TaskiqDepends(dependencies.get_session),
+):
+    return await get_entities(session, ReferenceContest, afterId, limit)
 
 
 @broker.task
-async def get_events(context: Context = TaskiqDepends()):
-    return await get_entities(ReferenceEvent, context)
+async def get_events(
+    afterId: int = 0,
+    limit: Optional[int] = None,
+    session: AsyncSession = TaskiqDepends(dependencies.get_session),
+):
+    return await get_entities(session, ReferenceEvent, afterId, limit)
 
 
 async def get_entities(
-    modelType: Type[ReferenceEntity], context: Context = TaskiqDepends()
-):
-    session = dependencies.get_session(context)
-
-    entities = get_recorded_entities(session, modelType)
+    session: AsyncSession,
+    modelType: Type[ReferenceEntity],
+    afterId: int = 0,
+    limit: Optional[int] = None,
+) -> List[str]:
+    """
+    Get a page of serialized entities, in order of id.
+
+    Args:
+        afterId (int): the id of the last entity of the previous page
+        limit (Optional[int]): the most entities returned (a shorter page is the
+            last). None -> all of them
+
+    Returns:
+        List[str]: the serialized entities
+    """
+    entities = await session.run_sync(
+        get_recorded_entities_page, modelType, afterId, limit
+    )
 
     return [serialize_model(entity) for entity in entities]
 
 
 @broker.task
-async def add_contests(model: str, context: Context = TaskiqDepends()):
-    return await add_entities(model, ReferenceContest, context)
+async def add_contests(
+    model: str,
+    session: AsyncSession = TaskiqDepends(dependencies.get_session),
+    context: Context = TaskiqDepends(),
+):
+    return await add_entities(model, ReferenceContest, session, context)
 
 
 @broker.task
-async def add_events(model: str, context: Context = TaskiqDepends()):
-    return await add_entities(model, ReferenceEvent, context)
+async def add_events(
+    model: str,
+    session: AsyncSession = TaskiqDepends(dependencies.get_session),
+    context: Context = TaskiqDepends(),
+):
+    return await add_entities(model, ReferenceEvent, session, context)
 
 
 @broker.task
-async def add_markets(model: str, context: Context = TaskiqDepends()):
-    return await add_entities(model, ReferenceMarket, context)
+async def add_markets(
+    model: str,
+    session: AsyncSession = TaskiqDepends(dependencies.get_session),
+    context: Context = TaskiqDepends(),
+):
+    return await add_entities(model, ReferenceMarket, session, context)
 
 
 async def add_entities(
     referenceParentModel: str,
     modelType: Type[ReferenceEntity],
+    session: AsyncSession,
     context: Context = TaskiqDepends(),
-):
+) -> List[str]:
+    """
+    Add the entities of type `modelType` retrieved for a parent.
+
+    Returns:
+        List[str]: the serialized entities found for the parent, for their own
+            entities to be added next (empty for markets, and for events whose
+            markets were retrieved with them)
+    """
     # get dependencies
-    session = dependencies.get_session(context)
     client = dependencies.get_client(context)
 
     # deserialize arguments
-    referenceParent = deserialize_model(referenceParentModel, session)
+    referenceParent = await session.run_sync(
+        lambda syncSession: deserialize_model(referenceParentModel, syncSession)
+    )
+    # release the connection while the requests are made
+    await session.commit()
 
     # construct api
     apiModel = get_bookmaker_api(referenceParent.bookmaker.name)
     api = apiModel(client)
 
+    # markets retrieved along with events, by event refnum
+    novelMarkets = None
+
     # retrieve novel entities (may be new or old)
     if modelType is ReferenceContest:
         status, novelEntities = await api.retrieve_contests(referenceParent)
+    elif modelType is ReferenceEvent and uses_inline_markets(api):
+        status, novelEntities, novelMarkets = await api.retrieve_events_with_markets(
+            referenceParent
+        )
     elif modelType is ReferenceEvent:
         status, novelEntities = await api.retrieve_events(referenceParent)
     elif modelType is ReferenceMarket:
@@ -104,46 +172,256 @@ async def add_entities(
     # timestamp when the request was made
     timestamp = datetime.datetime.now(datetime.timezone.utc)
 
-    if status is not WebRequestStatus.SUCCESS:
-        referenceParent.not_found(timestamp)
-        session.commit()
-        return
+    # the records of recorded markets, inserted at once
+    outcomeRecords = []
+
+    await session.run_sync(
+        record_entities,
+        referenceParent,
+        modelType,
+        status,
+        novelEntities,
+        timestamp,
+        outcomeRecords,
+    )
+
+    if novelMarkets:
+        await record_inline_markets(
+            session, api, referenceParent, novelMarkets, timestamp, outcomeRecords
+        )
+
+    await add_outcome_records(session, outcomeRecords)
+    await session.commit()
+    # only now are the same responses taken as unchanged
+    api.commit_validators()
+
+    # markets have no children, and the markets of these events have been recorded
+    if modelType is ReferenceMarket or novelMarkets is not None:
+        return []
+
+    if status not in (WebRequestStatus.SUCCESS, WebRequestStatus.UNCHANGED):
+        return []
+
+    # the children of the entities (e.g. events of contests) are added next
+    entities = await session.run_sync(get_recorded_entities, modelType, referenceParent)
+    return [serialize_model(entity) for entity in entities]
 
-    referenceParent.found(timestamp)
 
-    # get recorded entities which are of type modelType and have
-    # the given referenceParent as a parent
-    recordedEntities = get_recorded_entities(session, modelType, parent=referenceParent)
+@broker.task
+async def add_markets_batch(
+    models: List[str],
+    session: AsyncSession = TaskiqDepends(dependencies.get_session),
+    context: Context = TaskiqDepends(),
+):
+    """
+    Add the markets of several events, requesting the markets of as many events of
+    the same bookmaker at once as its API allows.
+    """
+    # get dependencies
+    client = dependencies.get_client(context)
 
-    # add new outcome records for recorded markets
-    if modelType is ReferenceMarket:
-        for novelMarket in novelEntities:
-            for recordedMarket in recordedEntities:
-                if novelMarket == recordedMarket:
-                    recordedMarket.copy_records(novelMarket)
+    # deserialize arguments (at once), grouping events by bookmaker
+    referenceEvents = defaultdict(list)
+    for referenceEvent in await session.run_sync(
+        lambda syncSession: deserialize_models(models, syncSession)
+    ):
+        referenceEvents[referenceEvent.bookmaker.name].append(referenceEvent)
+    # release the connection while the requests are made
+    await session.commit()
+
+    # each bookmaker's markets are requested concurrently
+    results = await asyncio.gather(
+        *[
+            retrieve_bookmaker_markets(client, bookmakerName, events)
+            for bookmakerName, events in referenceEvents.items()
+        ]
+    )
+    # the records of every recorded market of the task, inserted at once
+    outcomeRecords = []
+    for events, (bookmakerResults, timestamp) in zip(referenceEvents.values(), results):
+        await session.run_sync(
+            record_markets, events, bookmakerResults, timestamp, outcomeRecords
+        )
+    await add_outcome_records(session, outcomeRecords)
+    await session.commit()
 
-    # entities that were found but have not already been recorded
-    newEntities = set(novelEntities) - set(recordedEntities)
+    return
 
-    # entities that have been recorded but not found
-    expiredEntities = set(recordedEntities) - set(novelEntities)
 
-    # entities that have both been recorded and found again
-    unexpiredEntities = set(recordedEntities) - expiredEntities
+async def retrieve_bookmaker_markets(
+    client,
+    bookmakerName: str,
+    referenceEvents: List[ReferenceEvent],
+) -> Tuple[list, datetime.datetime]:
+    """
+    Returns:
+        Tuple[list, datetime.datetime]: the status and markets retrieved for each
+            event, and when they were requested. If they couldn't be retrieved, the
+            status of each event is WebRequestStatus.FAILED (so the markets of the
+            task's other bookmakers are still recorded)
+    """
+    try:
+        # construct api
+        apiModel = get_bookmaker_api(bookmakerName)
+        api = apiModel(client)
+
+        # retrieve novel markets (may be new or old)
+        results = await api.retrieve_markets_batch(referenceEvents)
+    except Exception:
+        logger.exception("Failed to retrieve the markets of %s events.", bookmakerName)
+        results = [(WebRequestStatus.FAILED, []) for _ in referenceEvents]
+
+    # timestamp when the requests were made
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
 
-    # entities were not found
-    for entity in expiredEntities:
-        entity.not_found(timestamp)
+    return results, timestamp
 
-    # entities were found
-    for entity in unexpiredEntities:
-        entity.found(timestamp)
 
-    # record new entities
-    for entity in newEntities:
-        entity.added()
+def record_markets(
+    session: Session,
+    referenceEvents: List[ReferenceEvent],
+    results: list,
+    timestamp: datetime.datetime,
+    outcomeRecords: Optional[list] = None,
+):
+    for referenceEvent, (status, novelMarkets) in zip(referenceEvents, results):
+        record_entities(
+            session,
+            referenceEvent,
+            ReferenceMarket,
+            status,
+            novelMarkets,
+            timestamp,
+            outcomeRecords,
+        )
+
+
+async def add_outcome_records(session: AsyncSession, outcomeRecords: List[tuple]):
+    """
+    Insert the outcome records collected by a task in bulk, within the session's
+    transaction: with COPY if enabled (and the driver is asyncpg), and as
+    multi-row INSERTs otherwise.
+    """
+    if not outcomeRecords:
+        return
+    if config.OUTCOME_RECORD_COPY and session.bind.dialect.driver == "asyncpg":
+        await copy_outcome_records(session, outcomeRecords)
+    else:
+        await session.run_sync(insert_outcome_records, outcomeRecords)
+
+
+def uses_inline_markets(api) -> bool:
+    """
+    Whether the markets of the API's events are retrieved along with the events.
+    """
+    return config.INLINE_MARKETS and api.__inline_markets__
+
+
+async def record_inline_markets(
+    session: AsyncSession,
+    api,
+    referenceContest: ReferenceContest,
+    novelMarkets: dict,
+    timestamp: datetime.datetime,
+    outcomeRecords: Optional[list] = None,
+):
+    """
+    Record the markets retrieved along with the events of a contest, once the
+    events themselves have been recorded.
+    """
+    referenceEvents = await session.run_sync(
+        get_recorded_entities, ReferenceEvent, referenceContest
+    )
+    for referenceEvent in referenceEvents:
+        marketsData = novelMarkets.get(referenceEvent.refnum, None)
+        if marketsData is None:
+            continue
+        markets = await api.create_markets(marketsData)
+        await session.run_sync(
+            record_entities,
+            referenceEvent,
+            ReferenceMarket,
+            WebRequestStatus.SUCCESS,
+            markets,
+            timestamp,
+            outcomeRecords,
+        )
+
+
+def record_entities(
+    session: Session,
+    referenceParent: ReferenceEntity,
+    modelType: Type[ReferenceEntity],
+    status: WebRequestStatus,
+    novelEntities: List[EntityData],
+    timestamp: datetime.datetime,
+    outcomeRecords: Optional[list] = None,
+):
+    """
+    Reconcile the entities retrieved for `referenceParent` with those recorded:
+    recorded entities are marked as found (or not found), and entities which
+    haven't been recorded are created and added to the session. The session isn't
+    committed.
+
+    Args:
+        outcomeRecords (Optional[list]): where the new outcome records of recorded
+            markets are collected, as rows (see OutcomeRecord.get_row), for the
+            caller to insert in bulk. None -> they're inserted here
+    """
+    if status is WebRequestStatus.FAILED:
+        # a failed request doesn't mean the entities are gone, so they're left as
+        # they are (the failure has already been logged)
+        return
 
-    session.add_all(newEntities)
-    session.commit()
+    if status is WebRequestStatus.UNCHANGED:
+        # nothing has changed since the last request, so every recorded entity
+        # has been found again
+        referenceParent.found(timestamp)
+        for entity in get_recorded_entities(session, modelType, parent=referenceParent):
+            entity.found(timestamp)
+        return
 
-    return
+    if status is not WebRequestStatus.SUCCESS:
+        referenceParent.not_found(timestamp)
+        return
+
+    referenceParent.found(timestamp)
+
+    records = [] if outcomeRecords is None else outcomeRecords
+
+    # get recorded entities which are of type modelType and have
+    # the given referenceParent as a parent, by their natural keys
+    recordedEntities = {
+        entity.natural_key: entity
+        for entity in get_recorded_entities(session, modelType, parent=referenceParent)
+    }
+    foundKeys = set()
+
+    for novelEntity in novelEntities:
+        key = novelEntity.natural_key
+        if key in foundKeys:
+            continue
+        foundKeys.add(key)
+
+        recordedEntity = recordedEntities.get(key, None)
+        if recordedEntity is None:
+            # record new entities (only these are created as ORM objects)
+            newEntity = novelEntity.create(referenceParent)
+            newEntity.added()
+            session.add(newEntity)
+            continue
+
+        # entities that have both been recorded and found again
+        recordedEntity.found(timestamp)
+        # new outcome records for recorded markets (the outcomes of new markets
+        # are created with theirs), without creating ORM objects
+        if modelType is ReferenceMarket:
+            records.extend(recordedEntity.get_record_rows(novelEntity))
+
+    # entities that have been recorded but not found
+    for key, recordedEntity in recordedEntities.items():
+        if key not in foundKeys:
+            recordedEntity.not_found(timestamp)
+
+    if outcomeRecords is None:
+        insert_outcome_records(session, records)
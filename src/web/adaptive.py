@@ -0,0 +1,208 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import httpx
+from httpx import Response
+
+
+logger = logging.getLogger(__name__)
+
+# status codes which mean we're being throttled
+THROTTLE_STATUS_CODES = frozenset(
+    [
+        httpx.codes.FORBIDDEN,
+        httpx.codes.TOO_MANY_REQUESTS,
+        httpx.codes.SERVICE_UNAVAILABLE,
+    ]
+)
+
+
+@dataclass
+class DomainRate:
+    rate: float  # requests per second
+    latency: Optional[float] = None  # moving average of healthy response latency
+    last_decrease: float = float("-inf")  # monotonic time of the last decrease
+
+
+class AdaptiveRateController:
+    """
+    Adjusts the rate of each domain with additive increase, multiplicative decrease
+    (AIMD). While responses are healthy and fast, the rate is increased by `increase`
+    requests per second per response, up to `ceiling`. When a response is throttled
+    (e.g. 429), times out, or takes more than `latency_factor` times the average
+    latency, the rate is multiplied by `decrease`, down to `floor`.
+
+    Only requests started after the last decrease can trigger another, so that a
+    burst of throttled responses results in a single decrease.
+
+    When the rate is shared by several processes (see
+    RedisRateLimitBackend.adjust_rate), responses are classified here and the rate
+    is adjusted by the backend.
+    """
+
+    def __init__(
+        self,
+        initial: float,
+        floor: float,
+        ceiling: float,
+        increase: float = 0.01,
+        decrease: float = 0.5,
+        latency_factor: float = 3.0,
+        latency_smoothing: float = 0.1,
+    ):
+        """
+        Args:
+            initial (float): the starting rate of each domain, in requests per second
+            floor (float): the minimum rate (None -> no minimum)
+            ceiling (float): the maximum rate (None -> no maximum)
+            increase (float): requests per second added per healthy response
+            decrease (float): the factor the rate is multiplied by when throttled
+            latency_factor (float): responses slower than this multiple of the
+                average latency are treated as a latency spike
+            latency_smoothing (float): the weight given to each new latency in the
+                (exponential) moving average
+        """
+        self.floor = floor
+        self.ceiling = ceiling
+        self.initial = self.clamp(initial)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.latency_smoothing = latency_smoothing
+        self._domains: Dict[str, DomainRate] = dict()
+
+    def get_rate(self, domain: str) -> float:
+        return self._get_domain(domain).rate
+
+    def set_rate(self, domain: str, rate: float):
+        """
+        Set the rate of a domain, e.g. as adjusted by a shared backend.
+        """
+        self._get_domain(domain).rate = rate
+
+    def clamp(self, rate: float) -> float:
+        if self.floor is not None:
+            rate = max(self.floor, rate)
+        if self.ceiling is not None:
+            rate = min(self.ceiling, rate)
+        return rate
+
+    @property
+    def rates(self) -> Dict[str, float]:
+        return {domain: state.rate for domain, state in self._domains.items()}
+
+    def _get_domain(self, domain: str) -> DomainRate:
+        state = self._domains.get(domain, None)
+        if state is None:
+            state = DomainRate(self.initial)
+            self._domains[domain] = state
+        return state
+
+    def observe(
+        self,
+        domain: str,
+        response: Optional[Response],
+        latency: float,
+        started: float,
+        error: Optional[Exception] = None,
+    ) -> float:
+        """
+        Update the rate of a domain given the outcome of a request.
+
+        Args:
+            domain (str): the domain the request was made to
+            response (Optional[Response]): the response, or None if it failed
+            latency (float): seconds between sending the request and the response
+            started (float): the (monotonic) time the request was sent
+            error (Optional[Exception]): the error raised, if any
+
+        Returns:
+            float: the new rate of the domain
+        """
+        throttled, healthy = self.classify(domain, response, latency, error)
+        if throttled:
+            reason = error if error is not None else response.status_code
+            return self.adjust(domain, throttled, started, reason, latency)
+        if healthy:
+            return self.adjust(domain, throttled, started)
+        return self.get_rate(domain)
+
+    def classify(
+        self,
+        domain: str,
+        response: Optional[Response],
+        latency: float,
+        error: Optional[Exception] = None,
+    ) -> Tuple[bool, bool]:
+        """
+        Classify the outcome of a request (updating the average latency of the
+        domain), without adjusting its rate.
+
+        Returns:
+            Tuple[bool, bool]: whether the request was throttled (the rate should be
+                decreased), and whether it was healthy (the rate can be increased)
+        """
+        state = self._get_domain(domain)
+        throttled = self._is_throttled(state, response, latency, error)
+        healthy = error is None and (
+            response.is_success or response.status_code == httpx.codes.NOT_MODIFIED
+        )
+
+        # the average follows sustained changes in latency, so that a domain which
+        # becomes slower isn't treated as a spike indefinitely
+        if healthy:
+            if state.latency is None:
+                state.latency = latency
+            else:
+                state.latency += self.latency_smoothing * (latency - state.latency)
+
+        return throttled, healthy
+
+    def adjust(
+        self,
+        domain: str,
+        throttled: bool,
+        started: float,
+        reason=None,
+        latency: float = 0.0,
+    ) -> float:
+        """
+        Decrease the rate of a domain after a throttled request (unless it was
+        started before the last decrease), or increase it after a healthy one.
+
+        Returns:
+            float: the new rate of the domain
+        """
+        state = self._get_domain(domain)
+        if not throttled:
+            state.rate = self.clamp(state.rate + self.increase)
+        elif started >= state.last_decrease:
+            previous = state.rate
+            state.rate = self.clamp(state.rate * self.decrease)
+            state.last_decrease = time.monotonic()
+            logger.info(
+                "Rate for %s decreased from %.3f to %.3f (%s, %.2fs).",
+                domain,
+                previous,
+                state.rate,
+                reason,
+                latency,
+            )
+        return state.rate
+
+    def _is_throttled(
+        self,
+        state: DomainRate,
+        response: Optional[Response],
+        latency: float,
+        error: Optional[Exception],
+    ) -> bool:
+        if error is not None:
+            return isinstance(error, httpx.TimeoutException)
+        if response.status_code in THROTTLE_STATUS_CODES:
+            return True
+        return state.latency is not None and (
+            latency > self.latency_factor * state.latency
+        )
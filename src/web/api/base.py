@@ -1,32 +1,115 @@
-from typing import Optional
+import asyncio
+import datetime
+from logging import getLogger
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import httpx
 
-from src.database.models import (
-    OutcomeRecord,
-    ReferenceContest,
-    ReferenceEvent,
-    ReferenceMarket,
-    ReferenceOutcome,
-    ReferenceSport,
-)
+from src.database.models import ReferenceContest, ReferenceEvent, ReferenceSport
+from src.database.records import ContestData, EventData, MarketData, OutcomeData
+from src.web.client import get_top_level_domain
+from src.web.conditional import CONDITIONAL_EXTENSION, is_unchanged, ValidatorStore
 from src.web.enums import WebRequestStatus
+from src.web.limiter import PRIORITY_EXTENSION, RATE_LIMIT_KEY_EXTENSION
+from src.web.streaming import iter_items
+
+
+logger = getLogger(__name__)
+
+
+def get_priority(starttime: Optional[datetime.datetime]) -> Optional[float]:
+    """
+    Get the priority of a request for an event starting at `starttime`, as the number
+    of seconds until it starts (events which have started are the most urgent).
+    Naive datetimes are assumed to be in local time.
+
+    Returns:
+        Optional[float]: the priority, or None if the start time is unknown
+    """
+    if starttime is None:
+        return None
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max((starttime.astimezone(datetime.timezone.utc) - now).total_seconds(), 0)
+
+
+def get_batch_priority(priorities: List[Optional[float]]) -> Optional[float]:
+    """
+    Get the priority of a request made for several events, as that of the most
+    urgent event (None if no event's start time is known).
+    """
+    known = [priority for priority in priorities if priority is not None]
+    return min(known) if known else None
 
 
 class BaseAPI:
     __api_name__ = None
+    __base_url__ = None  # the url requests are made to, used to warm up connections
+    __markets_prefix__ = None  # the ijson prefix of the markets in a markets response
+    # the most events that markets can be requested for at once (if more than 1, the
+    # API implements markets_batch_request_info and get_markets_batch)
+    __max_markets_batch__ = 1
+    # whether events can be requested along with their markets (if True, the API
+    # implements get_events_with_markets and format_inline_markets_data)
+    __inline_markets__ = False
 
     def __init__(self, client, apiKey=None):
         self.client = client
+        # the urls of conditional requests whose responses are being processed
+        self.conditionalKeys = []
 
     def setup(self):
         ...
 
+    @classmethod
+    def get_rate_limit_key(cls) -> Optional[str]:
+        """
+        The key requests to this API are rate limited by (the top-level domain of
+        its base url), so that the client doesn't need to work it out per request.
+        """
+        if cls.__base_url__ is None:
+            return None
+        return get_top_level_domain(cls.__base_url__)
+
     async def make_request(
-        self, url: str, params: dict, headers: dict = None
-    ) -> Optional[dict]:
-        response = await self.client.get(url, params=params, headers=headers)
-        if response.is_success:
+        self,
+        url: str,
+        params: dict,
+        headers: dict = None,
+        conditional: bool = False,
+        priority: Optional[float] = None,
+    ) -> Union[dict, WebRequestStatus, None]:
+        """
+        Args:
+            url (str): the url to request
+            params (dict): the query parameters
+            headers (dict): any additional headers
+            conditional (bool): whether the request can be made conditional on the
+                content having changed since the last request to the same url. If
+                it hasn't, WebRequestStatus.UNCHANGED is returned instead of the
+                content
+            priority (Optional[float]): the number of seconds the request can wait
+                behind more urgent requests for a permit (lower is more urgent). If
+                None, the request has the lowest priority
+
+        Returns:
+            Union[dict, WebRequestStatus, None]: the content of the response,
+                WebRequestStatus.UNCHANGED, or None if not found. The response to a
+                conditional request is only compared against once it's been
+                processed (see commit_validators)
+        """
+        extensions = self.get_extensions(conditional, priority)
+        response = await self.client.get(
+            url, params=params, headers=headers, extensions=extensions
+        )
+        if conditional:
+            self.conditionalKeys.append(ValidatorStore.get_key(response.request))
+        if conditional and is_unchanged(response):
+            return WebRequestStatus.UNCHANGED
+        elif response.is_success:
+            # RateLimitedClients decode large responses off the event loop
+            decode_json = getattr(self.client, "decode_json", None)
+            if decode_json is not None:
+                return await decode_json(response)
             return response.json()
         elif response.status_code == httpx.codes.NOT_FOUND:
             return None
@@ -35,6 +118,79 @@ class BaseAPI:
                 "Request to %s failed with error code %s" % (url, response.status_code)
             )
 
+    async def make_streaming_request(
+        self,
+        url: str,
+        params: dict,
+        prefix: str,
+        itemFilter: Optional[Callable[[Any], bool]] = None,
+        headers: dict = None,
+        priority: Optional[float] = None,
+    ) -> Optional[List[Any]]:
+        """
+        Request a (large) JSON document, keeping only the items at `prefix`. The
+        items are parsed as the response body is received, so the document as a
+        whole is never held in memory (falls back to parsing it in full if ijson
+        isn't installed).
+
+        Args:
+            url (str): the url to request
+            params (dict): the query parameters
+            prefix (str): the ijson prefix of the items, e.g. "markets.item"
+            itemFilter (Optional[Callable[[Any], bool]]): if given, only items for
+                which this returns True are kept
+            headers (dict): any additional headers
+            priority (Optional[float]): see `make_request`
+
+        Returns:
+            Optional[List[Any]]: the items, or None if not found
+        """
+        extensions = self.get_extensions(priority=priority)
+        async with self.client.stream(
+            "GET", url, params=params, headers=headers, extensions=extensions
+        ) as response:
+            if response.is_success:
+                items = iter_items(response, prefix, itemFilter)
+                return [item async for item in items]
+            elif response.status_code == httpx.codes.NOT_FOUND:
+                return None
+            else:
+                raise Exception(
+                    "Request to %s failed with error code %s"
+                    % (url, response.status_code)
+                )
+
+    def commit_validators(self):
+        """
+        Make later requests conditional on the responses to this API's conditional
+        requests, once they've been processed (e.g. their entities committed). Until
+        then, the same responses aren't taken as unchanged.
+        """
+        validators = getattr(self.client, "validators", None)
+        if validators is not None:
+            for key in self.conditionalKeys:
+                validators.commit(key)
+        self.conditionalKeys.clear()
+
+    def get_extensions(
+        self, conditional: bool = False, priority: Optional[float] = None
+    ) -> dict:
+        extensions = dict()
+        rateLimitKey = self.get_rate_limit_key()
+        if rateLimitKey is not None:
+            extensions[RATE_LIMIT_KEY_EXTENSION] = rateLimitKey
+        if conditional:
+            extensions[CONDITIONAL_EXTENSION] = True
+        if priority is not None:
+            extensions[PRIORITY_EXTENSION] = priority
+        return extensions
+
+    def is_relevant_market(self, market: dict) -> bool:
+        """
+        Whether a market (an item at `__markets_prefix__`) should be kept.
+        """
+        return True
+
     def contest_request_info(self, referenceSport: ReferenceSport) -> dict:
         raise NotImplementedError
 
@@ -44,6 +200,9 @@ class BaseAPI:
     def market_request_info(self, referenceEvent: ReferenceEvent) -> dict:
         raise NotImplementedError
 
+    def markets_batch_request_info(self, referenceEvents: List[ReferenceEvent]) -> dict:
+        raise NotImplementedError
+
     async def get_contests(self, requestInfo: dict):
         raise NotImplementedError
 
@@ -53,6 +212,18 @@ class BaseAPI:
     async def get_markets(self, requestInfo: dict):
         raise NotImplementedError
 
+    async def get_events_with_markets(self, requestInfo: dict):
+        raise NotImplementedError
+
+    async def get_markets_batch(self, requestInfo: dict) -> Optional[Dict[str, list]]:
+        """
+        Returns:
+            Optional[Dict[str, list]]: the markets of each event found (in the same
+                form as get_markets returns them), by event refnum, or None if not
+                found
+        """
+        raise NotImplementedError
+
     async def get_outcomes(self, requestInfo: dict):
         raise NotImplementedError
 
@@ -62,7 +233,16 @@ class BaseAPI:
     async def format_events_data(self, responseData: dict):
         raise NotImplementedError
 
-    async def format_markets_data(self, responseData: dict):
+    async def format_markets_data(self, responseData: List[dict]):
+        raise NotImplementedError
+
+    async def format_inline_markets_data(self, responseData) -> Dict[str, list]:
+        """
+        Returns:
+            Dict[str, list]: the markets of each event in a get_events_with_markets
+                response (in the same form as get_markets returns them), by event
+                refnum
+        """
         raise NotImplementedError
 
     async def retrieve_contests(self, referenceSport: ReferenceSport):
@@ -73,16 +253,15 @@ class BaseAPI:
         # check for missing content
         if response is None:
             return (WebRequestStatus.NOTFOUND, [])
+        # nothing to format if nothing has changed
+        if response is WebRequestStatus.UNCHANGED:
+            return (WebRequestStatus.UNCHANGED, [])
         # format the data if it was returned
         data = await self.format_contests_data(response)
-        # convert into ReferenceContests
-        newContestEntities = []
-        for item in data:
-            newEntity = ReferenceContest(referenceSport, **item)
-            newEntity.retrieved()
-            newContestEntities.append(newEntity)
+        # convert into ContestData
+        newContests = [ContestData(**item) for item in data]
 
-        return (WebRequestStatus.SUCCESS, newContestEntities)
+        return (WebRequestStatus.SUCCESS, newContests)
 
     async def retrieve_events(self, referenceContest: ReferenceContest):
         # get the information required to call the API
@@ -92,41 +271,151 @@ class BaseAPI:
         # check for missing content
         if response is None:
             return (WebRequestStatus.NOTFOUND, [])
+        # nothing to format if nothing has changed
+        if response is WebRequestStatus.UNCHANGED:
+            return (WebRequestStatus.UNCHANGED, [])
         # format the data if it was returned
         data = await self.format_events_data(response)
-        # convert into ReferenceContests
-        newEventEntities = []
-        for item in data:
-            newEntity = ReferenceEvent(referenceContest, **item)
-            newEntity.retrieved()
-            newEventEntities.append(newEntity)
+        # convert into EventData
+        newEvents = [EventData(**item) for item in data]
 
-        return (WebRequestStatus.SUCCESS, newEventEntities)
+        return (WebRequestStatus.SUCCESS, newEvents)
+
+    async def retrieve_events_with_markets(
+        self, referenceContest: ReferenceContest
+    ) -> Tuple[WebRequestStatus, List[EventData], Dict[str, list]]:
+        """
+        Retrieve the events of a contest along with their markets, in one request.
+        The markets are left unformatted (see create_markets), as they are only
+        needed for events which are recorded.
+
+        Returns:
+            Tuple[WebRequestStatus, List[EventData], Dict[str, list]]: the status,
+                the events, and the markets of each event by event refnum
+        """
+        # get the information required to call the API
+        requestInfo = self.event_request_info(referenceContest)
+        # construct a request and send it
+        response = await self.get_events_with_markets(requestInfo)
+        # check for missing content
+        if response is None:
+            return (WebRequestStatus.NOTFOUND, [], dict())
+        # format the data if it was returned
+        data = await self.format_events_data(response)
+        markets = await self.format_inline_markets_data(response)
+        # convert into EventData
+        newEvents = [EventData(**item) for item in data]
+
+        return (WebRequestStatus.SUCCESS, newEvents, markets)
 
     async def retrieve_markets(self, referenceEvent: ReferenceEvent):
         # get the information required to call the API
         requestInfo = self.market_request_info(referenceEvent)
+        # markets for events starting soon are requested first
+        requestInfo["priority"] = get_priority(referenceEvent.starttime)
         # construct a request and send it
         response = await self.get_markets(requestInfo)
         # check for missing content
         if response is None:
             return (WebRequestStatus.NOTFOUND, [])
-        # format the data if it was returned
+        # convert into MarketData
+        newMarkets = await self.create_markets(response)
+
+        return (WebRequestStatus.SUCCESS, newMarkets)
+
+    async def retrieve_markets_batch(
+        self, referenceEvents: List[ReferenceEvent]
+    ) -> List[Tuple[WebRequestStatus, List[MarketData]]]:
+        """
+        Retrieve the markets of several events of this bookmaker, requesting the
+        markets of up to `__max_markets_batch__` events at once. Each request is
+        prioritised by its most urgent event.
+
+        Returns:
+            List[Tuple[WebRequestStatus, List[MarketData]]]: the status and
+                markets of each event, in the same order as `referenceEvents`. The
+                status of events whose request failed is WebRequestStatus.FAILED
+        """
+        batchSize = self.__max_markets_batch__
+        if batchSize <= 1:
+            batches = [[event] for event in referenceEvents]
+            requests = [
+                self._retrieve_markets_single(event) for event in referenceEvents
+            ]
+        else:
+            batches = [
+                referenceEvents[i : i + batchSize]
+                for i in range(0, len(referenceEvents), batchSize)
+            ]
+            requests = [self._retrieve_markets_batch(batch) for batch in batches]
+
+        # a failed request only fails the events it was made for, which are left
+        # as they are (a failed request doesn't mean their markets are gone)
+        results = await asyncio.gather(*requests, return_exceptions=True)
+        marketResults = []
+        for batch, batchResults in zip(batches, results):
+            if isinstance(batchResults, BaseException):
+                if not isinstance(batchResults, Exception):
+                    raise batchResults
+                logger.warning(
+                    "Failed to retrieve the markets of %s events of %s: %r",
+                    len(batch),
+                    self.__api_name__,
+                    batchResults,
+                )
+                batchResults = [(WebRequestStatus.FAILED, []) for _ in batch]
+            marketResults.extend(batchResults)
+        return marketResults
+
+    async def _retrieve_markets_single(
+        self, referenceEvent: ReferenceEvent
+    ) -> List[Tuple[WebRequestStatus, List[MarketData]]]:
+        return [await self.retrieve_markets(referenceEvent)]
+
+    async def _retrieve_markets_batch(
+        self, referenceEvents: List[ReferenceEvent]
+    ) -> List[Tuple[WebRequestStatus, List[MarketData]]]:
+        # get the information required to call the API
+        requestInfo = self.markets_batch_request_info(referenceEvents)
+        # the request is as urgent as the soonest event
+        requestInfo["priority"] = get_batch_priority(
+            [get_priority(event.starttime) for event in referenceEvents]
+        )
+        # construct a request and send it
+        response = await self.get_markets_batch(requestInfo)
+
+        results = []
+        for referenceEvent in referenceEvents:
+            # check for missing content (per event)
+            if response is None or referenceEvent.refnum not in response:
+                results.append((WebRequestStatus.NOTFOUND, []))
+                continue
+            try:
+                markets = await self.create_markets(response[referenceEvent.refnum])
+            except Exception as e:
+                # the markets of the other events can still be recorded
+                logger.warning(
+                    "Failed to format the markets of %s event %s: %r",
+                    self.__api_name__,
+                    referenceEvent.refnum,
+                    e,
+                )
+                results.append((WebRequestStatus.FAILED, []))
+                continue
+            results.append((WebRequestStatus.SUCCESS, markets))
+        return results
+
+    async def create_markets(self, response: List[dict]) -> List[MarketData]:
+        # format the data
         data = await self.format_markets_data(response)
-        # convert into ReferenceContests
-        newMarketEntities = []
-        for marketItem in data:  # markets
-            marketOutcomes = marketItem["outcomes"]
-            del marketItem["outcomes"]
-            market = ReferenceMarket(referenceEvent, **marketItem)
-            market.retrieved()
-            for outcomeData in marketOutcomes:
-                timestamp = outcomeData["timestamp"]
-                returns = outcomeData["returns"]
-                del outcomeData["timestamp"]
-                del outcomeData["returns"]
-                referenceOutcome = ReferenceOutcome(market, **outcomeData)
-                OutcomeRecord(referenceOutcome, timestamp, returns)
-            newMarketEntities.append(market)
-
-        return (WebRequestStatus.SUCCESS, newMarketEntities)
+        # convert into MarketData
+        newMarkets = []
+        for marketItem in data:
+            outcomes = tuple(OutcomeData(**item) for item in marketItem["outcomes"])
+            # refnums are recorded as strings
+            refnum = marketItem["refnum"]
+            if refnum is not None:
+                refnum = str(refnum)
+            newMarkets.append(MarketData(refnum, marketItem["refname"], outcomes))
+
+        return newMarkets
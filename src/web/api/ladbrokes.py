@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, List, Optional
 import datetime
 import dateutil.parser
 
@@ -21,13 +21,22 @@ baseURL = "https://ss-aka-ori.ladbrokes.com/openbet-ssviewer/Drilldown/2.31"
 
 class Ladbrokes(BaseAPI):
     __api_name__ = "Ladbrokes"
+    __base_url__ = baseURL
+    __markets_prefix__ = "SSResponse.children.item.event.children.item"
+    # EventToOutcomeForEvent accepts comma separated event ids
+    __max_markets_batch__ = 20
+    __events_prefix__ = "SSResponse.children.item"
 
     def __init__(self, client, apiKey=None):
-        self.client = client
+        super().__init__(client, apiKey=apiKey)
 
     def setup(self):
         ...
 
+    def is_relevant_market(self, market: dict) -> bool:
+        # markets are already limited to head to head by the request
+        return "market" in market
+
     def contest_request_info(self, referenceSport: ReferenceSport) -> dict:
         requestInfo = dict()
         requestInfo['categoryID'] = referenceSport.refnum
@@ -55,6 +64,15 @@ class Ladbrokes(BaseAPI):
         ]
         return requestInfo
 
+    def markets_batch_request_info(self, referenceEvents: List[ReferenceEvent]) -> dict:
+        requestInfo = dict()
+        requestInfo['eventIDs'] = [event.refnum for event in referenceEvents]
+        requestInfo['params'] = [
+            ('responseFormat', 'json'),
+            ('translationLang', 'en'),
+        ]
+        return requestInfo
+
     async def get_contests(self, requestInfo: dict):
         categoryID = requestInfo["categoryID"]
         params = requestInfo.get("params", None)
@@ -74,7 +92,9 @@ class Ladbrokes(BaseAPI):
             AppleWebKit/537.36 (KHTML, like Gecko) \
             Chrome/117.0.0.0 Safari/537.36"
 
-        return await self.make_request(requestURL, params, headers=headers)
+        return await self.make_request(
+            requestURL, params, headers=headers, conditional=True
+        )
 
     async def get_events(self, requestInfo: dict):
         typeID = requestInfo["typeID"]
@@ -95,7 +115,9 @@ class Ladbrokes(BaseAPI):
             AppleWebKit/537.36 (KHTML, like Gecko) \
             Chrome/117.0.0.0 Safari/537.36"
 
-        return await self.make_request(requestURL, params, headers=headers)
+        return await self.make_request(
+            requestURL, params, headers=headers, conditional=True
+        )
 
     async def get_markets(self, requestInfo: dict):
         eventID = requestInfo["eventID"]
@@ -114,7 +136,53 @@ class Ladbrokes(BaseAPI):
             AppleWebKit/537.36 (KHTML, like Gecko) \
             Chrome/117.0.0.0 Safari/537.36"
 
-        return await self.make_request(requestURL, params, headers=headers)
+        return await self.make_streaming_request(
+            requestURL,
+            params,
+            self.__markets_prefix__,
+            self.is_relevant_market,
+            headers=headers,
+            priority=requestInfo.get("priority"),
+        )
+
+    async def get_markets_batch(self, requestInfo: dict) -> Optional[Dict[str, list]]:
+        eventIDs = ",".join(requestInfo["eventIDs"])
+        params = requestInfo.get("params", None)
+
+        requestURL = baseURL + f"/EventToOutcomeForEvent/{eventIDs}"
+
+        # for now we are only concerned with head to head
+        params.extend([
+            ("simpleFilter", "market.dispSortName:intersects:HH")
+        ])
+
+        # ladbrokes returns 403 unless user agent is spoofed
+        headers = dict()
+        headers['User-Agent'] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) \
+            AppleWebKit/537.36 (KHTML, like Gecko) \
+            Chrome/117.0.0.0 Safari/537.36"
+
+        # each event is kept (with its markets), the response footer isn't
+        events = await self.make_streaming_request(
+            requestURL,
+            params,
+            self.__events_prefix__,
+            lambda item: "event" in item,
+            headers=headers,
+            priority=requestInfo.get("priority"),
+        )
+        if events is None:
+            return None
+
+        markets = dict()
+        for item in events:
+            event = item["event"]
+            markets[str(event["id"])] = [
+                market
+                for market in event.get("children", [])
+                if self.is_relevant_market(market)
+            ]
+        return markets
 
     async def get_outcomes(self, requestInfo: dict):
         raise NotImplementedError
@@ -152,16 +220,12 @@ class Ladbrokes(BaseAPI):
             newEntities.append(newEntity)
         return newEntities
 
-    async def format_markets_data(self, responseData: dict):
+    async def format_markets_data(self, responseData: list):
         retrievalTimestamp = datetime.datetime.utcnow()
 
         newEntities = []
 
-        marketData = responseData['SSResponse']["children"][0]["event"]
-        if not marketData.get("children", None):
-            return []
-        marketData = marketData["children"]
-        for market in marketData:
+        for market in responseData:
             # already limited to head to head from the response
             info = market['market']
             newMarket = dict()
@@ -1,6 +1,6 @@
 import copy
 import datetime
-from typing import Optional
+from typing import Dict, Optional
 
 from src.database.models import (
     ReferenceContest,
@@ -13,15 +13,25 @@ from src.database.models import (
 from src.web.api.base import BaseAPI
 
 baseURL = "https://www.sportsbet.com.au/apigw/sportsbook-sports/Sportsbook/Sports"
+# the number of top markets included with each event
+INLINE_MARKETS_COUNT = 3
 
 
 class Sportsbet(BaseAPI):
     __api_name__ = "Sportsbet"
+    __base_url__ = baseURL
+    __markets_prefix__ = "item"
+    # events can include their top markets (includeTopMarkets)
+    __inline_markets__ = True
 
     def __init__(self, client, apiKey=None):
         super().__init__(client, apiKey=apiKey)
         ...
 
+    def is_relevant_market(self, market: dict) -> bool:
+        # limited to head to head for now
+        return market.get("name", None) == "Match Betting"
+
     def contest_request_info(self, referenceSport: ReferenceSport):
         return {"sportID": referenceSport.refnum}
 
@@ -52,7 +62,7 @@ class Sportsbet(BaseAPI):
             params["displayType"] = "default"
             params["eventFilter"] = "matches"
 
-        return await self.make_request(requestURL, params)
+        return await self.make_request(requestURL, params, conditional=True)
 
     async def get_events(self, requestInfo: dict) -> Optional[dict]:
         """
@@ -91,9 +101,32 @@ class Sportsbet(BaseAPI):
                 params.get("includeTopMarkets", "false")
             ).lower()
 
+        return await self.make_request(requestURL, params, conditional=True)
+
+    async def get_events_with_markets(self, requestInfo: dict) -> Optional[list]:
+        """
+        Params:
+            contestId [int]
+                The id corresponding to the desired contest
+                e.g. NBA is 6927
+
+        Options:
+            see get_events
+        """
+        contestID = requestInfo["contestID"]
+
+        requestURL = baseURL + f"/Competitions/{contestID}/Events"
+
+        params = dict()
+        params["displayType"] = "default"
+        params["includeTopMarkets"] = "true"
+        # the head to head market is among the top markets of a match
+        params["numMarkets"] = INLINE_MARKETS_COUNT
+
+        # not conditional, as the odds change even if the events haven't
         return await self.make_request(requestURL, params)
 
-    async def get_markets(self, requestInfo: dict) -> Optional[dict]:
+    async def get_markets(self, requestInfo: dict) -> Optional[list]:
         """
         Params:
             eventId [int]
@@ -110,7 +143,13 @@ class Sportsbet(BaseAPI):
         if not params:
             params = dict()
 
-        return await self.make_request(requestURL, params)
+        return await self.make_streaming_request(
+            requestURL,
+            params,
+            self.__markets_prefix__,
+            self.is_relevant_market,
+            priority=requestInfo.get("priority"),
+        )
 
     async def format_contests_data(self, responseData):
         newEntities = []
@@ -151,15 +190,23 @@ class Sportsbet(BaseAPI):
             newEntities.append(newEntity)
         return newEntities
 
+    async def format_inline_markets_data(self, responseData) -> Dict[str, list]:
+        markets = dict()
+        for event in responseData:
+            if not event["eventSort"] == "MTCH":
+                continue
+            markets[str(event["id"])] = [
+                market
+                for market in event.get("marketList", [])
+                if self.is_relevant_market(market)
+            ]
+        return markets
+
     async def format_markets_data(self, responseData):
         retrievalTimestamp = datetime.datetime.utcnow()
 
         newEntities = []
         for market in responseData:
-            # limited to head to head for now
-            if market["name"] != "Match Betting":
-                continue
-
             newMarket = dict()
             newMarket["refnum"] = None
             newMarket["refname"] = market["name"]
@@ -23,6 +23,8 @@ baseURL = "https://api.beta.tab.com.au/v1/tab-info-service/sports"
 
 class Tab(BaseAPI):
     __api_name__ = "TAB"
+    __base_url__ = baseURL
+    __markets_prefix__ = "markets.item"
 
     def __init__(self, session, apiKey=None):
         super().__init__(session, apiKey=apiKey)
@@ -35,6 +37,12 @@ class Tab(BaseAPI):
         if not params or params["jurisdiction"] not in valid_jurisdictions:
             raise ValueError("Jurisdiction must be valid.")
 
+    def is_relevant_market(self, market: dict) -> bool:
+        # limited to head to head for now
+        if market.get("betOption", None) != "Head To Head":
+            return False
+        return not market.get("isFuture", False)
+
     def contest_request_info(self, referenceSport: ReferenceSport):
         requestInfo = {"sportName": referenceSport.refname}
         requestInfo["params"] = {"jurisdiction": "QLD"}
@@ -76,8 +84,9 @@ class Tab(BaseAPI):
 
         requestURL = baseURL + f"/{sportName}/competitions"
 
-        response = await self.make_request(requestURL, params)
-        response["sportName"] = sportName  # for formatting
+        response = await self.make_request(requestURL, params, conditional=True)
+        if isinstance(response, dict):
+            response["sportName"] = sportName  # for formatting
         return response
 
     async def get_contest(self, requestInfo: dict) -> Optional[dict]:
@@ -131,9 +140,9 @@ class Tab(BaseAPI):
 
         requestURL = baseURL + f"/{sportName}/competitions/{contestName}/matches"
 
-        return await self.make_request(requestURL, params)
+        return await self.make_request(requestURL, params, conditional=True)
 
-    async def get_markets(self, requestInfo: dict) -> Optional[dict]:
+    async def get_markets(self, requestInfo: dict) -> Optional[list]:
         """
         Params:
             sportName [str]
@@ -162,7 +171,13 @@ class Tab(BaseAPI):
             + f"/{sportName}/competitions/{contestName}/matches/{eventName}/markets"
         )
 
-        return await self.make_request(requestURL, params)
+        return await self.make_streaming_request(
+            requestURL,
+            params,
+            self.__markets_prefix__,
+            self.is_relevant_market,
+            priority=requestInfo.get("priority"),
+        )
 
     async def format_contests_data(self, responseData):
         nonFutures = []
@@ -210,14 +225,7 @@ class Tab(BaseAPI):
 
         results = []
 
-        for market in responseData["markets"]:
-            # limited to head to head for now
-            if market["betOption"] != "Head To Head":
-                continue
-
-            if market["isFuture"]:
-                continue
-
+        for market in responseData:
             newMarket = dict()
             newMarket["refnum"] = market["betOptionSpectrumId"]
             newMarket["refname"] = market["betOption"]
@@ -16,3 +16,7 @@ def get_bookmaker_api(bookmaker_name: str):
         raise Exception("No api for bookmaker %s!" % bookmaker_name)
 
     return api
+
+
+def get_base_urls() -> list:
+    return [api.__base_url__ for api in api_map.values() if api.__base_url__]
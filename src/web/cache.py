@@ -0,0 +1,222 @@
+import asyncio
+import collections
+import contextlib
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+
+from src.web.codec import Codec, DEFAULT_CODEC
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    size: int  # bytes on disk
+    expires: Optional[float]  # unix timestamp, None -> never
+
+
+class CacheStore:
+    """
+    A bounded, expiring store of JSON documents on disk.
+
+    Documents are keyed by an md5 hash, and sharded into subdirectories by the first
+    two characters of the hash. An in-memory index of the documents is kept in least
+    recently used order, and once the total size exceeds `max_bytes` the least
+    recently used documents are removed. All disk IO is done in a thread so that it
+    doesn't block the event loop.
+    """
+
+    def __init__(
+        self,
+        location: str,
+        max_bytes: Optional[int] = None,
+        default_ttl: Optional[float] = None,
+        ttls: Iterable[Tuple[str, float]] = (),
+        codec: Codec = DEFAULT_CODEC,
+    ):
+        """
+        Args:
+            location (str): the directory to store documents in
+            max_bytes (Optional[int]): the size budget. None -> unbounded
+            default_ttl (Optional[float]): seconds before a document expires, if no
+                ttl pattern matches. None -> never expires
+            ttls (Iterable[Tuple[str, float]]): (regex, seconds) pairs. The ttl of a
+                document is given by the first regex found in its url path
+            codec (Codec): the JSON codec documents are encoded with
+        """
+        self.location = location
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self.codec = codec
+
+        self._index = collections.OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    @staticmethod
+    def get_key(url: str) -> str:
+        return hashlib.md5(url.encode("utf-8")).hexdigest()
+
+    def get_filepath(self, key: str) -> str:
+        return os.path.join(self.location, key[:2], f"{key}.json")
+
+    def get_ttl(self, path: str) -> Optional[float]:
+        for pattern, ttl in self.ttls:
+            if pattern.search(path):
+                return ttl
+        return self.default_ttl
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self):
+        return len(self._index)
+
+    def get_size(self, key: str) -> Optional[int]:
+        """
+        The size in bytes of a cached document, or None if it isn't cached.
+        """
+        entry = self._index.get(key, None)
+        return entry.size if entry is not None else None
+
+    async def get(self, key: str) -> Optional[dict]:
+        await self._load_index()
+
+        entry = self._index.get(key, None)
+        if entry is None:
+            return None
+
+        if entry.expires is not None and entry.expires <= time.time():
+            await self._remove(key)
+            return None
+
+        try:
+            data = await asyncio.to_thread(self._read, self.get_filepath(key))
+        except (OSError, ValueError):  # removed externally, or unreadable
+            await self._remove(key)
+            return None
+
+        # the expiry of documents found on startup isn't known until they're read
+        expires = data.get("expires", None)
+        if expires is not None and expires <= time.time():
+            await self._remove(key)
+            return None
+        entry.expires = expires
+
+        self._index.move_to_end(key)
+        return data
+
+    async def set(self, key: str, path: str, data: dict):
+        """
+        Args:
+            key (str): the key of the document
+            path (str): the url path the document was retrieved from, used to
+                determine the ttl
+            data (dict): the document
+        """
+        await self._load_index()
+
+        ttl = self.get_ttl(path)
+        expires = time.time() + ttl if ttl is not None else None
+        data["expires"] = expires
+
+        size = await asyncio.to_thread(self._write, self.get_filepath(key), data)
+
+        previous = self._index.pop(key, None)
+        if previous is not None:
+            self._total_bytes -= previous.size
+        self._index[key] = CacheEntry(size, expires)
+        self._total_bytes += size
+
+        await self._evict()
+
+    async def clear(self):
+        await self._load_index()
+        for key in list(self._index):
+            await self._remove(key)
+
+    async def _remove(self, key: str):
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return
+        self._total_bytes -= entry.size
+        try:
+            await asyncio.to_thread(os.remove, self.get_filepath(key))
+        except FileNotFoundError:
+            pass
+
+    async def _evict(self):
+        if self.max_bytes is None:
+            return
+        while self._total_bytes > self.max_bytes and self._index:
+            key = next(iter(self._index))
+            logger.debug("Evicting %s from the request cache.", key)
+            await self._remove(key)
+
+    async def _load_index(self):
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            entries = await asyncio.to_thread(self._scan)
+            for key, entry in entries:
+                self._index[key] = entry
+                self._total_bytes += entry.size
+            self._loaded = True
+            logger.info(
+                "Request cache loaded (%s entries, %s bytes).",
+                len(self._index),
+                self._total_bytes,
+            )
+            await self._evict()
+
+    def _scan(self) -> list:
+        """
+        Build the index from the documents on disk, least recently modified first.
+        Expiry times aren't known until a document is read, so documents are
+        assumed not to expire until then.
+        """
+        entries = []
+        if not os.path.isdir(self.location):
+            return entries
+        for shard in os.scandir(self.location):
+            if not shard.is_dir():
+                continue
+            for item in os.scandir(shard.path):
+                if not item.name.endswith(".json"):
+                    continue
+                stat = item.stat()
+                entries.append((stat.st_mtime, item.name[:-5], stat.st_size))
+        entries.sort()
+        return [(key, CacheEntry(size, None)) for _, key, size in entries]
+
+    def _read(self, filepath: str) -> dict:
+        with open(filepath, "rb") as j:
+            return self.codec.loads(j.read())
+
+    def _write(self, filepath: str, data: dict) -> int:
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        encoded = self.codec.dumps(data)
+        # write then rename, so that readers never see a partially written file
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(filepath), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as j:
+                j.write(encoded)
+            os.replace(tmppath, filepath)
+        except BaseException:
+            # don't leave the partially written file behind
+            with contextlib.suppress(OSError):
+                os.remove(tmppath)
+            raise
+        return len(encoded)
@@ -0,0 +1,182 @@
+import asyncio
+import base64
+import collections
+import datetime
+import glob
+import logging
+import os
+import time
+from typing import Dict, Hashable, Iterable, List, Optional
+
+import httpx
+from httpx import Request, Response
+
+from src.web.coalesce import ENCODING_HEADERS
+from src.web.codec import Codec, DEFAULT_CODEC
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_interaction_key(method: str, url: httpx.URL) -> Hashable:
+    """
+    Requests are matched by method and url, with query parameters in any order.
+    """
+    return (
+        method,
+        url.scheme,
+        url.host,
+        url.port,
+        url.path,
+        tuple(sorted(url.params.multi_items())),
+    )
+
+
+def encode_content(content: bytes) -> dict:
+    try:
+        return {"encoding": "utf-8", "content": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"encoding": "base64", "content": base64.b64encode(content).decode()}
+
+
+def decode_content(data: dict) -> bytes:
+    if data["encoding"] == "base64":
+        return base64.b64decode(data["content"])
+    return data["content"].encode("utf-8")
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps a transport, recording every request/response pair (including headers
+    and latency) to a cassette: a file with one JSON interaction per line.
+
+    Response bodies are read in full before they are returned, so that they can be
+    recorded.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        path: str,
+        codec: Codec = DEFAULT_CODEC,
+    ):
+        self.transport = transport
+        self.path = path
+        self.codec = codec
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "ab")
+
+    async def handle_async_request(self, request: Request) -> Response:
+        started = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        latency = time.monotonic() - started
+
+        # the content has been decoded, so the encoding headers no longer apply
+        headers = [
+            (key, value)
+            for key, value in response.headers.multi_items()
+            if key.lower() not in ENCODING_HEADERS
+        ]
+        interaction = {
+            "recorded": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "latency": latency,
+            "request": {
+                "method": request.method,
+                "url": str(request.url),
+                "headers": request.headers.multi_items(),
+                **encode_content(request.content),
+            },
+            "response": {
+                "status_code": response.status_code,
+                "http_version": response.extensions.get("http_version", b"").decode(),
+                "headers": headers,
+                **encode_content(content),
+            },
+        }
+        await asyncio.to_thread(self._write, self.codec.dumps(interaction))
+
+        return Response(
+            response.status_code,
+            headers=headers,
+            content=content,
+            request=request,
+            extensions=response.extensions,
+        )
+
+    def _write(self, line: bytes):
+        self._file.write(line + b"\n")
+        self._file.flush()
+
+    async def aclose(self):
+        await self.transport.aclose()
+        self._file.close()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    Serves responses from cassettes instead of the network, after their recorded
+    latency multiplied by `latency_scale` (0 -> as fast as possible).
+
+    Identical requests are served the responses recorded for them in order,
+    starting again from the first once all have been served. Requests which weren't
+    recorded get a 404.
+    """
+
+    def __init__(self, paths: Iterable[str], latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self._interactions: Dict[Hashable, List[dict]] = collections.defaultdict(list)
+        self._served = collections.Counter()
+        for path in paths:
+            self._load(path)
+
+    @classmethod
+    def from_directory(cls, location: str, **kwargs) -> "ReplayTransport":
+        return cls(sorted(glob.glob(os.path.join(location, "*.jsonl"))), **kwargs)
+
+    def _load(self, path: str):
+        with open(path, "rb") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                interaction = DEFAULT_CODEC.loads(line)
+                request = interaction["request"]
+                key = get_interaction_key(request["method"], httpx.URL(request["url"]))
+                self._interactions[key].append(interaction)
+
+    def __len__(self) -> int:
+        return sum(len(interactions) for interactions in self._interactions.values())
+
+    def _get_interaction(self, request: Request) -> Optional[dict]:
+        key = get_interaction_key(request.method, request.url)
+        interactions = self._interactions.get(key, None)
+        if not interactions:
+            return None
+        interaction = interactions[self._served[key] % len(interactions)]
+        self._served[key] += 1
+        return interaction
+
+    async def handle_async_request(self, request: Request) -> Response:
+        interaction = self._get_interaction(request)
+        if interaction is None:
+            logger.warning(
+                "No recorded response to %s %s.", request.method, request.url
+            )
+            return Response(httpx.codes.NOT_FOUND, request=request)
+
+        await asyncio.sleep(interaction["latency"] * self.latency_scale)
+
+        recorded = interaction["response"]
+        extensions = dict()
+        if recorded["http_version"]:
+            extensions["http_version"] = recorded["http_version"].encode()
+        return Response(
+            recorded["status_code"],
+            headers=recorded["headers"],
+            content=decode_content(recorded),
+            request=request,
+            extensions=extensions,
+        )
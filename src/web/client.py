@@ -1,24 +1,93 @@
 import asyncio
-import hashlib
 import logging
 import os
+import time
+import urllib.parse
 from dataclasses import dataclass
-from functools import wraps
-from json.decoder import JSONDecodeError
-from typing import Optional
+from functools import lru_cache, wraps
+from typing import Any, Dict, Iterable, Optional, Tuple
 
-import simplejson as json
+import httpx
 import tldextract
-from httpx import AsyncClient, Request, Response
+from httpx import AsyncClient, codes, Request, Response
+
+from src.web.adaptive import AdaptiveRateController
+from src.web.cache import CacheStore
+from src.web.codec import DecodeError, JSONDecoder
+from src.web.coalesce import RequestCoalescer
+from src.web.conditional import CONDITIONAL_EXTENSION, ValidatorStore
+from src.web.limiter import (
+    PRIORITY_EXTENSION,
+    RATE_LIMIT_KEY_EXTENSION,
+    RateLimiter,
+    RedisRateLimitBackend,
+    SharedRateLimiter,
+)
+from src.web.metrics import (
+    COALESCED_REQUESTS,
+    DECODE_TIME,
+    InMemoryMetricsSink,
+    MetricsSink,
+    PERMIT_BUSY,
+    PERMIT_CONCURRENCY,
+    PERMIT_WAIT,
+    PERMITS_IN_FLIGHT,
+    PERMITS_WAITING,
+    REQUEST_LATENCY,
+    RESPONSE_BYTES,
+    RESPONSES,
+    RETRIES,
+    RETRY_SLEEP,
+)
+from src.web.retry import (
+    get_backoff,
+    get_retry_after,
+    is_retryable,
+    RETRY_EXCEPTIONS,
+)
+from src.web.streaming import ClosingStream
+
+
+try:
+    import h2  # noqa: F401 (required by httpx for HTTP/2)
+except ImportError:
+    h2 = None
 
 
 logger = logging.getLogger(__name__)
 
-extract = tldextract.TLDExtract()
+# the public suffix list snapshot bundled with tldextract is used, rather than
+# fetching (and caching) the latest list over the network
+extract = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+
+# rate limit key used for the limit shared by all domains
+GLOBAL_LIMIT_KEY = "__global__"
+
+# connection pool size when concurrency isn't limited (the httpx default)
+DEFAULT_MAX_CONNECTIONS = 100
+
+
+@lru_cache(maxsize=4096)
+def get_host_domain(host: str) -> str:
+    return extract(host).domain
 
 
 def get_top_level_domain(url: str) -> str:
-    return extract(url).domain
+    host = urllib.parse.urlsplit(url).hostname
+    if host is None:  # no scheme, so let tldextract find the host
+        return extract(url).domain
+    return get_host_domain(host)
+
+
+def get_rate_limit_key(request: Request) -> str:
+    """
+    Get the key a request is rate limited by: the "rate_limit_key" extension if the
+    caller has set one, otherwise the top-level domain of the request.
+    """
+    key = request.extensions.get(RATE_LIMIT_KEY_EXTENSION, None)
+    if key is None:
+        key = get_host_domain(request.url.host)
+    return key
 
 
 @dataclass
@@ -28,6 +97,16 @@ class ClientSettings:
     _global_concurrency: int = 1
     _domain_concurrency: int = 1
     max_retries: int = 0
+    backoff_base: float = 1.0  # seconds, doubled for each retry
+    backoff_max: float = 30.0  # seconds, longer Retry-After requests aren't retried
+    coalesce_requests: bool = True  # share responses between identical requests
+    coalesce_window: float = 0.0  # seconds to reuse a response for, 0 -> in-flight
+    adaptive: bool = False  # adjust each domain's rate to its responses (AIMD)
+    domain_rate_floor: Optional[float] = None
+    domain_rate_ceiling: Optional[float] = None
+    priority_max_slack: float = 300.0  # seconds, the most a request is delayed for
+    http2: bool = False  # multiplex requests to each host over one connection
+    keepalive_expiry: float = 5.0  # seconds an idle connection is kept open for
 
     def __post_init__(self):
         self.update_intervals()
@@ -43,6 +122,56 @@ class ClientSettings:
     def set_max_retries(self, max_retries):
         self.max_retries = max_retries
 
+    def set_backoff(self, backoff_base, backoff_max):
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def set_adaptive(self, domain_rate_floor, domain_rate_ceiling):
+        self.adaptive = True
+        self.domain_rate_floor = domain_rate_floor
+        self.domain_rate_ceiling = domain_rate_ceiling
+
+    def set_priority_max_slack(self, priority_max_slack):
+        self.priority_max_slack = priority_max_slack
+
+    def set_http2(self, http2, keepalive_expiry=None):
+        self.http2 = http2
+        if keepalive_expiry is not None:
+            self.keepalive_expiry = keepalive_expiry
+
+    def get_limits(self) -> httpx.Limits:
+        """
+        Get the connection pool limits. The pool is sized to the global concurrency,
+        as no more requests than that can be in flight at once, and every connection
+        is kept alive so that it can be reused by the next request to the same host.
+        """
+        maxConnections = DEFAULT_MAX_CONNECTIONS
+        if self.global_rate is not None:
+            maxConnections = self._global_concurrency
+        return httpx.Limits(
+            max_connections=maxConnections,
+            max_keepalive_connections=maxConnections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def use_http2(self) -> bool:
+        """
+        Whether HTTP/2 is used: if it's enabled and h2 is installed.
+        """
+        if self.http2 and h2 is None:
+            logger.warning("HTTP/2 requires h2 (httpx[http2]). Using HTTP/1.1.")
+            return False
+        return self.http2
+
+    def get_transport(self) -> httpx.AsyncHTTPTransport:
+        """
+        Get a network transport with the settings' pool limits and HTTP version, for
+        clients given a transport which wraps another (e.g. RecordingTransport).
+        """
+        return httpx.AsyncHTTPTransport(
+            http2=self.use_http2(), limits=self.get_limits()
+        )
+
     def update_intervals(self):
         if self.global_rate:
             self.global_interval = self._global_concurrency / self.global_rate
@@ -57,21 +186,38 @@ class RateLimitedClient(AsyncClient):
     def __init__(
         self,
         clientSettings: ClientSettings = DEFAULT_RATE_LIMIT,
+        rateLimitBackend: Optional[RedisRateLimitBackend] = None,
+        metrics: Optional[MetricsSink] = None,
+        decoder: Optional[JSONDecoder] = None,
         **kwargs,
     ):
         """
         Args:
-            global_interval (Union[dt.timedelta, float]):
-                Time between requests for the entire pool.
-                If a float is given, seconds are assumed.
-            domain_interval (Union[dt.timedelta, float]):
-                Time between requests for each top-level domain.
-                If a float is given, seconds are assumed.
-            domain_concurrency (Union[dt.timedelta, float]):
-                The maximum number of concurrent requests for each top-level domain.
-                Defaults to 1.
+            clientSettings (ClientSettings):
+                The rate limits, concurrency limits and retries for the client.
+                Each top-level domain, and the pool as a whole, is limited by a
+                token bucket refilling at the given rate with a burst equal to the
+                concurrency, and by the number of requests currently in flight.
+            rateLimitBackend (Optional[RedisRateLimitBackend]):
+                If given, the token buckets are held by this backend and shared
+                with every other client using it (e.g. other worker processes).
+                Concurrency is still limited per client.
+            metrics (Optional[MetricsSink]):
+                Where to record the latency, permit wait, retries, responses and
+                permit usage of each domain. Defaults to an InMemoryMetricsSink.
+            decoder (Optional[JSONDecoder]):
+                Decodes response bodies in `decode_json`. Defaults to the fastest
+                available codec, decoding large bodies in a thread.
+
+        Requests may set the "priority" extension to the number of seconds they can
+        afford to wait behind more urgent requests. Permits are granted earliest
+        deadline first, with slack capped at the settings' `priority_max_slack`.
+
+        The connection pool limits (and HTTP/2, if enabled and h2 is installed) are
+        taken from the settings, unless given as keyword arguments.
         """
         self.clientSettings = clientSettings
+        self.rateLimitBackend = rateLimitBackend
         self._using_global_interval = clientSettings.global_rate is not None
         self._using_domain_interval = clientSettings.domain_rate is not None
 
@@ -85,157 +231,398 @@ class RateLimitedClient(AsyncClient):
 
         self.max_retries = clientSettings.max_retries
 
-        self._background_tasks = set()
-        self._global_lock = asyncio.Semaphore(self.global_concurrency)
-        self._domain_locks = dict()
+        self._global_limiter = self._create_limiter(
+            GLOBAL_LIMIT_KEY, clientSettings.global_rate, self.global_concurrency
+        )
+        self._domain_limiters = dict()
+
+        # validators of previous responses, for conditional requests
+        self.validators = ValidatorStore()
+
+        # adjusts the rate of each domain, starting from the configured rate
+        self.rateController = None
+        if clientSettings.adaptive and self._using_domain_interval:
+            self.rateController = AdaptiveRateController(
+                clientSettings.domain_rate,
+                clientSettings.domain_rate_floor,
+                clientSettings.domain_rate_ceiling,
+            )
 
-        super().__init__(**kwargs)
+        # identical requests in flight (and recently completed) share responses
+        self.coalescer = RequestCoalescer(clientSettings.coalesce_window)
 
-    def _schedule_lock_release(self, domain: str, already_elapsed: float):
-        """
-        Given a top-level domain, and the time already elapsed making a successful
-        request, schedule the release of the lock that was set after making the request.
-        We schedule the lock to release after the domain_interval has already passed.
-        This ensures that rate-limits are adhered to, but that the duration of the
-        request/response cycle doesn't increase it.
+        self.metrics = metrics if metrics is not None else InMemoryMetricsSink()
+        self.metrics.add_collector(self._collect_permits)
 
-        Args:
-            domain (str): the specific top-level domain to unlock
-            already_elapsed (float): the time already elapsed between creating the lock
-                and recieving the complete request
-        """
-        logger.debug("Time elapsed during requests: %ss.", already_elapsed)
+        self.decoder = decoder if decoder is not None else JSONDecoder()
 
-        # schedule the release of the domain lock for the given domain
-        if self._using_domain_interval:
-            domain_lock_duration = max(self.domain_interval - already_elapsed, 0)
+        kwargs.setdefault("http2", clientSettings.use_http2())
+        kwargs.setdefault("limits", clientSettings.get_limits())
 
-            def release_domain_lock(task):
-                self._get_domain_lock(domain).release()
-                self._background_tasks.discard(task)
+        super().__init__(**kwargs)
 
-            wait_domain = asyncio.create_task(asyncio.sleep(domain_lock_duration))
-            self._background_tasks.add(wait_domain)
-            wait_domain.add_done_callback(release_domain_lock)
+    def _create_limiter(
+        self, key: str, rate: Optional[float], concurrency: int
+    ) -> RateLimiter:
+        maxSlack = self.clientSettings.priority_max_slack
+        if self.rateLimitBackend is None:
+            return RateLimiter(rate, concurrency, maxSlack)
+        return SharedRateLimiter(
+            self.rateLimitBackend, key, rate, concurrency, maxSlack
+        )
+
+    def _get_domain_limiter(self, domain: str) -> RateLimiter:
+        limiter = self._domain_limiters.get(domain, None)
+        if limiter is None:
+            rate = self.clientSettings.domain_rate
+            if self.rateController is not None:
+                rate = self.rateController.get_rate(domain)
+            limiter = self._create_limiter(domain, rate, self.domain_concurrency)
+            self._domain_limiters[domain] = limiter
+        return limiter
+
+    @property
+    def domain_rates(self) -> Dict[str, Optional[float]]:
+        """
+        The current rate limit (requests per second) of each domain requested.
+        """
+        return {
+            domain: limiter.bucket.rate
+            for domain, limiter in self._domain_limiters.items()
+        }
 
-        # schedule the release of the global lock
+    def _collect_permits(self, metrics: MetricsSink):
+        limiters = list(self._domain_limiters.items())
         if self._using_global_interval:
-            global_lock_duration = max(self.global_interval - already_elapsed, 0)
-
-            def release_global_lock(task):
-                self._global_lock.release()
-                self._background_tasks.discard(task)
-
-            wait_pool = asyncio.create_task(asyncio.sleep(global_lock_duration))
-            self._background_tasks.add(wait_pool)
-            wait_pool.add_done_callback(release_global_lock)
+            limiters.append((GLOBAL_LIMIT_KEY, self._global_limiter))
+        for domain, limiter in limiters:
+            metrics.set(PERMITS_IN_FLIGHT, limiter.in_flight, domain=domain)
+            metrics.set(PERMITS_WAITING, limiter.waiting, domain=domain)
+            metrics.set(PERMIT_CONCURRENCY, limiter.concurrency, domain=domain)
 
-    def _get_domain_lock(self, domain):
-        if self._domain_locks.get(domain, None) is None:
-            self._domain_locks[domain] = asyncio.Semaphore(self.domain_concurrency)
-        return self._domain_locks[domain]
+    def _observe(
+        self,
+        domain: str,
+        response: Optional[Response],
+        error: Optional[Exception],
+        started: float,
+    ):
+        latency = time.monotonic() - started
+        status = response.status_code if response is not None else "error"
+        self.metrics.observe(REQUEST_LATENCY, latency, domain=domain)
+        self.metrics.increment(RESPONSES, domain=domain, status=status)
+        # permits are held from when the request is sent until it is complete
+        self.metrics.increment(PERMIT_BUSY, latency, domain=domain)
+        if response is not None:
+            self.metrics.increment(
+                RESPONSE_BYTES, response.num_bytes_downloaded, domain=domain
+            )
 
-    @wraps(AsyncClient.send)
-    async def send(self, *args, **kwargs):
-        retries = 0
-        url = str(args[0].url)  # get the request url
-        domain = get_top_level_domain(url)
+    async def _adapt_rate(
+        self,
+        domain: str,
+        response: Optional[Response],
+        error: Optional[Exception],
+        started: float,
+    ):
+        """
+        Adjust the rate of a domain to the outcome of a request. With a shared rate
+        limit backend, the rate is adjusted by the backend, so that every process
+        sharing the domain's bucket follows the same rate.
+        """
+        if self.rateController is None:
+            return
+        latency = time.monotonic() - started
+        if self.rateLimitBackend is None:
+            rate = self.rateController.observe(
+                domain, response, latency, started, error
+            )
+            self._get_domain_limiter(domain).bucket.rate = rate
+            return
+
+        throttled, healthy = self.rateController.classify(
+            domain, response, latency, error
+        )
+        if not (throttled or healthy):
+            return
+        rate = await self.rateLimitBackend.adjust_rate(
+            domain, self.rateController, throttled, latency
+        )
+        if rate is None:
+            # the backend is unavailable, so the rate is adjusted in this process
+            reason = error if error is not None else response.status_code
+            rate = self.rateController.adjust(
+                domain, throttled, started, reason, latency
+            )
+        else:
+            self.rateController.set_rate(domain, rate)
+        self._get_domain_limiter(domain).bucket.rate = rate
 
-        # await the lock for that domain
+    async def _acquire_permits(self, domain: str, priority: Optional[float] = None):
+        # await a permit for that domain
         if self._using_domain_interval:
-            domain_lock = self._get_domain_lock(domain)
-            await domain_lock.acquire()
-        # await the lock for the connection pool
+            await self._get_domain_limiter(domain).acquire(priority)
+        # await a permit for the connection pool
         if self._using_global_interval:
-            await self._global_lock.acquire()
-
-        total_elapsed = 0
+            try:
+                await self._global_limiter.acquire(priority)
+            except BaseException:
+                if self._using_domain_interval:
+                    self._get_domain_limiter(domain).release()
+                raise
+
+    def _release_permits(self, domain: str):
+        if self._using_domain_interval:
+            self._get_domain_limiter(domain).release()
+        if self._using_global_interval:
+            self._global_limiter.release()
 
-        # create a task to make the request
-        request = asyncio.create_task(super().send(*args, **kwargs))
+    async def decode_json(self, response: Response) -> Any:
+        """
+        Decode the (read) body of a response as JSON, off the event loop if large.
+        """
+        started = time.monotonic()
+        content = await self.decoder.decode(response.content)
+        self.metrics.observe(
+            DECODE_TIME,
+            time.monotonic() - started,
+            domain=get_rate_limit_key(response.request),
+        )
+        return content
+
+    async def warm_up(self, urls: Iterable[str]):
+        """
+        Open a connection to each url (e.g. each bookmaker's API) ahead of the first
+        real request, so that it doesn't pay for the TCP and TLS handshakes. Each
+        connection is opened with a HEAD request, which isn't retried, and isn't
+        charged to the rate limits (which would otherwise delay the first real
+        request of every worker). Failures are logged and otherwise ignored.
+        """
 
-        response = await request
+        async def connect(url: str):
+            request = self.build_request("HEAD", url)
+            try:
+                response = await AsyncClient.send(self, request)
+                await response.aclose()
+                logger.info(
+                    "Connection to %s warmed up (%s).", url, response.http_version
+                )
+            except httpx.HTTPError as e:
+                logger.warning("Connection to %s couldn't be warmed up (%s).", url, e)
 
-        # we don't schedule the release until the request is returned
+        await asyncio.gather(*(connect(url) for url in urls))
 
-        total_elapsed += response.elapsed.total_seconds()
+    @wraps(AsyncClient.send)
+    async def send(self, request: Request, *args, **kwargs):
+        if not self.clientSettings.coalesce_requests:
+            return await self._send(request, *args, **kwargs)
+
+        def on_coalesced():
+            domain = get_rate_limit_key(request)
+            self.metrics.increment(COALESCED_REQUESTS, domain=domain)
+            logger.debug("Request to %s coalesced.", request.url)
+
+        # streamed requests can be served by a shared (read) response, but their own
+        # responses haven't been read yet, so can't be shared
+        return await self.coalescer.send(
+            request,
+            lambda: self._send(request, *args, **kwargs),
+            on_coalesced,
+            shareable=not kwargs.get("stream", False),
+        )
+
+    async def _send(self, request: Request, *args, **kwargs):
+        """
+        Send a request upstream, waiting for permits and retrying as required.
+        """
+        retries = 0
+        domain = get_rate_limit_key(request)
+        priority = request.extensions.get(PRIORITY_EXTENSION, None)
+
+        # conditional requests need the response body to compare against
+        conditional = request.extensions.get(CONDITIONAL_EXTENSION, False) and (
+            not kwargs.get("stream", False)
+        )
+        if conditional:
+            self.validators.apply(request)
+
+        while True:
+            error = None
+            waitStarted = time.monotonic()
+            await self._acquire_permits(domain, priority)
+            started = time.monotonic()
+            self.metrics.observe(PERMIT_WAIT, started - waitStarted, domain=domain)
+            streamed = False
+            try:
+                response = await super().send(request, *args, **kwargs)
+                streamed = kwargs.get("stream", False)
+            except RETRY_EXCEPTIONS as e:
+                response, error = None, e
+            finally:
+                # the rate is enforced by the token buckets, so the permits can be
+                # released as soon as the request/response cycle is complete. The
+                # body of a streamed response is still to come, so its permits are
+                # held until it is closed
+                if not streamed:
+                    self._release_permits(domain)
+
+            if streamed:
+                self._hold_until_closed(domain, response, started)
+            else:
+                self._observe(domain, response, error, started)
+            await self._adapt_rate(domain, response, error, started)
+
+            if error is None and self._is_complete(response):
+                break
+            if retries >= self.max_retries or not is_retryable(response, error):
+                break
+
+            delay = get_retry_after(response)
+            if delay is None:
+                delay = get_backoff(
+                    retries,
+                    self.clientSettings.backoff_base,
+                    self.clientSettings.backoff_max,
+                )
+            elif delay > self.clientSettings.backoff_max:
+                logger.info(
+                    "Request to %s asked to retry after %ss. Not retrying.",
+                    domain,
+                    delay,
+                )
+                break
 
-        # retry until successful
-        while not response.is_success and retries < self.max_retries:
             logger.info(
-                "Request to %s failed with status code %s. Retries left: %s.",
+                "Request to %s failed (%s). Retrying in %.2fs. Retries left: %s.",
                 domain,
-                response.status_code,
+                error if error is not None else response.status_code,
+                delay,
                 self.max_retries - retries,
             )
             retries += 1
-            await asyncio.sleep(10)
-            request = asyncio.create_task(super().send(*args, **kwargs))
+            self.metrics.increment(RETRIES, domain=domain)
+            self.metrics.observe(RETRY_SLEEP, delay, domain=domain)
+            if response is not None:
+                await response.aclose()
+            # permits aren't held while waiting, so other requests to the same
+            # domain (and to other domains) can continue in the meantime
+            await asyncio.sleep(delay)
 
-            response = await request
-            total_elapsed += response.elapsed.total_seconds()
+        if error is not None:
+            raise error
 
-        # schedule the release of the domain and pool locks
-        self._schedule_lock_release(domain, total_elapsed)
+        if conditional:
+            self.validators.update(request, response)
 
         return response
 
+    def _hold_until_closed(self, domain: str, response: Response, started: float):
+        """
+        Release the permits of a streamed response once it is closed (when read in
+        full, or by the caller), observing its latency and size then.
+        """
+
+        def on_close():
+            self._release_permits(domain)
+            self._observe(domain, response, None, started)
+
+        response.stream = ClosingStream(response.stream, on_close)
+
+    @staticmethod
+    def _is_complete(response: Response) -> bool:
+        return response.is_success or response.status_code == codes.NOT_MODIFIED
+
 
 class CachingClient(RateLimitedClient):
-    def __init__(self, cache_location, *args, **kwargs):
+    def __init__(
+        self,
+        cache_location,
+        *args,
+        max_bytes: Optional[int] = None,
+        default_ttl: Optional[float] = None,
+        ttls: Iterable[Tuple[str, float]] = (),
+        **kwargs,
+    ):
+        """
+        Args:
+            cache_location (str): the directory (relative to the working directory)
+                that responses are cached in
+            max_bytes (Optional[int]): the size budget of the cache. Once exceeded,
+                the least recently used responses are removed. None -> unbounded
+            default_ttl (Optional[float]): seconds before a cached response expires,
+                if no ttl pattern matches the request. None -> never expires
+            ttls (Iterable[Tuple[str, float]]): (regex, seconds) pairs, matched
+                against the url path of each request (first match wins)
+        """
         self.cache_location = os.path.join(os.getcwd(), cache_location)
         self.caching = self.cache_location is not None
+        self.cache = CacheStore(
+            self.cache_location,
+            max_bytes=max_bytes,
+            default_ttl=default_ttl,
+            ttls=ttls,
+        )
         super().__init__(*args, **kwargs)
 
-    def get_filepath(self, request: Request) -> str:
-        filename = hashlib.md5(str(request.url).encode("utf-8")).hexdigest()
-        filepath = os.path.join(self.cache_location, f"{filename}.json")
-        return filepath
-
-    def retrieve_cached_response(self, filepath):
-        with open(filepath, "r") as j:
-            data = json.load(j)
-
-            response = Response(
-                data["response"]["status_code"],
-                json=data["response"]["json"],
-            )
-
-            return response
+    def get_cache_key(self, request: Request) -> str:
+        return self.cache.get_key(str(request.url))
 
-    def construct_cached_response(self, request: Request, response: Response):
-        request = request.__dict__
+    async def retrieve_cached_response(
+        self, data: dict, request: Request, size: Optional[int] = None
+    ) -> Response:
+        """
+        Args:
+            data (dict): the cached document
+            request (Request): the request the response is for
+            size (Optional[int]): the size in bytes of the cached document, used to
+                decide whether to encode the response off the event loop
+        """
+        if "json" not in data["response"]:
+            return Response(data["response"]["status_code"], request=request)
+        content = await self.decoder.encode(data["response"]["json"], size)
+        return Response(
+            data["response"]["status_code"],
+            headers={"Content-Type": "application/json"},
+            content=content,
+            request=request,
+        )
+
+    async def construct_cached_response(
+        self, request: Request, response: Response
+    ) -> dict:
         data = {
-            "url": str(request["url"]),
-            "headers": request.get("headers", {}).__dict__,
+            "url": str(request.url),
+            "headers": dict(request.headers),
             "response": {
                 "status_code": response.status_code,
-                "headers": response.headers.__dict__,
+                "headers": dict(response.headers),
             },
         }
         try:  # if json attached
-            data["response"]["json"] = response.json()
-        except JSONDecodeError:  # no json attached
+            data["response"]["json"] = await self.decoder.decode(response.content)
+        except DecodeError:  # no json attached
             pass
 
         return data
 
     @wraps(RateLimitedClient.send)
-    async def send(self, *args, **kwargs):
-        request: Request = args[0]
-
+    async def send(self, request: Request, *args, **kwargs):
         if self.caching:
-            filepath = self.get_filepath(request)
-
-            if os.path.exists(filepath):
-                return self.retrieve_cached_response(filepath)
-
-        response = await super().send(*args, **kwargs)
-
-        if self.caching:
-            cached_data = self.construct_cached_response(request, response)
-
-            with open(filepath, "w") as j:
-                json.dump(cached_data, j)
+            key = self.get_cache_key(request)
+            cached_data = await self.cache.get(key)
+
+            if cached_data is not None:
+                size = self.cache.get_size(key)
+                return await self.retrieve_cached_response(cached_data, request, size)
+
+        response = await super().send(request, *args, **kwargs)
+
+        # a 304 has no content, and only means something to this client
+        if self.caching and response.status_code != codes.NOT_MODIFIED:
+            # streamed responses are read in full, and replayed to the caller
+            if kwargs.get("stream", False):
+                await response.aread()
+            cached_data = await self.construct_cached_response(request, response)
+            await self.cache.set(key, request.url.path, cached_data)
 
         return response
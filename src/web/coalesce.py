@@ -0,0 +1,167 @@
+import asyncio
+import collections
+import logging
+import time
+from typing import Awaitable, Callable, Hashable, Optional
+
+from httpx import Request, Response
+
+from src.web.limiter import PRIORITY_EXTENSION, RATE_LIMIT_KEY_EXTENSION
+
+logger = logging.getLogger(__name__)
+
+# headers which can change the response to an otherwise identical request
+RELEVANT_HEADERS = (
+    "accept",
+    "accept-encoding",
+    "accept-language",
+    "authorization",
+    "cookie",
+    "if-modified-since",
+    "if-none-match",
+    "user-agent",
+)
+
+# request extensions which only affect how a request is scheduled, not its response
+SCHEDULING_EXTENSIONS = (PRIORITY_EXTENSION, RATE_LIMIT_KEY_EXTENSION)
+
+# headers describing the encoding of the original response body, which no longer
+# apply once the body has been decoded
+ENCODING_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+def copy_response(response: Response, request: Request) -> Response:
+    """
+    Copy a (read) response, so that each caller sharing it gets its own instance.
+    """
+    headers = [
+        (key, value)
+        for key, value in response.headers.multi_items()
+        if key.lower() not in ENCODING_HEADERS
+    ]
+    copy = Response(
+        response.status_code,
+        headers=headers,
+        content=response.content,
+        request=request,
+        extensions=dict(response.extensions),
+    )
+    copy.elapsed = response.elapsed
+    return copy
+
+
+class RequestCoalescer:
+    """
+    Coalesces concurrent identical GET requests into a single upstream request, whose
+    response is shared by every caller. Optionally, successful responses are also
+    reused for identical requests made within `reuse_window` seconds.
+
+    Requests are identical if they have the same url (with query parameters in any
+    order), the same values for each of the `RELEVANT_HEADERS`, and the same
+    extensions (other than the `SCHEDULING_EXTENSIONS`).
+    """
+
+    def __init__(self, reuse_window: float = 0.0):
+        self.reuse_window = reuse_window
+        self._in_flight = dict()
+        self._recent = collections.OrderedDict()
+
+    @staticmethod
+    def get_key(request: Request) -> Optional[Hashable]:
+        if request.method != "GET":
+            return None
+        url = request.url
+        return (
+            url.scheme,
+            url.host,
+            url.port,
+            url.path,
+            tuple(sorted(url.params.multi_items())),
+            tuple(request.headers.get(header, None) for header in RELEVANT_HEADERS),
+            tuple(
+                sorted(
+                    (k, repr(v))
+                    for k, v in request.extensions.items()
+                    if k not in SCHEDULING_EXTENSIONS
+                )
+            ),
+        )
+
+    def _get_recent(self, key: Hashable) -> Optional[Response]:
+        now = time.monotonic()
+        # entries are ordered by expiry, as they all use the same window
+        while self._recent:
+            oldest = next(iter(self._recent))
+            if self._recent[oldest][0] > now:
+                break
+            del self._recent[oldest]
+        recent = self._recent.get(key, None)
+        return recent[1] if recent is not None else None
+
+    def _set_recent(self, key: Hashable, response: Response):
+        if self.reuse_window <= 0 or not response.is_success:
+            return
+        self._recent.pop(key, None)
+        self._recent[key] = (time.monotonic() + self.reuse_window, response)
+
+    async def send(
+        self,
+        request: Request,
+        send: Callable[[], Awaitable[Response]],
+        on_coalesced: Optional[Callable[[], None]] = None,
+        shareable: bool = True,
+    ) -> Response:
+        """
+        Args:
+            request (Request): the request to send
+            send (Callable[[], Awaitable[Response]]): sends the request upstream, and
+                returns the (read) response
+            on_coalesced (Optional[Callable[[], None]]): called if the request was
+                served by another identical request, rather than sent upstream
+            shareable (bool): whether the response from `send` can be shared. If not
+                (e.g. it is streamed), the request can still be served by another
+                identical request, but is otherwise sent upstream on its own
+        """
+        key = self.get_key(request)
+        if key is None:
+            return await send()
+
+        recent = self._get_recent(key)
+        if recent is not None:
+            if on_coalesced:
+                on_coalesced()
+            return copy_response(recent, request)
+
+        shared = self._in_flight.get(key, None)
+        if shared is not None:
+            if on_coalesced:
+                on_coalesced()
+            try:
+                return copy_response(await asyncio.shield(shared), request)
+            except asyncio.CancelledError:
+                if not shared.cancelled():  # we were cancelled
+                    raise
+            # the request we were waiting on was cancelled, so send our own
+            return await self.send(request, send, on_coalesced, shareable)
+
+        if not shareable:
+            return await send()
+
+        shared = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = shared
+        try:
+            response = await send()
+        except asyncio.CancelledError:
+            shared.cancel()
+            raise
+        except BaseException as e:
+            shared.set_exception(e)
+            shared.exception()  # retrieved here, in case nobody else is waiting
+            raise
+        else:
+            shared.set_result(response)
+            self._set_recent(key, response)
+        finally:
+            del self._in_flight[key]
+
+        return response
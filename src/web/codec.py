@@ -0,0 +1,114 @@
+import asyncio
+import json
+import logging
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+
+logger = logging.getLogger(__name__)
+
+# every backend raises a subclass of ValueError for invalid JSON
+DecodeError = ValueError
+
+
+@dataclass(frozen=True)
+class Codec:
+    name: str
+    loads: Callable[[Union[bytes, str]], Any]
+    dumps: Callable[[Any], bytes]
+
+
+def _simplejson_dumps(obj: Any) -> bytes:
+    return simplejson.dumps(obj).encode("utf-8")
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj).encode("utf-8")
+
+
+# available backends, fastest first
+CODECS = dict()
+if orjson is not None:
+    CODECS["orjson"] = Codec("orjson", orjson.loads, orjson.dumps)
+if simplejson is not None:
+    CODECS["simplejson"] = Codec("simplejson", simplejson.loads, _simplejson_dumps)
+CODECS["json"] = Codec("json", json.loads, _json_dumps)
+
+
+def get_codec(name: Optional[str] = None) -> Codec:
+    """
+    Get a JSON codec by name ("orjson", "simplejson" or "json"), or the fastest
+    available if no name is given. Falls back to the fastest available codec if the
+    one named isn't installed.
+    """
+    if name is None:
+        return next(iter(CODECS.values()))
+    codec = CODECS.get(name, None)
+    if codec is None:
+        codec = next(iter(CODECS.values()))
+        logger.warning("JSON codec %s isn't installed. Using %s.", name, codec.name)
+    return codec
+
+
+# the codec used when none is configured
+DEFAULT_CODEC = get_codec()
+
+
+class JSONDecoder:
+    """
+    Decodes (and encodes) JSON with a codec, off the event loop for large documents.
+
+    Documents of at least `threshold` bytes are decoded by `executor` (the event
+    loop's default thread pool if None). Note that the codecs hold the GIL while
+    decoding, so decoding in a thread only lets the event loop run between the
+    interpreter's switch intervals; a process pool avoids blocking the event loop
+    altogether, at the cost of copying the result back.
+    """
+
+    def __init__(
+        self,
+        codec: Optional[Codec] = None,
+        threshold: Optional[int] = 1 << 20,
+        executor: Optional[Executor] = None,
+    ):
+        """
+        Args:
+            codec (Optional[Codec]): the codec, defaults to the fastest available
+            threshold (Optional[int]): the size in bytes from which documents are
+                decoded in the executor. None -> always decoded on the event loop
+            executor (Optional[Executor]): the executor large documents are decoded
+                in
+        """
+        self.codec = codec or DEFAULT_CODEC
+        self.threshold = threshold
+        self.executor = executor
+
+    async def decode(self, content: Union[bytes, str]) -> Any:
+        if self.threshold is None or len(content) < self.threshold:
+            return self.codec.loads(content)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.codec.loads, content)
+
+    async def encode(self, obj: Any, size: Optional[int] = None) -> bytes:
+        """
+        Args:
+            obj (Any): the document to encode
+            size (Optional[int]): the (approximate) size of the encoded document in
+                bytes. None -> not known, so encoded in the executor (if there is a
+                threshold)
+        """
+        if self.threshold is None or (size is not None and size < self.threshold):
+            return self.codec.dumps(obj)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.codec.dumps, obj)
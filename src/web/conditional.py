@@ -0,0 +1,125 @@
+import collections
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+from httpx import Request, Response
+
+
+# request extension used to opt in to conditional requests
+CONDITIONAL_EXTENSION = "conditional"
+# response extension set when the response is the same as the last one
+UNCHANGED_EXTENSION = "unchanged"
+
+
+def is_unchanged(response: Response) -> bool:
+    """
+    Whether a response has the same content as the last response to the same url,
+    either because the server said so (304 Not Modified) or because the body was
+    the same.
+    """
+    return response.status_code == httpx.codes.NOT_MODIFIED or bool(
+        response.extensions.get(UNCHANGED_EXTENSION, False)
+    )
+
+
+@dataclass
+class Validators:
+    etag: Optional[str]
+    last_modified: Optional[str]
+    digest: bytes  # hash of the last response body
+    updated: float  # monotonic time the validators were stored
+
+
+class ValidatorStore:
+    """
+    Remembers the validators (ETag and Last-Modified headers, and a hash of the body)
+    of the last processed response for each url, so that later requests to the same
+    url can be made conditional.
+
+    The validators of a response are only used once it has been processed (see
+    commit), so that a response which failed to be processed isn't taken as
+    unchanged when it's retrieved again. Validators are forgotten after `max_age`
+    seconds, so that a full response is retrieved (and processed) at least that
+    often.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_age: Optional[float] = 3600):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._validators = collections.OrderedDict()
+        # validators of responses which haven't been processed yet, by key
+        self._pending = collections.OrderedDict()
+
+    @staticmethod
+    def get_key(request: Request) -> str:
+        return str(request.url)
+
+    def get(self, request: Request) -> Optional[Validators]:
+        key = self.get_key(request)
+        validators = self._validators.get(key, None)
+        if validators is None:
+            return None
+        if self.max_age is not None and time.monotonic() - validators.updated > (
+            self.max_age
+        ):
+            del self._validators[key]
+            return None
+        self._validators.move_to_end(key)
+        return validators
+
+    def apply(self, request: Request):
+        """
+        Add conditional headers to the request, unless the caller has set them.
+        """
+        validators = self.get(request)
+        if validators is None:
+            return
+        if validators.etag and "If-None-Match" not in request.headers:
+            request.headers["If-None-Match"] = validators.etag
+        if validators.last_modified and "If-Modified-Since" not in request.headers:
+            request.headers["If-Modified-Since"] = validators.last_modified
+
+    def update(self, request: Request, response: Response):
+        """
+        Mark the response as unchanged if it's the same as the last processed
+        response to the same url, and hold on to its validators until it has been
+        processed too (see commit).
+        """
+        if response.status_code == httpx.codes.NOT_MODIFIED:
+            response.extensions[UNCHANGED_EXTENSION] = True
+            return
+        if not response.is_success:
+            return
+
+        digest = hashlib.blake2b(response.content, digest_size=16).digest()
+        previous = self.get(request)
+        if previous is not None and previous.digest == digest:
+            response.extensions[UNCHANGED_EXTENSION] = True
+
+        key = self.get_key(request)
+        self._pending[key] = Validators(
+            response.headers.get("ETag", None),
+            response.headers.get("Last-Modified", None),
+            digest,
+            previous.updated if previous is not None else time.monotonic(),
+        )
+        self._pending.move_to_end(key)
+        # responses which failed to be processed are never committed
+        while len(self._pending) > self.max_entries:
+            self._pending.popitem(last=False)
+
+    def commit(self, key: str):
+        """
+        Use the validators of the last response to a url (by get_key) for later
+        requests, once the response has been processed.
+        """
+        validators = self._pending.pop(key, None)
+        if validators is None:
+            return
+        self._validators[key] = validators
+        self._validators.move_to_end(key)
+        while len(self._validators) > self.max_entries:
+            self._validators.popitem(last=False)
@@ -4,4 +4,6 @@ from enum import Enum
 class WebRequestStatus(Enum):
     SUCCESS = "SUCCESS"
     NOTFOUND = "NOTFOUND"
+    UNCHANGED = "UNCHANGED"  # same as the last response, no need to process it
     OTHER = "OTHER"
+    FAILED = "FAILED"  # the request failed, so nothing is known about the entities
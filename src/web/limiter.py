@@ -0,0 +1,452 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from typing import Dict, Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+
+logger = logging.getLogger(__name__)
+
+# request extension giving the seconds of slack a request has (lower is more urgent)
+PRIORITY_EXTENSION = "priority"
+# request extension giving the key a request is rate limited by (e.g. a precomputed
+# top-level domain)
+RATE_LIMIT_KEY_EXTENSION = "rate_limit_key"
+
+
+class TokenBucket:
+    """
+    A token bucket which refills continuously at `rate` tokens per second, up to
+    `capacity` tokens. Taking a token is O(1) and never blocks; instead the caller is
+    told how long it would need to wait for the next token.
+    """
+
+    def __init__(self, rate: Optional[float], capacity: int = 1, clock=None):
+        """
+        Args:
+            rate (Optional[float]): tokens added per second. None -> unlimited
+            capacity (int): the maximum number of tokens held (the burst size)
+            clock (Callable[[], float]): monotonic clock, in seconds
+        """
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._clock = clock or time.monotonic
+        self._tokens = float(self.capacity)
+        self._updated = self._clock()
+
+    def _refill(self, now: float):
+        if self.rate is None:
+            self._tokens = float(self.capacity)
+        else:
+            elapsed = max(now - self._updated, 0)
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def take(self) -> float:
+        """
+        Attempt to take a single token from the bucket.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the number of seconds until
+                the next token becomes available
+        """
+        self._refill(self._clock())
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Grants permits for a single rate limit key (a top-level domain, or the global
+    pool). A permit is granted when the token bucket has a token available and fewer
+    than `concurrency` permits are currently held.
+
+    Waiters are granted permits earliest deadline first, where a waiter's deadline is
+    the time it was queued plus its priority (in seconds of slack, so lower is more
+    urgent). Slack is capped at `max_slack`, so a low priority request waits behind
+    more urgent requests for at most `max_slack` seconds before it is granted ahead of
+    any request queued after that point. Requests without a priority get `max_slack`.
+
+    Waiters are woken by a single timer per limiter, which is only scheduled while
+    there are waiters and the bucket is empty. No task is created per request.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float],
+        concurrency: int = 1,
+        max_slack: float = 300.0,
+    ):
+        self.concurrency = max(concurrency, 1)
+        self.bucket = TokenBucket(rate, capacity=self.concurrency)
+        self.max_slack = max_slack
+        self._in_flight = 0
+        # heap of (deadline, sequence, future); the sequence keeps equal deadlines
+        # in FIFO order
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _try_grant(self) -> float:
+        """
+        Attempt to take a permit without waiting.
+
+        Returns:
+            float: 0 if a permit was taken, otherwise the number of seconds to wait
+                before trying again (math.inf if blocked on concurrency)
+        """
+        if self._in_flight >= self.concurrency:
+            return math.inf
+        delay = self.bucket.take()
+        if delay == 0:
+            self._in_flight += 1
+        return delay
+
+    def _acquire_nowait(self) -> bool:
+        # nobody is queued ahead of us and a permit is available
+        return not self._waiters and self._try_grant() == 0
+
+    def _get_deadline(self, priority: Optional[float]) -> float:
+        if priority is None:
+            priority = self.max_slack
+        return time.monotonic() + min(max(priority, 0), self.max_slack)
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """
+        Get the most urgent waiter, discarding any cancelled while waiting.
+        """
+        while self._waiters:
+            waiter = self._waiters[0][2]
+            if not waiter.done():
+                return waiter
+            heapq.heappop(self._waiters)
+        return None
+
+    async def acquire(self, priority: Optional[float] = None):
+        """
+        Wait for a permit, which must be given back with `release`.
+
+        Args:
+            priority (Optional[float]): the number of seconds this request can afford
+                to wait behind more urgent requests (lower is more urgent)
+        """
+        if self._acquire_nowait():
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (self._get_deadline(priority), next(self._sequence), waiter)
+        heapq.heappush(self._waiters, entry)
+        self._dispatch()
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # the permit may have been granted in the same iteration as the cancel
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """
+        Grant permits to queued waiters, most urgent first, until either the queue
+        is empty or no permit is available. If the bucket is empty, schedule the
+        timer for when the next token arrives; if the limiter is at its concurrency
+        limit, the next `release` will dispatch again.
+        """
+        while (waiter := self._next_waiter()) is not None:
+            delay = self._try_grant()
+            if delay == math.inf:
+                return
+            if delay > 0:
+                self._schedule(delay)
+                return
+
+            heapq.heappop(self._waiters)
+            waiter.set_result(None)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+
+class LocalRateLimitBackend:
+    """
+    Token buckets held in this process, keyed by rate limit key. Used when no shared
+    backend is available, and as the fallback for a shared backend.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[str, TokenBucket] = dict()
+
+    async def take(self, key: str, rate: float, capacity: int) -> float:
+        bucket = self._buckets.get(key, None)
+        if bucket is None:
+            bucket = TokenBucket(rate, capacity=capacity)
+            self._buckets[key] = bucket
+        bucket.rate = rate
+        bucket.capacity = capacity
+        return bucket.take()
+
+    async def aclose(self):
+        ...
+
+
+# KEYS[1] - the bucket key
+# KEYS[2] - the key of the bucket's shared (adapted) rate, see RATE_SCRIPT
+# ARGV[1] - the refill rate, in tokens per second, unless there is a shared rate
+# ARGV[2] - the bucket capacity
+# Returns 0 if a token was taken, otherwise the seconds until the next token.
+# The server clock is used so that workers on different hosts agree on the time.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local shared = redis.call('HGET', KEYS[2], 'rate')
+if shared then
+    rate = tonumber(shared)
+end
+local capacity = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1])
+local updated = tonumber(bucket[2])
+if tokens == nil or updated == nil then
+    tokens = capacity
+    updated = now
+end
+
+tokens = math.min(capacity, tokens + math.max(now - updated, 0) * rate)
+
+local delay = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    delay = (1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+
+return tostring(delay)
+"""
+
+# KEYS[1] - the key of the shared rate
+# ARGV[1] - the initial rate, if the rate hasn't been adjusted yet
+# ARGV[2] - the minimum rate ('' -> no minimum)
+# ARGV[3] - the maximum rate ('' -> no maximum)
+# ARGV[4] - requests per second added after a healthy response
+# ARGV[5] - the factor the rate is multiplied by after a throttled response
+# ARGV[6] - 1 if the response was throttled, 0 if it was healthy
+# ARGV[7] - the latency of the response, in seconds
+# ARGV[8] - seconds the rate is kept for after it was last adjusted
+# Returns the new rate. A throttled response only decreases the rate if its request
+# was sent after the last decrease (by any worker), going by the server clock.
+RATE_SCRIPT = """
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate') or ARGV[1])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+if ARGV[6] == '1' then
+    local decreased = tonumber(redis.call('HGET', KEYS[1], 'decreased') or '0')
+    if now - tonumber(ARGV[7]) >= decreased then
+        rate = rate * tonumber(ARGV[5])
+        redis.call('HSET', KEYS[1], 'decreased', tostring(now))
+    end
+else
+    rate = rate + tonumber(ARGV[4])
+end
+if ARGV[2] ~= '' then
+    rate = math.max(rate, tonumber(ARGV[2]))
+end
+if ARGV[3] ~= '' then
+    rate = math.min(rate, tonumber(ARGV[3]))
+end
+
+redis.call('HSET', KEYS[1], 'rate', tostring(rate))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[8]))
+
+return tostring(rate)
+"""
+
+
+class RedisRateLimitBackend:
+    """
+    Token buckets held in Redis, shared by every worker process connected to the same
+    server. Each token is taken atomically by a Lua script (requires Redis >= 5).
+
+    Adaptive rates (see adjust_rate) are held next to the buckets, so that every
+    worker refills a bucket at the same rate.
+
+    If Redis cannot be reached, tokens are taken from the fallback backend instead
+    so that requests continue to be limited (per process) until it is back.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        prefix: str = "ratelimit",
+        fallback: Optional[LocalRateLimitBackend] = None,
+        rate_ttl: int = 3600,
+    ):
+        """
+        Args:
+            rate_ttl (int): seconds an adapted rate is kept for after it was last
+                adjusted (the configured rate is used again after that)
+        """
+        self.redis = redis
+        self.prefix = prefix
+        self.fallback = fallback or LocalRateLimitBackend()
+        self.rate_ttl = rate_ttl
+        self._script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        self._rate_script = redis.register_script(RATE_SCRIPT)
+        self._using_fallback = False
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisRateLimitBackend":
+        return cls(Redis.from_url(url), **kwargs)
+
+    def _get_rate_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}:rate"
+
+    async def take(self, key: str, rate: float, capacity: int) -> float:
+        try:
+            delay = await self._script(
+                keys=[f"{self.prefix}:{key}", self._get_rate_key(key)],
+                args=[rate, capacity],
+            )
+        except (RedisError, OSError) as e:
+            self._unavailable(e)
+            return await self.fallback.take(key, rate, capacity)
+
+        self._available()
+        return float(delay)
+
+    async def adjust_rate(
+        self, key: str, controller, throttled: bool, latency: float
+    ) -> Optional[float]:
+        """
+        Adjust the rate shared by every worker limited by the bucket `key`, after a
+        throttled or healthy response (with the increase, decrease and bounds of
+        `controller`, an AdaptiveRateController). As the rate is adjusted in one
+        place, a decrease by one worker isn't undone by the others.
+
+        Returns:
+            Optional[float]: the new rate, or None if Redis couldn't be reached (the
+                caller adjusts its own rate instead)
+        """
+        try:
+            rate = await self._rate_script(
+                keys=[self._get_rate_key(key)],
+                args=[
+                    controller.initial,
+                    controller.floor if controller.floor is not None else "",
+                    controller.ceiling if controller.ceiling is not None else "",
+                    controller.increase,
+                    controller.decrease,
+                    1 if throttled else 0,
+                    latency,
+                    self.rate_ttl,
+                ],
+            )
+        except (RedisError, OSError) as e:
+            self._unavailable(e)
+            return None
+
+        self._available()
+        return float(rate)
+
+    def _unavailable(self, error: Exception):
+        if not self._using_fallback:
+            logger.warning(
+                "Rate limit backend unavailable (%s). Using local fallback.", error
+            )
+            self._using_fallback = True
+
+    def _available(self):
+        if self._using_fallback:
+            logger.info("Rate limit backend available again.")
+            self._using_fallback = False
+
+    async def aclose(self):
+        await self.redis.close()
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    A RateLimiter whose token bucket is held by a rate limit backend, so that the rate
+    is shared with every other process using the same backend and key. Concurrency is
+    still limited per process.
+
+    Taking a token requires a round trip to the backend, so waiters are granted
+    permits by a single pump task per limiter, which runs only while there are
+    waiters.
+    """
+
+    def __init__(
+        self,
+        backend: RedisRateLimitBackend,
+        key: str,
+        rate: Optional[float],
+        concurrency: int = 1,
+        max_slack: float = 300.0,
+    ):
+        super().__init__(rate, concurrency, max_slack)
+        self.backend = backend
+        self.key = key
+        self._pump: Optional[asyncio.Task] = None
+
+    def _acquire_nowait(self) -> bool:
+        if self.bucket.rate is None:
+            return super()._acquire_nowait()
+        return False
+
+    def _dispatch(self):
+        if self.bucket.rate is None:
+            return super()._dispatch()
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.get_running_loop().create_task(self._run_pump())
+
+    async def _run_pump(self):
+        while self._next_waiter() is not None:
+            if self._in_flight >= self.concurrency:
+                return  # the next release will restart the pump
+
+            delay = await self.backend.take(
+                self.key, self.bucket.rate, self.bucket.capacity
+            )
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            # waiters may have been cancelled during the round trip, in which case
+            # the token goes to the next most urgent waiter (or is discarded)
+            waiter = self._next_waiter()
+            if waiter is not None:
+                heapq.heappop(self._waiters)
+                self._in_flight += 1
+                waiter.set_result(None)
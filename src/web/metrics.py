@@ -0,0 +1,225 @@
+import asyncio
+import bisect
+import logging
+import math
+import os
+import tempfile
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# metrics recorded by RateLimitedClient, labelled by domain
+REQUEST_LATENCY = "request_latency_seconds"  # histogram, per attempt
+PERMIT_WAIT = "permit_wait_seconds"  # histogram, time waiting for permits
+RETRY_SLEEP = "retry_sleep_seconds"  # histogram, time slept before each retry
+DECODE_TIME = "decode_seconds"  # histogram, time decoding response bodies
+RESPONSES = "responses_total"  # counter, also labelled by status (or "error")
+RETRIES = "retries_total"  # counter
+RESPONSE_BYTES = "response_bytes_total"  # counter
+COALESCED_REQUESTS = "coalesced_requests_total"  # counter
+PERMIT_BUSY = "permit_busy_seconds_total"  # counter, seconds permits were held
+PERMITS_IN_FLIGHT = "permits_in_flight"  # gauge
+PERMITS_WAITING = "permits_waiting"  # gauge
+PERMIT_CONCURRENCY = "permit_concurrency"  # gauge, the most permits held at once
+
+# upper bounds of the histogram buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf
+)  # fmt: skip
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def get_labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class MetricsSink:
+    """
+    Receives metrics from the client. This sink discards everything; subclass it to
+    send metrics elsewhere.
+
+    Collectors are called before metrics are read, to set gauges which are cheaper
+    to sample than to keep up to date (e.g. the number of queued requests).
+    """
+
+    def increment(self, name: str, value: float = 1, **labels):
+        ...
+
+    def observe(self, name: str, value: float, **labels):
+        ...
+
+    def set(self, name: str, value: float, **labels):
+        ...
+
+    def add_collector(self, collector: Callable[["MetricsSink"], None]):
+        ...
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> List[int]:
+        counts, total = [], 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class InMemoryMetricsSink(MetricsSink):
+    """
+    Holds counters, gauges and histograms in memory, keyed by name and labels.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters: Dict[str, Dict[Labels, float]] = dict()
+        self.gauges: Dict[str, Dict[Labels, float]] = dict()
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = dict()
+        self._collectors = []
+
+    def increment(self, name: str, value: float = 1, **labels):
+        series = self.counters.setdefault(name, dict())
+        key = get_labels(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        series = self.histograms.setdefault(name, dict())
+        key = get_labels(labels)
+        histogram = series.get(key, None)
+        if histogram is None:
+            histogram = Histogram(self.buckets)
+            series[key] = histogram
+        histogram.observe(value)
+
+    def set(self, name: str, value: float, **labels):
+        self.gauges.setdefault(name, dict())[get_labels(labels)] = value
+
+    def add_collector(self, collector: Callable[[MetricsSink], None]):
+        self._collectors.append(collector)
+
+    def collect(self):
+        for collector in self._collectors:
+            collector(self)
+
+    def get(self, name: str, **labels) -> Optional[float]:
+        """
+        Get the value of a counter or gauge, or None if it hasn't been recorded.
+        """
+        key = get_labels(labels)
+        for metrics in (self.counters, self.gauges):
+            if name in metrics:
+                return metrics[name].get(key, None)
+        return None
+
+    def get_histogram(self, name: str, **labels) -> Optional[Histogram]:
+        return self.histograms.get(name, dict()).get(get_labels(labels), None)
+
+
+def format_labels(labels: Labels, extra: Labels = ()) -> str:
+    labels = labels + extra
+    if not labels:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class PrometheusExporter:
+    """
+    Renders an InMemoryMetricsSink in the Prometheus text exposition format, and
+    optionally writes it to a file every `interval` seconds (e.g. for the
+    node_exporter textfile collector).
+    """
+
+    def __init__(
+        self,
+        sink: InMemoryMetricsSink,
+        prefix: str = "arbitrage_client",
+        path: Optional[str] = None,
+        interval: float = 60.0,
+    ):
+        self.sink = sink
+        self.prefix = prefix
+        self.path = path
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def render(self) -> str:
+        self.sink.collect()
+        lines = []
+        for kind, metrics in (
+            ("counter", self.sink.counters),
+            ("gauge", self.sink.gauges),
+        ):
+            for name, series in sorted(metrics.items()):
+                name = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+        for name, series in sorted(self.sink.histograms.items()):
+            name = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(series.items()):
+                for bound, count in zip(
+                    histogram.buckets, histogram.cumulative_counts()
+                ):
+                    le = (("le", format_value(bound)),)
+                    lines.append(f"{name}_bucket{format_labels(labels, le)} {count}")
+                lines.append(
+                    f"{name}_sum{format_labels(labels)} {format_value(histogram.sum)}"
+                )
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """
+        Write the metrics to `path`, atomically so that a reader never sees a
+        partially written file.
+        """
+        directory = os.path.dirname(self.path) or "."
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(descriptor, "w") as file:
+            file.write(self.render())
+        os.replace(temporary, self.path)
+
+    def start(self):
+        if self.path is not None and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.write()
+            except OSError as e:
+                logger.warning("Couldn't write metrics to %s (%s).", self.path, e)
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.path is not None:
+            self.write()
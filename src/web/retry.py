@@ -0,0 +1,76 @@
+import datetime
+import email.utils
+import random
+from typing import Optional
+
+import httpx
+from httpx import Response
+
+
+# status codes worth retrying. 403 is included as bookmakers use it to throttle
+RETRY_STATUS_CODES = frozenset(
+    [
+        httpx.codes.FORBIDDEN,
+        httpx.codes.REQUEST_TIMEOUT,
+        httpx.codes.TOO_EARLY,
+        httpx.codes.TOO_MANY_REQUESTS,
+        httpx.codes.INTERNAL_SERVER_ERROR,
+        httpx.codes.BAD_GATEWAY,
+        httpx.codes.SERVICE_UNAVAILABLE,
+        httpx.codes.GATEWAY_TIMEOUT,
+    ]
+)
+
+# status codes whose Retry-After header is honoured
+RETRY_AFTER_STATUS_CODES = frozenset(
+    [httpx.codes.TOO_MANY_REQUESTS, httpx.codes.SERVICE_UNAVAILABLE]
+)
+
+# transport errors worth retrying (the request may not have reached the server)
+RETRY_EXCEPTIONS = (
+    httpx.TimeoutException,
+    httpx.NetworkError,
+    httpx.RemoteProtocolError,
+)
+
+
+def is_retryable(
+    response: Optional[Response], error: Optional[Exception] = None
+) -> bool:
+    if error is not None:
+        return isinstance(error, RETRY_EXCEPTIONS)
+    return response.status_code in RETRY_STATUS_CODES
+
+
+def get_retry_after(response: Optional[Response]) -> Optional[float]:
+    """
+    Get the number of seconds the server asked us to wait before retrying, from the
+    Retry-After header (either a number of seconds or an HTTP date). None if there
+    isn't one, or it can't be parsed (the computed backoff is used instead).
+    """
+    if response is None or response.status_code not in RETRY_AFTER_STATUS_CODES:
+        return None
+    value = response.headers.get("Retry-After", None)
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+        # dates in "-0000" (an unknown zone) are parsed as naive, and taken as UTC
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return max((date - now).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_backoff(retries: int, base: float, maximum: float) -> float:
+    """
+    Exponential backoff with full jitter: a random delay between zero and
+    base * 2^retries, capped at maximum.
+    """
+    return random.uniform(0, min(maximum, base * 2**retries))
@@ -0,0 +1,97 @@
+from typing import Any, AsyncIterator, Callable, List, Optional
+
+from httpx import AsyncByteStream, Response
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+def select_items(data: Any, prefix: str) -> List[Any]:
+    """
+    Select the items of parsed JSON at an ijson prefix, e.g. "markets.item" selects
+    each element of the "markets" array. Used when the response has already been
+    parsed in full.
+    """
+    nodes = [data]
+    for key in prefix.split(".") if prefix else []:
+        selected = []
+        for node in nodes:
+            if key == "item" and isinstance(node, list):
+                selected.extend(node)
+            elif isinstance(node, dict) and key in node:
+                selected.append(node[key])
+        nodes = selected
+    return nodes
+
+
+class ClosingStream(AsyncByteStream):
+    """
+    Wraps the byte stream of a response, calling `on_close` (once) when it is
+    closed: once read in full, or by the caller.
+    """
+
+    def __init__(self, stream: AsyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close is not None:
+                onClose, self._on_close = self._on_close, None
+                onClose()
+
+
+class ResponseReader:
+    """
+    A file-like wrapper around the byte stream of a response, for ijson.
+    """
+
+    def __init__(self, response: Response):
+        self._chunks = response.aiter_bytes()
+
+    async def read(self, size: int = -1) -> bytes:
+        if size == 0:  # ijson reads nothing first, to check the type of the stream
+            return b""
+        # ijson accepts chunks of any size, so the chunks are returned as received
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return b""
+
+
+async def iter_items(
+    response: Response,
+    prefix: str,
+    itemFilter: Optional[Callable[[Any], bool]] = None,
+) -> AsyncIterator[Any]:
+    """
+    Parse the items at an ijson prefix from a (streamed) response as its body is
+    received, so that only one item is held in memory at a time. If ijson isn't
+    installed, the body is read and parsed in full instead.
+
+    Args:
+        response (Response): the response, which may not have been read yet
+        prefix (str): the ijson prefix of the items, e.g. "markets.item"
+        itemFilter (Optional[Callable[[Any], bool]]): if given, only items for
+            which this returns True are yielded
+    """
+    if ijson is None:
+        await response.aread()
+        for item in select_items(response.json(), prefix):
+            if itemFilter is None or itemFilter(item):
+                yield item
+        return
+
+    # responses which have already been read (e.g. cached) replay their content
+    reader = ResponseReader(response)
+    async for item in ijson.items_async(reader, prefix, use_float=True):
+        if itemFilter is None or itemFilter(item):
+            yield item
@@ -1,15 +1,21 @@
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import sqlalchemy
-from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from taskiq import AsyncBroker, InMemoryBroker, TaskiqEvents, TaskiqState
 from taskiq_aio_pika import AioPikaBroker
 from taskiq_pipelines import PipelineMiddleware
 from taskiq_redis import RedisAsyncResultBackend
 
 import config
-from src.web.client import ClientSettings, RateLimitedClient
+from src.web.api.utils import get_base_urls
+from src.web.cassette import RecordingTransport, ReplayTransport
+from src.web.client import CachingClient, ClientSettings, RateLimitedClient
+from src.web.codec import get_codec, JSONDecoder
+from src.web.limiter import RedisRateLimitBackend
+from src.web.metrics import InMemoryMetricsSink, PrometheusExporter
 from src.database.models import DatabaseModel
 
 
@@ -42,12 +48,87 @@ async def startup(state: TaskiqState) -> None:
     clientSettings.set_global_concurrency(config.GLOBAL_CONCURRENCY_LIMIT)
     # maximum concurrent requests per TLD
     clientSettings.set_domain_concurrency(config.DOMAIN_CONCURRENCY_LIMIT)
+    # adjust the rate of each TLD to its responses
+    if config.ADAPTIVE_DOMAIN_RATE:
+        clientSettings.set_adaptive(config.DOMAIN_RATE_FLOOR, config.DOMAIN_RATE_CEILING)
     # maximum retry per request
     clientSettings.max_retries = config.MAX_RETRIES_PER_REQUEST
+    # backoff between retries
+    clientSettings.set_backoff(config.RETRY_BACKOFF_BASE, config.RETRY_BACKOFF_MAX)
+    # share responses between identical requests
+    clientSettings.coalesce_requests = config.COALESCE_REQUESTS
+    clientSettings.coalesce_window = config.COALESCE_WINDOW
+    # prioritise requests for events starting soon
+    clientSettings.set_priority_max_slack(config.PRIORITY_MAX_SLACK)
+    # connection pooling (sized from the concurrency limits) and HTTP/2
+    clientSettings.set_http2(config.HTTP2, config.KEEPALIVE_EXPIRY)
+    # share rate limits between workers
+    rateLimitBackend = None
+    if config.RATE_LIMIT_BACKEND == "redis":
+        rateLimitBackend = RedisRateLimitBackend.from_url(
+            config.REDIS_URL, prefix=config.RATE_LIMIT_KEY_PREFIX
+        )
+    # per-domain latency, permit wait, retries and responses
+    metrics = InMemoryMetricsSink()
+    if config.METRICS_TEXTFILE is not None:
+        state.metrics_exporter = PrometheusExporter(
+            metrics,
+            path=config.METRICS_TEXTFILE.format(pid=os.getpid()),
+            interval=config.METRICS_EXPORT_INTERVAL,
+        )
+        state.metrics_exporter.start()
+    # decode large responses off the event loop
+    decodeExecutor = None
+    if config.JSON_DECODE_EXECUTOR == "process":
+        decodeExecutor = ProcessPoolExecutor(max_workers=1)
+        state.decode_executor = decodeExecutor
+    decoder = JSONDecoder(
+        get_codec(config.JSON_CODEC), config.JSON_DECODE_THRESHOLD, decodeExecutor
+    )
+    # record responses, or replay recorded responses (still rate limited)
+    clientKwargs = dict()
+    if config.CLIENT_MODE == "record":
+        clientKwargs["transport"] = RecordingTransport(
+            clientSettings.get_transport(),
+            os.path.join(config.CASSETTE_LOCATION, f"{os.getpid()}.jsonl"),
+            codec=decoder.codec,
+        )
+        logger.info("Recording responses to %s.", clientKwargs["transport"].path)
+    elif config.CLIENT_MODE == "replay":
+        clientKwargs["transport"] = ReplayTransport.from_directory(
+            config.CASSETTE_LOCATION, latency_scale=config.REPLAY_LATENCY_SCALE
+        )
+        logger.info(
+            "Replaying %d responses from %s.",
+            len(clientKwargs["transport"]),
+            config.CASSETTE_LOCATION,
+        )
     # create httpx.AsyncClient with rate limits
-    state.client = RateLimitedClient(clientSettings)
+    if config.REQUEST_CACHING:
+        state.client = CachingClient(
+            config.REQUEST_CACHE_LOCATION,
+            clientSettings,
+            rateLimitBackend=rateLimitBackend,
+            metrics=metrics,
+            decoder=decoder,
+            **clientKwargs,
+            max_bytes=config.REQUEST_CACHE_MAX_BYTES,
+            default_ttl=config.REQUEST_CACHE_DEFAULT_TTL,
+            ttls=config.REQUEST_CACHE_TTLS,
+        )
+    else:
+        state.client = RateLimitedClient(
+            clientSettings,
+            rateLimitBackend=rateLimitBackend,
+            metrics=metrics,
+            decoder=decoder,
+            **clientKwargs,
+        )
     logger.info("HTTP client opened (%s).", type(state.client))
-    logger.info("Rate limits: %s", clientSettings)
+    logger.info("Rate limits: %s (backend: %s)", clientSettings, rateLimitBackend)
+
+    if config.WARM_UP_CONNECTIONS and config.CLIENT_MODE != "replay":
+        await state.client.warm_up(get_base_urls())
 
     if not config.USING_DATABASE:
         return
@@ -61,8 +142,17 @@ async def startup(state: TaskiqState) -> None:
         config.DATABASE_CONNECT_STRING,
     )
 
-    state.session = scoped_session(sessionmaker(bind=engine))
-    logger.info("Database session opened.")
+    engine.dispose()
+
+    # each task gets its own session from the pool. Attributes aren't expired on
+    # commit, so tasks can commit (releasing their connection) before requests
+    state.engine = create_async_engine(
+        config.ASYNC_DATABASE_CONNECT_STRING,
+        pool_size=config.DATABASE_POOL_SIZE,
+        max_overflow=config.DATABASE_MAX_OVERFLOW,
+    )
+    state.sessionmaker = async_sessionmaker(state.engine, expire_on_commit=False)
+    logger.info("Async database engine created.")
 
 
 @broker.on_event(TaskiqEvents.WORKER_SHUTDOWN)
@@ -70,11 +160,22 @@ async def shutdown(state: TaskiqState) -> None:
     if hasattr(state, "client"):
         await state.client.aclose()
         logger.info("HTTP client closed (%s).", type(state.client))
+        if state.client.rateLimitBackend is not None:
+            await state.client.rateLimitBackend.aclose()
+            logger.info("Rate limit backend closed.")
     else:
         logger.info("No HTTP client found. Continuing...")
 
-    if hasattr(state, "session"):
-        state.session.close()
-        logger.info("Database session closed.")
+    if hasattr(state, "decode_executor"):
+        state.decode_executor.shutdown(cancel_futures=True)
+        logger.info("JSON decode executor shut down.")
+
+    if hasattr(state, "metrics_exporter"):
+        await state.metrics_exporter.aclose()
+        logger.info("Client metrics written to %s.", state.metrics_exporter.path)
+
+    if hasattr(state, "engine"):
+        await state.engine.dispose()
+        logger.info("Database connection pool closed.")
     else:
-        logger.info("No database session found. Continuing...")
+        logger.info("No database engine found. Continuing...")
@@ -1,11 +1,27 @@
-from taskiq import Context
+from typing import AsyncIterator
+
+from taskiq import Context, TaskiqDepends
 from httpx import AsyncClient
-from sqlalchemy.orm import scoped_session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 def get_client(context: Context) -> AsyncClient:
     return context.state.client
 
 
-def get_session(context: Context) -> scoped_session:
-    return context.state.session
+async def get_session(
+    context: Context = TaskiqDepends(),
+) -> AsyncIterator[AsyncSession]:
+    """
+    A session for a single task, from the worker's connection pool. Use it as a
+    task argument (`session: AsyncSession = TaskiqDepends(get_session)`).
+
+    The session is closed once the task finishes (or fails), which rolls back
+    anything uncommitted, returns its connection to the pool and discards its
+    identity map, so no entities are held on to between tasks.
+    """
+    session = context.state.sessionmaker()
+    try:
+        yield session
+    finally:
+        await session.close()
@@ -1,17 +1,23 @@
 import datetime
 import time
+from decimal import Decimal
 
 import pytest
 
+from src.database.core import insert_outcome_records
 from src.database.models import (
     Bookmaker,
+    OutcomeRecord,
     ReferenceContest,
     ReferenceEvent,
+    ReferenceMarket,
     ReferenceSport,
     SourceContest,
     SourceEvent,
     SourceSport,
 )
+from src.database.records import EventData, MarketData, OutcomeData
+from src.database.utils import deserialize_model, deserialize_models, serialize_model
 
 
 def populate_database(session):
@@ -59,3 +65,105 @@ def test_bookmaker(dbsession):
     assert dbsession.query(ReferenceSport).count() == 9
 
     assert dbsession.query(ReferenceContest).count() == 27
+
+
+@pytest.mark.anyio
+def test_market_data(dbsession):
+    populate_database(dbsession)
+
+    contest = dbsession.query(ReferenceContest).first()
+    event = ReferenceEvent(contest, refnum="1", refname="A v B")
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    marketData = MarketData(
+        "10",
+        "Head To Head",
+        (OutcomeData("A", 1.5, timestamp), OutcomeData("B", 2.5, timestamp)),
+    )
+
+    market = marketData.create(event)
+    dbsession.add_all([event, market])
+    dbsession.commit()
+
+    market = dbsession.query(ReferenceMarket).one()
+    assert market.natural_key == marketData.natural_key
+    assert dbsession.query(OutcomeRecord).count() == 2
+
+    insert_outcome_records(dbsession, market.get_record_rows(marketData))
+    dbsession.commit()
+
+    assert dbsession.query(OutcomeRecord).count() == 4
+
+
+def test_natural_keys():
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    eventData = EventData("1", "A v B", timestamp)
+
+    assert eventData.natural_key == ("1", "A v B", timestamp)
+    # the key is computed again for the replaced fields
+    assert eventData._replace(refname="B v A").natural_key == ("1", "B v A", timestamp)
+
+    marketData = MarketData("10", "Head To Head", (OutcomeData("A", 1.5, timestamp),))
+    assert marketData.natural_key == ("10", "Head To Head")
+    assert marketData.outcomes[0].natural_key == (None, "A")
+
+
+@pytest.mark.anyio
+def test_insert_outcome_records(dbsession):
+    populate_database(dbsession)
+
+    contest = dbsession.query(ReferenceContest).first()
+    event = ReferenceEvent(contest, refnum="1", refname="A v B")
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    marketData = MarketData(
+        "10",
+        "Head To Head",
+        (OutcomeData("A", 1.9, timestamp), OutcomeData("B", 2.1, timestamp)),
+    )
+
+    dbsession.add_all([event, marketData.create(event)])
+    dbsession.commit()
+
+    market = dbsession.query(ReferenceMarket).one()
+    # a market with a different outcome, which has no record
+    otherData = marketData._replace(outcomes=marketData.outcomes[:1])
+    rows = market.get_record_rows(otherData)
+    assert [row[0] for row in rows] == [
+        outcome.id for outcome in market.outcomes if outcome.refname == "A"
+    ]
+
+    insert_outcome_records(dbsession, market.get_record_rows(marketData) + rows)
+    dbsession.commit()
+
+    records = dbsession.query(OutcomeRecord).all()
+    assert len(records) == 5
+    # the returns are those retrieved, rather than the float's binary expansion
+    assert sorted(record.returns for record in records) == [
+        Decimal("1.9"),
+        Decimal("1.9"),
+        Decimal("1.9"),
+        Decimal("2.1"),
+        Decimal("2.1"),
+    ]
+
+
+@pytest.mark.anyio
+def test_serialize_models(dbsession):
+    populate_database(dbsession)
+
+    sports = dbsession.query(ReferenceSport).all()
+    contests = dbsession.query(ReferenceContest).all()
+    models = [contests[3], sports[0], contests[0], sports[5]]
+
+    serialized = [serialize_model(model) for model in models]
+    assert serialized[0] == f"ReferenceContest:{contests[3].id}"
+
+    dbsession.expunge_all()
+    deserialized = deserialize_models(serialized, dbsession)
+    assert [model.id for model in deserialized] == [model.id for model in models]
+    assert isinstance(deserialized[1], ReferenceSport)
+    assert deserialize_model(serialized[2], dbsession).refname == "Soccer Cup"
+
+    with pytest.raises(ValueError):
+        deserialize_model("ReferenceContest:0", dbsession)
+    with pytest.raises(ValueError):
+        deserialize_model("Missing:1", dbsession)
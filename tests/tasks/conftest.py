@@ -1,4 +1,11 @@
 import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import NullPool
+
+import config
+from src.database.models import DatabaseModel
+from src.worker.broker import broker
 
 # get client and database fixtures
 from tests.web.conftest import *  # noqa
@@ -12,3 +19,38 @@ from src.web.api.ladbrokes import Ladbrokes
 async def betapi(caching_client, request):
     model = request.param
     return model(caching_client)
+
+
+@pytest.fixture
+def dbsession(engine, tables):
+    """
+    Returns an sqlalchemy session which commits, and empties every table after the
+    test. Tasks use their own sessions (see task_sessionmaker), which only see
+    what has been committed.
+    """
+    session = scoped_session(sessionmaker(bind=engine))
+
+    yield session
+
+    session.rollback()
+    for table in reversed(DatabaseModel.metadata.sorted_tables):
+        session.execute(table.delete())
+    session.commit()
+    session.close()
+
+
+@pytest.fixture
+async def task_sessionmaker(monkeypatch, engine, tables):
+    """
+    Returns the factory of the async sessions tasks get (on the test database),
+    having given it to the broker.
+    """
+    asyncEngine = create_async_engine(
+        engine.url.set(drivername=config.ASYNC_DATABASE_DRIVER), poolclass=NullPool
+    )
+    sessionmaker = async_sessionmaker(asyncEngine, expire_on_commit=False)
+    monkeypatch.setattr(broker.state, "sessionmaker", sessionmaker, raising=False)
+
+    yield sessionmaker
+
+    await asyncEngine.dispose()
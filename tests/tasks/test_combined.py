@@ -127,8 +127,13 @@ async def test_contests(dbsession, betapi):
 
     stmt = select(ReferenceContest)
     existingContests = dbsession.scalars(stmt).all()
+    existingKeys = {entity.natural_key for entity in existingContests}
 
-    newEntities = list(set(newContests) - set(existingContests))
+    newEntities = [
+        entity.create(item)
+        for entity in newContests
+        if entity.natural_key not in existingKeys
+    ]
 
     dbsession.add_all(newEntities)
 
@@ -152,8 +157,13 @@ async def test_events(dbsession, betapi):
 
     stmt = select(ReferenceEvent)
     existingEvents = dbsession.scalars(stmt).all()
+    existingKeys = {entity.natural_key for entity in existingEvents}
 
-    newEntities = list(set(newEvents) - set(existingEvents))
+    newEntities = [
+        entity.create(item)
+        for entity in newEvents
+        if entity.natural_key not in existingKeys
+    ]
 
     dbsession.add_all(newEntities)
 
@@ -173,7 +183,7 @@ async def test_markets(dbsession, betapi):
 
     response = await betapi.retrieve_markets(item)
 
-    newMarkets = response[1]
+    newMarkets = [market.create(item) for market in response[1]]
 
     dbsession.add_all(newMarkets)
 
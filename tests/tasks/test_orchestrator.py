@@ -0,0 +1,77 @@
+import asyncio
+import timeit
+
+import pytest
+
+from src.orchestrator import Orchestrator, Stage
+from src.worker.broker import broker
+
+completed = dict()
+running = {"now": 0, "max": 0}
+
+
+@broker.task
+async def expand(item: str) -> list:
+    """
+    Sleeps for as long as the item says (e.g. "slow:0.3"), then returns two children.
+    """
+    running["now"] += 1
+    running["max"] = max(running["max"], running["now"])
+    await asyncio.sleep(float(item.rsplit(":", 1)[1]))
+    running["now"] -= 1
+    if item.startswith("fail"):
+        raise ValueError(item)
+    completed[item] = timeit.default_timer()
+    return [f"{item}/{i}:0" for i in range(2)]
+
+
+@broker.task
+async def collect(items: list) -> list:
+    for item in items:
+        completed[item] = timeit.default_timer()
+    return []
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    completed.clear()
+    running.update(now=0, max=0)
+
+
+class TestOrchestrator(object):
+    @pytest.mark.anyio
+    async def test_stages_streamed(self):
+        """
+        Check that the children of a fast task are finished before a slow task of
+        the same stage is.
+        """
+        stages = [Stage("a", expand), Stage("b", expand), Stage("c", collect, 3)]
+        orchestrator = Orchestrator(stages)
+
+        await orchestrator.run(["slow:0.5", "fast:0"])
+
+        assert len(completed) == 2 + 4 + 8
+        assert completed["fast:0/1:0/1:0"] < completed["slow:0.5"]
+        progress = orchestrator.progress
+        assert progress.completed == {"a": 2, "b": 4, "c": 4}
+        assert progress.submitted == progress.completed
+
+    @pytest.mark.anyio
+    async def test_failed_tasks_skipped(self):
+        stages = [Stage("a", expand), Stage("b", expand)]
+        orchestrator = Orchestrator(stages)
+
+        await orchestrator.run(["fail:0", "fast:0"])
+
+        assert orchestrator.progress.failed == {"a": 1}
+        assert orchestrator.progress.completed == {"a": 1, "b": 2}
+
+    @pytest.mark.anyio
+    async def test_max_in_flight(self):
+        stages = [Stage("a", expand), Stage("b", expand)]
+        orchestrator = Orchestrator(stages, maxInFlight=3)
+
+        await orchestrator.run([f"item{i}:0.05" for i in range(6)])
+
+        assert orchestrator.progress.completed == {"a": 6, "b": 12}
+        assert running["max"] == 3
@@ -0,0 +1,154 @@
+import asyncio
+import datetime
+import time
+
+import pytest
+
+from src.database.models import (
+    Bookmaker,
+    ReferenceContest,
+    ReferenceEvent,
+    ReferenceSport,
+)
+from src.scheduler import CONTESTS, EVENTS, MARKETS, RefreshPolicy, Scheduler
+from src.worker.broker import broker
+
+submitted = []
+
+
+@broker.task
+async def record_one(model: str) -> list:
+    submitted.append(model)
+    return []
+
+
+@broker.task
+async def record_many(models: list) -> list:
+    submitted.append(models)
+    await asyncio.sleep(0.05)
+    return []
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    submitted.clear()
+
+
+def utc(seconds: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc)
+
+
+def populate_database(session, now: float) -> dict:
+    """
+    A Ladbrokes contest with events starting in an hour, in ten days and five hours
+    ago, and a Sportsbet contest (whose markets come with its events) with an event
+    starting in two hours.
+    """
+    ladbrokes = Bookmaker("Ladbrokes")
+    sportsbet = Bookmaker("Sportsbet")
+    sport = ReferenceSport(ladbrokes, refnum="6", refname="Basketball")
+    contest = ReferenceContest(sport, refnum="35", refname="NBL")
+    soon = ReferenceEvent(
+        contest, refnum="1", refname="A v B", starttime=utc(now + 3600)
+    )
+    later = ReferenceEvent(
+        contest, refnum="2", refname="C v D", starttime=utc(now + 10 * 86400)
+    )
+    finished = ReferenceEvent(
+        contest, refnum="3", refname="E v F", starttime=utc(now - 5 * 3600)
+    )
+    inlineSport = ReferenceSport(sportsbet, refnum="16", refname="Basketball - US")
+    inlineContest = ReferenceContest(inlineSport, refnum="6927", refname="NBA")
+    inlineEvent = ReferenceEvent(
+        inlineContest, refnum="7", refname="G v H", starttime=utc(now + 7200)
+    )
+    entities = [sport, contest, soon, later, finished]
+    entities += [inlineSport, inlineContest, inlineEvent]
+    for entity in entities:
+        entity.added()
+        entity.lastChecked = utc(now - 60)
+    session.add_all([ladbrokes, sportsbet] + entities)
+    session.commit()
+    return {
+        "sport": sport.id,
+        "contest": contest.id,
+        "soon": soon.id,
+        "later": later.id,
+        "finished": finished.id,
+        "inlineSport": inlineSport.id,
+        "inlineContest": inlineContest.id,
+        "inlineEvent": inlineEvent.id,
+    }
+
+
+def test_market_interval():
+    policy = RefreshPolicy()
+    now = time.time()
+
+    assert policy.get_market_interval(None, now) == policy.market_max_interval
+    assert policy.get_market_interval(utc(now + 30 * 86400), now) == 3600
+    assert policy.get_market_interval(utc(now + 3600), now) == pytest.approx(72)
+    assert policy.get_market_interval(utc(now + 60), now) == 30
+    # in play
+    assert policy.get_market_interval(utc(now - 3600), now) == 30
+    assert policy.get_market_interval(utc(now - 4 * 3600), now) is None
+
+
+def test_load(dbsession):
+    now = time.time()
+    ids = populate_database(dbsession, now)
+    scheduler = Scheduler(dbsession)
+
+    # querying (in a thread) doesn't touch the schedule, until merged
+    entities = scheduler.query(now)
+    assert not scheduler._due and not scheduler.entities
+    scheduler.merge(entities, now)
+
+    # the finished event and the inline event's markets aren't refreshed
+    assert set(scheduler.entities) == {
+        (CONTESTS, ids["sport"]),
+        (CONTESTS, ids["inlineSport"]),
+        (EVENTS, ids["contest"]),
+        (EVENTS, ids["inlineContest"]),
+        (MARKETS, ids["soon"]),
+        (MARKETS, ids["later"]),
+    }
+    # due an interval after they were last checked
+    due = scheduler._due
+    assert due[(MARKETS, ids["soon"])] == pytest.approx(now - 60 + 72)
+    assert due[(MARKETS, ids["later"])] == pytest.approx(now - 60 + 3600)
+    assert due[(EVENTS, ids["contest"])] == pytest.approx(now - 60 + 30 * 60)
+    # as often as the markets of its soonest event
+    assert due[(EVENTS, ids["inlineContest"])] == pytest.approx(now - 60 + 144)
+    assert due[(CONTESTS, ids["sport"])] == pytest.approx(now - 60 + 6 * 60 * 60)
+
+    assert scheduler.pop_due(now) is None
+    assert scheduler.pop_due(now + 72) == (MARKETS, ids["soon"])
+    assert scheduler.pop_due(now + 72) is None
+
+
+@pytest.mark.anyio
+async def test_dispatch_due(dbsession):
+    now = time.time()
+    ids = populate_database(dbsession, now)
+    tasks = {CONTESTS: record_one, EVENTS: record_one, MARKETS: record_many}
+    scheduler = Scheduler(dbsession, maxInFlight=2, tasks=tasks)
+    scheduler.load(now)
+
+    scheduler.schedule((MARKETS, ids["later"]), now)
+
+    # the markets (batched) and the inline contest are the most overdue, and only
+    # two tasks are run at once
+    scheduler.dispatch_due(now + 3600)
+    assert len(scheduler._running) == 2
+    await asyncio.wait(set(scheduler._running))
+
+    entities = scheduler.entities
+    markets = [entities[(MARKETS, ids[name])].model for name in ["later", "soon"]]
+    assert len(submitted) == 2
+    assert markets in submitted
+    assert entities[(EVENTS, ids["inlineContest"])].model in submitted
+    # rescheduled from when they were refreshed, the rest are still due
+    assert scheduler._due[(MARKETS, ids["soon"])] > now + 72
+    assert scheduler._due[(EVENTS, ids["contest"])] < now + 3600
+    assert not scheduler._inFlight
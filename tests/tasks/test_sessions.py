@@ -0,0 +1,90 @@
+import gc
+import logging
+import tracemalloc
+import weakref
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import config
+from src.database.models import ReferenceContest, ReferenceEvent, ReferenceSport
+from src.tasks import get_events
+from src.worker.broker import broker
+from tests.tasks.test_tasks import populate_database
+
+CONCURRENCY = 50  # tasks at once (the in-memory broker keeps 100 results)
+EVENTS = 20  # loaded by each task
+# pydantic caches the strings of the task messages it parses (e.g. task ids), up to
+# a limit, which would otherwise count as growth
+IGNORED = [
+    tracemalloc.Filter(False, "*/pydantic/*"),
+    tracemalloc.Filter(False, "*/tracemalloc.py"),
+]
+
+
+@pytest.mark.anyio
+async def test_sessions_soak(request, monkeypatch, engine, dbsession):
+    """
+    Run --soak-tasks tasks which each load entities, and check that memory stays
+    flat: every task's session is closed (discarding its identity map) and its
+    connection returned to the pool once the task finishes.
+    """
+    soakTasks = request.config.getoption("--soak-tasks")
+    populate_database(dbsession)
+    sport = dbsession.query(ReferenceSport).first()
+    contest = ReferenceContest(sport, refnum="1", refname="Contest")
+    events = [
+        ReferenceEvent(contest, refnum=str(i), refname=f"Event {i}")
+        for i in range(EVENTS)
+    ]
+    for event in events:
+        event.added()
+    dbsession.add_all(events)
+    dbsession.commit()
+
+    asyncEngine = create_async_engine(
+        engine.url.set(drivername=config.ASYNC_DATABASE_DRIVER),
+        pool_size=10,
+        max_overflow=0,
+    )
+    sessionmaker = async_sessionmaker(asyncEngine, expire_on_commit=False)
+    sessions = weakref.WeakSet()
+
+    def create_session():
+        session = sessionmaker()
+        sessions.add(session)
+        return session
+
+    monkeypatch.setattr(broker.state, "sessionmaker", create_session, raising=False)
+    # every task is logged, and captured log records would be held on to
+    logging.disable(logging.INFO)
+
+    async def run_tasks(numTasks: int):
+        for _ in range(numTasks // CONCURRENCY):
+            tasks = [await get_events.kiq(limit=EVENTS) for _ in range(CONCURRENCY)]
+            for task in tasks:
+                result = await task.wait_result(check_interval=0.01)
+                assert len(result.return_value) == EVENTS
+
+    try:
+        tracemalloc.start()
+        # warm up (caches, pool connections) before measuring
+        await run_tasks(soakTasks // 10)
+        gc.collect()
+        startSnapshot = tracemalloc.take_snapshot().filter_traces(IGNORED)
+
+        await run_tasks(soakTasks)
+        gc.collect()
+        endSnapshot = tracemalloc.take_snapshot().filter_traces(IGNORED)
+        tracemalloc.stop()
+
+        assert len(sessions) == 0
+        assert asyncEngine.pool.checkedout() == 0
+        # a leaked session (holding EVENTS entities) per task would be megabytes
+        growth = sum(
+            stat.size_diff for stat in endSnapshot.compare_to(startSnapshot, "filename")
+        )
+        assert growth < 256 * 1024
+    finally:
+        logging.disable(logging.NOTSET)
+        await asyncEngine.dispose()
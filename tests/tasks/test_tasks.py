@@ -1,10 +1,26 @@
 
+import datetime
+
 import pytest
 import respx
+from httpx import Response
+from sqlalchemy import select
 from taskiq import Context
 
+from src.database.enums import Status
+from src.database.utils import get_serialized_id, serialize_model
+from src.orchestrator import iterate_pages
 from src.tasks_example import make_request
-from src.tasks import get_bookmakers, get_sports, get_contests
+from src.tasks import (
+    add_contests,
+    add_events,
+    add_markets_batch,
+    get_bookmakers,
+    get_sports,
+    get_contests,
+    get_events,
+    record_entities,
+)
 from tests import utils
 from src.database.models import (
     Bookmaker,
@@ -18,6 +34,9 @@ from src.database.models import (
     SourceEvent,
     SourceSport,
 )
+from src.database.records import ContestData
+from src.web.api.ladbrokes import Ladbrokes
+from src.web.enums import WebRequestStatus
 
 
 def populate_database(session):
@@ -66,14 +85,9 @@ async def test_make_request_unlimited(monkeypatch, unlimited_client, dbsession):
 
 
 @pytest.mark.anyio
-async def test_get_bookmakers(monkeypatch, dbsession):
+async def test_get_bookmakers(dbsession, task_sessionmaker):
     populate_database(dbsession)
 
-    def get_session(context: Context):
-        return dbsession
-
-    monkeypatch.setattr("src.worker.dependencies.get_session", get_session)
-
     task = await get_bookmakers.kiq()
     result = await task.wait_result()
 
@@ -81,14 +95,9 @@ async def test_get_bookmakers(monkeypatch, dbsession):
 
 
 @pytest.mark.anyio
-async def test_get_sports(monkeypatch, dbsession):
+async def test_get_sports(dbsession, task_sessionmaker):
     populate_database(dbsession)
 
-    def get_session(context: Context):
-        return dbsession
-
-    monkeypatch.setattr("src.worker.dependencies.get_session", get_session)
-
     task = await get_sports.kiq()
     result = await task.wait_result()
 
@@ -96,17 +105,13 @@ async def test_get_sports(monkeypatch, dbsession):
 
 
 @pytest.mark.anyio
-async def test_get_contests(monkeypatch, caching_client, dbsession):
+async def test_get_contests(monkeypatch, caching_client, dbsession, task_sessionmaker):
     populate_database(dbsession)
 
     def get_client(context: Context):
         return caching_client
 
-    def get_session(context: Context):
-        return dbsession
-
     monkeypatch.setattr("src.worker.dependencies.get_client", get_client)
-    monkeypatch.setattr("src.worker.dependencies.get_session", get_session)
 
     task = await get_sports.kiq()
     result = await task.wait_result()
@@ -123,3 +128,452 @@ async def test_get_contests(monkeypatch, caching_client, dbsession):
         await task.wait_result()
 
     assert dbsession.query(ReferenceContest).count() > 0
+
+
+@respx.mock
+@pytest.mark.anyio
+async def test_add_contests_unchanged(
+    monkeypatch, unlimited_client, dbsession, task_sessionmaker
+):
+    """
+    Check that an unchanged contest listing marks the recorded contests as found,
+    without adding them again.
+    """
+    populate_database(dbsession)
+
+    stmt = select(ReferenceSport).where(ReferenceSport.refnum == "16")
+    sport = dbsession.scalars(stmt).one()
+
+    route = respx.get(url__startswith="https://www.sportsbet.com.au")
+    route.side_effect = [
+        Response(
+            200,
+            json=[{"id": 6927, "name": "NBA", "startTime": 1698190200}],
+            headers={"ETag": '"abc"'},
+        ),
+        Response(304),
+    ]
+
+    def get_client(context: Context):
+        return unlimited_client
+
+    monkeypatch.setattr("src.worker.dependencies.get_client", get_client)
+
+    for _ in range(2):
+        task = await add_contests.kiq(serialize_model(sport))
+        result = await task.wait_result()
+        assert not result.is_err
+        # the contest is returned for its events to be added
+        assert len(result.return_value) == 1
+
+    dbsession.expire_all()
+    contests = dbsession.scalars(select(ReferenceContest)).all()
+
+    assert route.call_count == 2
+    assert route.calls.last.request.headers["If-None-Match"] == '"abc"'
+    assert len(contests) == 1
+    assert contests[0].status is Status.CHECKED
+    assert contests[0].lastFound == sport.lastFound
+
+
+@respx.mock
+@pytest.mark.anyio
+async def test_add_contests_failed(
+    monkeypatch, unlimited_client, dbsession, task_sessionmaker
+):
+    """
+    Check that a contest listing which failed to be recorded isn't taken as
+    unchanged when the same listing is retrieved again.
+    """
+    populate_database(dbsession)
+
+    stmt = select(ReferenceSport).where(ReferenceSport.refnum == "16")
+    sport = dbsession.scalars(stmt).one()
+
+    route = respx.get(url__startswith="https://www.sportsbet.com.au")
+    route.mock(
+        return_value=Response(
+            200,
+            json=[{"id": 6927, "name": "NBA", "startTime": 1698190200}],
+            headers={"ETag": '"abc"'},
+        )
+    )
+
+    def get_client(context: Context):
+        return unlimited_client
+
+    monkeypatch.setattr("src.worker.dependencies.get_client", get_client)
+
+    def fail_to_record(*args):
+        raise KeyError("refnum")
+
+    with monkeypatch.context() as m:
+        m.setattr("src.tasks.record_entities", fail_to_record)
+        task = await add_contests.kiq(serialize_model(sport))
+        result = await task.wait_result()
+        assert result.is_err
+
+    task = await add_contests.kiq(serialize_model(sport))
+    result = await task.wait_result()
+    assert not result.is_err
+    assert len(result.return_value) == 1
+
+    assert route.call_count == 2
+    assert "If-None-Match" not in route.calls.last.request.headers
+    assert len(dbsession.scalars(select(ReferenceContest)).all()) == 1
+
+
+def populate_contests(session) -> ReferenceSport:
+    bookmaker = Bookmaker("TAB")
+    sport = ReferenceSport(bookmaker, refnum="4", refname="Basketball")
+    contests = [
+        ReferenceContest(sport, refnum="1", refname="NBL"),
+        ReferenceContest(sport, refnum="2", refname="NBA"),
+    ]
+    for contest in contests:
+        contest.added()
+    session.add_all([bookmaker, sport] + contests)
+    session.commit()
+    return sport
+
+
+def test_record_entities(dbsession):
+    """
+    Check that recorded entities found again are checked, those which weren't are
+    not found, and new entities are added (once, even if retrieved twice).
+    """
+    sport = populate_contests(dbsession)
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    novelContests = [
+        ContestData("1", "NBL"),
+        ContestData("3", "WNBA"),
+        ContestData("3", "WNBA"),
+    ]
+
+    record_entities(
+        dbsession,
+        sport,
+        ReferenceContest,
+        WebRequestStatus.SUCCESS,
+        novelContests,
+        timestamp,
+    )
+    dbsession.commit()
+
+    stmt = select(ReferenceContest).order_by(ReferenceContest.refnum)
+    contests = dbsession.scalars(stmt).all()
+    assert [contest.refnum for contest in contests] == ["1", "2", "3"]
+    assert [contest.status for contest in contests] == [
+        Status.CHECKED,
+        Status.NOT_FOUND,
+        Status.ADDED,
+    ]
+    assert contests[0].lastFound == timestamp
+    assert contests[1].lastChecked == timestamp
+    assert contests[1].lastFound is None
+
+
+def test_record_entities_unchanged(dbsession):
+    """
+    Check that every recorded entity is found if nothing has changed.
+    """
+    sport = populate_contests(dbsession)
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+
+    record_entities(
+        dbsession, sport, ReferenceContest, WebRequestStatus.UNCHANGED, [], timestamp
+    )
+    dbsession.commit()
+
+    contests = dbsession.scalars(select(ReferenceContest)).all()
+    assert len(contests) == 2
+    assert all(contest.status == Status.CHECKED for contest in contests)
+    assert all(contest.lastFound == timestamp for contest in contests)
+
+
+def ladbrokes_event(refnum: str) -> dict:
+    market = {
+        "id": f"{refnum}1",
+        "name": "Head To Head",
+        "children": [
+            {
+                "outcome": {
+                    "id": f"{refnum}{i}",
+                    "name": name,
+                    "children": [{"price": {"priceDec": "1.90"}}],
+                }
+            }
+            for i, name in enumerate(["Home", "Away"])
+        ],
+    }
+    return {"event": {"id": refnum, "children": [{"market": market}]}}
+
+
+@respx.mock
+@pytest.mark.anyio
+async def test_add_markets_batch(
+    monkeypatch, unlimited_client, dbsession, task_sessionmaker
+):
+    """
+    Check that the markets of several Ladbrokes events are added from a single
+    request, and that events missing from the response are marked as not found.
+    """
+    bookmaker = Bookmaker("Ladbrokes")
+    sport = ReferenceSport(bookmaker, refnum="6", refname="Basketball")
+    contest = ReferenceContest(sport, refnum="35", refname="NBL", starttime=None)
+    events = [
+        ReferenceEvent(contest, refnum=str(refnum), refname=str(refnum), starttime=None)
+        for refnum in [101, 102, 103]
+    ]
+    for event in events:
+        event.added()
+    dbsession.add_all([bookmaker, sport, contest] + events)
+    dbsession.commit()
+
+    route = respx.get(path__regex=r"/EventToOutcomeForEvent/101,102,103$")
+    route.mock(
+        return_value=Response(
+            200,
+            json={
+                "SSResponse": {
+                    "children": [
+                        ladbrokes_event("101"),
+                        ladbrokes_event("102"),
+                        {"responseFooter": {}},
+                    ]
+                }
+            },
+        )
+    )
+
+    def get_client(context: Context):
+        return unlimited_client
+
+    monkeypatch.setattr("src.worker.dependencies.get_client", get_client)
+
+    task = await add_markets_batch.kiq([serialize_model(event) for event in events])
+    result = await task.wait_result()
+    assert not result.is_err
+
+    dbsession.expire_all()
+    assert route.call_count == 1
+    assert dbsession.query(ReferenceMarket).count() == 2
+    assert dbsession.query(ReferenceOutcome).count() == 4
+    assert [event.status for event in events] == [
+        Status.CHECKED,
+        Status.CHECKED,
+        Status.NOT_FOUND,
+    ]
+
+
+@respx.mock
+@pytest.mark.anyio
+async def test_add_markets_batch_failed_request(
+    monkeypatch, unlimited_client, dbsession, task_sessionmaker
+):
+    """
+    Check that a failed request only fails the events it was made for: the markets
+    of the other events are still recorded, and the failed events are left as they
+    were (a failed request doesn't mean they've gone).
+    """
+    bookmaker = Bookmaker("Ladbrokes")
+    sport = ReferenceSport(bookmaker, refnum="6", refname="Basketball")
+    contest = ReferenceContest(sport, refnum="35", refname="NBL", starttime=None)
+    events = [
+        ReferenceEvent(contest, refnum=str(refnum), refname=str(refnum), starttime=None)
+        for refnum in [101, 102, 103]
+    ]
+    for event in events:
+        event.added()
+    dbsession.add_all([bookmaker, sport, contest] + events)
+    dbsession.commit()
+
+    monkeypatch.setattr(Ladbrokes, "__max_markets_batch__", 2)
+    route = respx.get(path__regex=r"/EventToOutcomeForEvent/101,102$")
+    route.mock(
+        return_value=Response(
+            200,
+            json={
+                "SSResponse": {
+                    "children": [
+                        ladbrokes_event("101"),
+                        ladbrokes_event("102"),
+                        {"responseFooter": {}},
+                    ]
+                }
+            },
+        )
+    )
+    failedRoute = respx.get(path__regex=r"/EventToOutcomeForEvent/103$")
+    failedRoute.mock(return_value=Response(500))
+
+    def get_client(context: Context):
+        return unlimited_client
+
+    monkeypatch.setattr("src.worker.dependencies.get_client", get_client)
+
+    task = await add_markets_batch.kiq([serialize_model(event) for event in events])
+    result = await task.wait_result()
+    assert not result.is_err
+
+    dbsession.expire_all()
+    assert route.call_count == 1
+    assert failedRoute.call_count == 1
+    assert dbsession.query(ReferenceMarket).count() == 2
+    assert [event.status for event in events] == [
+        Status.CHECKED,
+        Status.CHECKED,
+        Status.ADDED,
+    ]
+    assert events[2].lastChecked is None
+
+
+@respx.mock
+@pytest.mark.anyio
+async def test_add_tab_events_and_markets(
+    monkeypatch, unlimited_client, dbsession, task_sessionmaker
+):
+    """
+    Check that the events and markets of TAB, whose requests are made by the names
+    of the event's contest and sport, are added (the parents aren't lazy loaded).
+    """
+    bookmaker = Bookmaker("TAB")
+    sport = ReferenceSport(bookmaker, refnum="4", refname="Basketball")
+    contest = ReferenceContest(sport, refnum="35", refname="NBL", starttime=None)
+    dbsession.add_all([bookmaker, sport, contest])
+    dbsession.commit()
+
+    baseUrl = "https://api.beta.tab.com.au/v1/tab-info-service/sports/Basketball"
+    eventsRoute = respx.get(f"{baseUrl}/competitions/NBL/matches")
+    eventsRoute.mock(
+        return_value=Response(
+            200,
+            json={
+                "matches": [
+                    {"id": 1, "name": "A v B", "startTime": "2030-01-01T00:00:00Z"}
+                ]
+            },
+        )
+    )
+    marketsRoute = respx.get(f"{baseUrl}/competitions/NBL/matches/A%20v%20B/markets")
+    marketsRoute.mock(
+        return_value=Response(
+            200,
+            json={
+                "markets": [
+                    {
+                        "betOption": "Head To Head",
+                        "betOptionSpectrumId": "1",
+                        "isFuture": False,
+                        "propositions": [
+                            {"name": "A", "returnWin": 1.5},
+                            {"name": "B", "returnWin": 2.5},
+                        ],
+                    }
+                ]
+            },
+        )
+    )
+
+    def get_client(context: Context):
+        return unlimited_client
+
+    monkeypatch.setattr("src.worker.dependencies.get_client", get_client)
+
+    task = await add_events.kiq(serialize_model(contest))
+    result = await task.wait_result()
+    assert not result.is_err
+    assert len(result.return_value) == 1
+
+    task = await add_markets_batch.kiq(result.return_value)
+    result = await task.wait_result()
+    assert not result.is_err
+
+    assert eventsRoute.call_count == 1
+    assert marketsRoute.call_count == 1
+    event = dbsession.scalars(select(ReferenceEvent)).one()
+    assert event.status == Status.CHECKED
+    assert dbsession.query(ReferenceMarket).count() == 1
+    assert dbsession.query(ReferenceOutcome).count() == 2
+
+
+def sportsbet_event(refnum: int) -> dict:
+    return {
+        "id": refnum,
+        "displayName": f"Event {refnum}",
+        "startTime": 1698190200,
+        "eventSort": "MTCH",
+        "marketList": [
+            {
+                "name": name,
+                "selections": [
+                    {"name": "Home", "price": {"winPrice": 1.9}},
+                    {"name": "Away", "price": {"winPrice": 1.9}},
+                ],
+            }
+            for name in ["Match Betting", "Line"]
+        ],
+    }
+
+
+@respx.mock
+@pytest.mark.anyio
+async def test_add_events_with_markets(
+    monkeypatch, unlimited_client, dbsession, task_sessionmaker
+):
+    """
+    Check that Sportsbet events are added along with their head to head markets
+    from a single request (and recorded again from the next), and that their
+    markets aren't requested separately.
+    """
+    populate_database(dbsession)
+
+    stmt = select(ReferenceSport).where(ReferenceSport.refnum == "16")
+    sport = dbsession.scalars(stmt).one()
+    contest = ReferenceContest(sport, refnum="6927", refname="NBA", starttime=None)
+    dbsession.add(contest)
+    dbsession.commit()
+
+    route = respx.get(url__startswith="https://www.sportsbet.com.au")
+    route.mock(
+        return_value=Response(200, json=[sportsbet_event(1), sportsbet_event(2)])
+    )
+
+    def get_client(context: Context):
+        return unlimited_client
+
+    monkeypatch.setattr("src.worker.dependencies.get_client", get_client)
+
+    for _ in range(2):
+        task = await add_events.kiq(serialize_model(contest))
+        result = await task.wait_result()
+        assert not result.is_err
+
+    assert route.call_count == 2
+    assert route.calls.last.request.url.params["includeTopMarkets"] == "true"
+    assert dbsession.query(ReferenceEvent).count() == 2
+    # markets are only added once, with new records for their outcomes
+    assert dbsession.query(ReferenceMarket).count() == 2
+    assert dbsession.query(ReferenceOutcome).count() == 4
+    assert dbsession.query(OutcomeRecord).count() == 8
+
+
+@pytest.mark.anyio
+async def test_get_events_paginated(dbsession, task_sessionmaker):
+    populate_database(dbsession)
+
+    events = []
+    for sport in dbsession.scalars(select(ReferenceSport)).all():
+        contest = ReferenceContest(sport, refnum="1", refname="Contest")
+        for i in range(3):
+            event = ReferenceEvent(contest, refnum=str(i), refname=f"Event {i}")
+            event.added()
+            events.append(event)
+    dbsession.add_all(events)
+    dbsession.commit()
+
+    pages = [page async for page in iterate_pages(get_events, 4)]
+
+    assert [len(page) for page in pages] == [4, 4, 4, 4, 2]
+    ids = [get_serialized_id(model) for page in pages for model in page]
+    assert ids == sorted(event.id for event in events)
@@ -1,6 +1,7 @@
 import pytest
 import config
 from src.web.client import RateLimitedClient, ClientSettings, CachingClient
+from src.web.limiter import RedisRateLimitBackend
 
 
 @pytest.fixture
@@ -31,6 +32,8 @@ async def retry_client():
 @pytest.fixture(params=[17, 23, 31], ids=lambda rate: f"global_rate={rate}")
 async def global_limited_client(request):
     clientSettings: ClientSettings = ClientSettings(request.param, None)
+    # the requests are identical, so would otherwise share a single response
+    clientSettings.coalesce_requests = False
     client = RateLimitedClient(clientSettings)
     yield client
     await client.aclose()
@@ -40,6 +43,36 @@ async def global_limited_client(request):
 async def domain_limited_client(request):
     clientSettings: ClientSettings = ClientSettings(None, request.param)
     clientSettings.set_domain_concurrency(1)
+    # the requests are identical, so would otherwise share a single response
+    clientSettings.coalesce_requests = False
     client = RateLimitedClient(clientSettings)
     yield client
     await client.aclose()
+
+
+@pytest.fixture
+def fake_redis_server():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # required by fakeredis to run scripts
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+async def shared_limited_clients(fake_redis_server):
+    """
+    Two clients (as if in two separate workers) sharing rate limits through the
+    same (fake) redis server.
+    """
+    from fakeredis.aioredis import FakeRedis
+
+    clients = []
+    for _ in range(2):
+        clientSettings: ClientSettings = ClientSettings(None, 10)
+        clientSettings.set_domain_concurrency(1)
+        clientSettings.coalesce_requests = False
+        backend = RedisRateLimitBackend(FakeRedis(server=fake_redis_server))
+        clients.append(RateLimitedClient(clientSettings, rateLimitBackend=backend))
+    yield clients
+    for client in clients:
+        await client.aclose()
+        await client.rateLimitBackend.aclose()
@@ -0,0 +1,135 @@
+import time
+
+import httpx
+import pytest
+import respx
+from httpx import Response
+
+from src.web.adaptive import AdaptiveRateController
+from src.web.client import ClientSettings, RateLimitedClient
+from src.web.limiter import RedisRateLimitBackend
+
+example_url = "https://test.example.com"
+
+
+@pytest.fixture
+def controller():
+    return AdaptiveRateController(1, floor=0.25, ceiling=1.5, increase=0.1)
+
+
+class TestAdaptiveRateController(object):
+    def test_additive_increase(self, controller):
+        for _ in range(3):
+            controller.observe("example", Response(200), 0.1, time.monotonic())
+
+        assert controller.get_rate("example") == pytest.approx(1.3)
+
+        for _ in range(10):
+            controller.observe("example", Response(200), 0.1, time.monotonic())
+
+        assert controller.get_rate("example") == 1.5
+
+    def test_multiplicative_decrease(self, controller):
+        controller.observe("example", Response(429), 0.1, time.monotonic())
+
+        assert controller.get_rate("example") == 0.5
+        assert controller.get_rate("another") == 1
+
+        for _ in range(2):
+            controller.observe("example", Response(403), 0.1, time.monotonic())
+
+        assert controller.get_rate("example") == 0.25
+
+    def test_single_decrease_per_burst(self, controller):
+        """
+        Check that requests started before the last decrease don't decrease the
+        rate again.
+        """
+        started = time.monotonic()
+        for _ in range(3):
+            controller.observe("example", Response(429), 0.1, started)
+
+        assert controller.get_rate("example") == 0.5
+
+    def test_latency_spike(self, controller):
+        for _ in range(5):
+            controller.observe("example", Response(200), 0.1, time.monotonic())
+        rate = controller.get_rate("example")
+
+        controller.observe("example", Response(200), 1, time.monotonic())
+
+        assert controller.get_rate("example") == pytest.approx(rate / 2)
+
+    def test_timeout(self, controller):
+        error = httpx.ReadTimeout("timeout")
+        controller.observe("example", None, 5, time.monotonic(), error)
+
+        assert controller.get_rate("example") == 0.5
+
+    def test_unbounded(self):
+        controller = AdaptiveRateController(1, None, None, increase=0.1)
+
+        controller.observe("example", Response(429), 0.1, time.monotonic())
+        assert controller.get_rate("example") == 0.5
+
+        for _ in range(20):
+            controller.observe("example", Response(200), 0.1, time.monotonic())
+        assert controller.get_rate("example") == pytest.approx(2.5)
+
+
+class TestAdaptiveClient(object):
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_domain_rates(self):
+        clientSettings: ClientSettings = ClientSettings(None, 1)
+        clientSettings.set_adaptive(0.25, 1.5)
+        client = RateLimitedClient(clientSettings)
+
+        route = respx.get(example_url)
+        route.side_effect = [Response(200), Response(429)]
+
+        await client.get(example_url)
+        rate = client.domain_rates["example"]
+
+        assert rate > 1
+
+        await client.get(example_url)
+
+        assert client.domain_rates["example"] == pytest.approx(rate / 2)
+
+        await client.aclose()
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_shared_rate(self, fake_redis_server):
+        """
+        Check that clients sharing a rate limit backend share the adapted rate of a
+        domain, so that a decrease by one isn't undone by the other.
+        """
+        from fakeredis.aioredis import FakeRedis
+
+        clients = []
+        for _ in range(2):
+            clientSettings: ClientSettings = ClientSettings(None, 1)
+            clientSettings.set_adaptive(0.25, 1.5)
+            clientSettings.coalesce_requests = False
+            backend = RedisRateLimitBackend(FakeRedis(server=fake_redis_server))
+            clients.append(RateLimitedClient(clientSettings, rateLimitBackend=backend))
+
+        route = respx.get(example_url)
+        route.side_effect = [Response(200), Response(429), Response(200)]
+
+        await clients[0].get(example_url)
+        await clients[0].get(example_url)
+        rate = clients[0].domain_rates["example"]
+
+        assert rate < 1
+
+        await clients[1].get(example_url)
+
+        increase = clients[1].rateController.increase
+        assert clients[1].domain_rates["example"] == pytest.approx(rate + increase)
+
+        for client in clients:
+            await client.aclose()
+            await client.rateLimitBackend.aclose()
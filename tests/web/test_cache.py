@@ -0,0 +1,134 @@
+import json
+import os
+import time
+
+import pytest
+import respx
+from httpx import Response
+
+from src.web.cache import CacheStore
+from src.web.client import CachingClient, ClientSettings
+
+
+class TestCacheStore(object):
+    @pytest.mark.anyio
+    async def test_sharded(self, tmp_path):
+        store = CacheStore(str(tmp_path))
+        key = store.get_key("https://test.example.com")
+
+        await store.set(key, "/", {"value": 1})
+
+        assert os.path.exists(tmp_path / key[:2] / f"{key}.json")
+        assert (await store.get(key))["value"] == 1
+
+    @pytest.mark.anyio
+    async def test_ttls(self, tmp_path, monkeypatch):
+        """
+        Check that documents expire according to the first ttl pattern matching
+        their path, or the default ttl otherwise.
+        """
+        store = CacheStore(
+            str(tmp_path),
+            default_ttl=100,
+            ttls=[(r"/markets$", 10), (r"/competitions$", 1000)],
+        )
+        now = time.time()
+        for path in ["/markets", "/competitions", "/other"]:
+            await store.set(path, path, {"path": path})
+
+        monkeypatch.setattr(time, "time", lambda: now + 50)
+
+        assert await store.get("/markets") is None
+        assert await store.get("/competitions") is not None
+        assert await store.get("/other") is not None
+
+        monkeypatch.setattr(time, "time", lambda: now + 500)
+
+        assert await store.get("/competitions") is not None
+        assert await store.get("/other") is None
+        assert len(store) == 1
+
+    @pytest.mark.anyio
+    async def test_lru_eviction(self, tmp_path):
+        """
+        Check that the least recently used documents are evicted once the size
+        budget is exceeded.
+        """
+        store = CacheStore(str(tmp_path))
+        await store.set("aa", "/", {"value": 0})
+        size = store.total_bytes
+        store.max_bytes = size * 3
+
+        for key in ["bb", "cc"]:
+            await store.set(key, "/", {"value": 0})
+        await store.get("aa")  # aa is now the most recently used
+        await store.set("dd", "/", {"value": 0})
+
+        assert await store.get("bb") is None
+        for key in ["aa", "cc", "dd"]:
+            assert await store.get(key) is not None
+        assert store.total_bytes <= store.max_bytes
+        assert not os.path.exists(store.get_filepath("bb"))
+
+    @pytest.mark.anyio
+    async def test_index_loaded_from_disk(self, tmp_path):
+        store = CacheStore(str(tmp_path))
+        await store.set("aa", "/", {"value": 1})
+
+        reopened = CacheStore(str(tmp_path))
+
+        assert (await reopened.get("aa"))["value"] == 1
+        assert reopened.total_bytes == store.total_bytes
+
+    @pytest.mark.anyio
+    async def test_failed_write_removed(self, tmp_path, monkeypatch):
+        """
+        Check that a document which couldn't be written doesn't leave its temporary
+        file behind.
+        """
+        store = CacheStore(str(tmp_path))
+
+        def fail(source, destination):
+            raise OSError("No space left on device")
+
+        monkeypatch.setattr(os, "replace", fail)
+        with pytest.raises(OSError):
+            await store.set("aa", "/", {"value": 1})
+
+        assert not list(tmp_path.rglob("*.tmp"))
+
+
+class TestCachingClient(object):
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_cached_response(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        client = CachingClient(".request_cache", ClientSettings(None, None))
+
+        route = respx.get("https://test.example.com")
+        route.mock(return_value=Response(200, json={"value": 1}))
+
+        first = await client.get("https://test.example.com")
+        second = await client.get("https://test.example.com")
+        await client.aclose()
+
+        assert route.call_count == 1
+        assert first.json() == second.json() == {"value": 1}
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_streamed_response_cached(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        client = CachingClient(".request_cache", ClientSettings(None, None))
+
+        route = respx.get("https://test.example.com")
+        route.mock(return_value=Response(200, json={"value": 1}))
+
+        for _ in range(2):
+            async with client.stream("GET", "https://test.example.com") as response:
+                content = b"".join([chunk async for chunk in response.aiter_bytes()])
+                # replayed responses are encoded by the client's codec
+                assert json.loads(content) == {"value": 1}
+        await client.aclose()
+
+        assert route.call_count == 1
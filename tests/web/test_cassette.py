@@ -0,0 +1,75 @@
+import asyncio
+import gzip
+import timeit
+
+import httpx
+import pytest
+from httpx import Response
+
+from src.web.cassette import RecordingTransport, ReplayTransport
+from src.web.client import ClientSettings, RateLimitedClient
+
+example_url = "https://test.example.com/markets"
+
+
+async def recorded_handler(request: httpx.Request) -> Response:
+    await asyncio.sleep(0.1)
+    return Response(
+        200,
+        headers={"Content-Encoding": "gzip", "ETag": '"v1"'},
+        content=gzip.compress(f'{{"page": "{request.url.params["page"]}"}}'.encode()),
+    )
+
+
+@pytest.fixture
+async def cassette_path(tmp_path):
+    """
+    A cassette with one response recorded for each of two pages.
+    """
+    path = str(tmp_path / "cassettes" / "worker.jsonl")
+    transport = RecordingTransport(httpx.MockTransport(recorded_handler), path)
+    async with RateLimitedClient(ClientSettings(None, None), transport=transport) as c:
+        for page in ["1", "2"]:
+            response = await c.get(example_url, params={"page": page, "size": "10"})
+            assert response.json() == {"page": page}
+    return path
+
+
+def create_replay_client(cassette_path, latency_scale=1.0) -> RateLimitedClient:
+    transport = ReplayTransport([cassette_path], latency_scale=latency_scale)
+    return RateLimitedClient(ClientSettings(None, None), transport=transport)
+
+
+class TestCassettes(object):
+    @pytest.mark.anyio
+    async def test_replay(self, cassette_path):
+        async with create_replay_client(cassette_path, latency_scale=0) as client:
+            # query parameters are matched in any order
+            response = await client.get(example_url + "?size=10&page=2")
+
+        assert response.status_code == 200
+        assert response.json() == {"page": "2"}
+        assert response.headers["ETag"] == '"v1"'
+        assert "Content-Encoding" not in response.headers
+
+    @pytest.mark.anyio
+    async def test_recorded_latency(self, cassette_path):
+        for latency_scale, expected in [(1.0, 0.1), (0.5, 0.05)]:
+            async with create_replay_client(cassette_path, latency_scale) as client:
+                startTime = timeit.default_timer()
+                await client.get(example_url, params={"page": "1", "size": "10"})
+                duration = timeit.default_timer() - startTime
+
+            assert duration == pytest.approx(expected, abs=0.04)
+
+    @pytest.mark.anyio
+    async def test_unrecorded_request(self, cassette_path):
+        async with create_replay_client(cassette_path, latency_scale=0) as client:
+            response = await client.get(example_url, params={"page": "3"})
+
+        assert response.status_code == 404
+
+    def test_from_directory(self, cassette_path, tmp_path):
+        transport = ReplayTransport.from_directory(str(tmp_path / "cassettes"))
+
+        assert len(transport) == 2
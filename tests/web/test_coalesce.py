@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+import respx
+from httpx import Response
+
+from src.web.client import ClientSettings, RateLimitedClient
+from src.web.metrics import COALESCED_REQUESTS
+from tests import utils
+
+example_url = "https://test.example.com"
+
+
+@pytest.fixture
+async def coalescing_client():
+    clientSettings: ClientSettings = ClientSettings(None, None)
+    clientSettings.coalesce_window = 0.5
+    client = RateLimitedClient(clientSettings)
+    yield client
+    await client.aclose()
+
+
+class TestCoalescing(object):
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_identical_requests_coalesced(self, unlimited_client):
+        """
+        Check that concurrent identical requests (including the order of their
+        query parameters) are sent upstream once, and all receive the response.
+        """
+        route = respx.get(url__startswith=example_url)
+        route.mock(side_effect=utils.construct_delayed_response(0.1))
+
+        responses = await asyncio.gather(
+            unlimited_client.get(example_url, params=[("a", 1), ("b", 2)]),
+            unlimited_client.get(example_url, params=[("b", 2), ("a", 1)]),
+            unlimited_client.get(example_url, params=[("a", 1), ("b", 2)]),
+        )
+
+        assert route.call_count == 1
+        assert all(response.status_code == 200 for response in responses)
+        assert len(set(id(response) for response in responses)) == 3
+        coalesced = unlimited_client.metrics.get(COALESCED_REQUESTS, domain="example")
+        assert coalesced == 2
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_different_requests_not_coalesced(self, unlimited_client):
+        route = respx.route(url__startswith=example_url)
+        route.mock(side_effect=utils.construct_delayed_response(0.1))
+
+        await asyncio.gather(
+            unlimited_client.get(example_url, params={"a": 1}),
+            unlimited_client.get(example_url, params={"a": 2}),
+            unlimited_client.get(example_url, headers={"User-Agent": "other"}),
+            unlimited_client.get(example_url, extensions={"conditional": True}),
+            unlimited_client.post(example_url),
+        )
+
+        assert route.call_count == 5
+        coalesced = unlimited_client.metrics.get(COALESCED_REQUESTS, domain="example")
+        assert coalesced is None
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_priorities_coalesced(self, unlimited_client):
+        route = respx.get(example_url)
+        route.mock(side_effect=utils.construct_delayed_response(0.1))
+
+        await asyncio.gather(
+            unlimited_client.get(example_url, extensions={"priority": 0}),
+            unlimited_client.get(example_url, extensions={"priority": 60}),
+            unlimited_client.get(example_url),
+        )
+
+        assert route.call_count == 1
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_errors_shared(self, unlimited_client):
+        async def raise_error(request):
+            await asyncio.sleep(0.1)
+            raise ValueError("error")
+
+        route = respx.get(example_url)
+        route.mock(side_effect=raise_error)
+
+        results = await asyncio.gather(
+            unlimited_client.get(example_url),
+            unlimited_client.get(example_url),
+            return_exceptions=True,
+        )
+
+        assert route.call_count == 1
+        assert all(isinstance(result, ValueError) for result in results)
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_cancelled_request_not_shared(self, unlimited_client):
+        """
+        Check that a request waiting on a cancelled identical request sends its own.
+        """
+        route = respx.get(example_url)
+        route.mock(side_effect=utils.construct_delayed_response(0.1))
+
+        first = asyncio.create_task(unlimited_client.get(example_url))
+        second = asyncio.create_task(unlimited_client.get(example_url))
+        await asyncio.sleep(0.05)
+        first.cancel()
+
+        assert (await second).status_code == 200
+        assert first.cancelled()
+        # only completed calls are recorded
+        assert route.call_count == 1
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_reuse_window(self, coalescing_client):
+        route = respx.get(example_url)
+        route.mock(return_value=Response(200, json={"value": 1}))
+
+        await coalescing_client.get(example_url)
+        response = await coalescing_client.get(example_url)
+
+        assert response.json() == {"value": 1}
+        assert route.call_count == 1
+
+        await asyncio.sleep(0.5)
+        await coalescing_client.get(example_url)
+
+        assert route.call_count == 2
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_streamed_requests(self, unlimited_client):
+        """
+        Check that a streamed request is served by an identical (read) request, but
+        that its own response isn't shared, as it hasn't been read.
+        """
+        route = respx.get(example_url)
+        route.mock(side_effect=utils.construct_delayed_response(0.1))
+
+        async def stream():
+            async with unlimited_client.stream("GET", example_url) as response:
+                return await response.aread()
+
+        first, second = await asyncio.gather(
+            unlimited_client.get(example_url), stream()
+        )
+
+        assert route.call_count == 1
+        assert second == first.content
+
+        await asyncio.gather(stream(), stream())
+
+        assert route.call_count == 3
@@ -0,0 +1,78 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import respx
+from httpx import Response
+
+from src.web.codec import CODECS, get_codec, JSONDecoder
+from src.web.metrics import DECODE_TIME
+
+example_url = "https://test.example.com"
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+class TestCodecs(object):
+    @pytest.mark.parametrize("name", list(CODECS))
+    def test_round_trip(self, name):
+        codec = get_codec(name)
+        data = {"markets": [{"name": "Head To Head", "price": 1.85, "id": 1}]}
+
+        assert isinstance(codec.dumps(data), bytes)
+        assert codec.loads(codec.dumps(data)) == data
+        assert codec.loads(codec.dumps(data).decode("utf-8")) == data
+
+    def test_unavailable_codec(self):
+        assert get_codec("unknown") is get_codec()
+
+
+class TestJSONDecoder(object):
+    @pytest.mark.anyio
+    async def test_large_documents_decoded_in_executor(self):
+        executor = CountingExecutor()
+        decoder = JSONDecoder(threshold=100, executor=executor)
+
+        assert await decoder.decode(b'{"a": 1}') == {"a": 1}
+        assert executor.submitted == 0
+
+        large = b"[" + b",".join([b'"abcdefghij"'] * 20) + b"]"
+        assert await decoder.decode(large) == ["abcdefghij"] * 20
+        assert executor.submitted == 1
+
+        executor.shutdown()
+
+    @pytest.mark.anyio
+    async def test_large_documents_encoded_in_executor(self):
+        executor = CountingExecutor()
+        decoder = JSONDecoder(threshold=100, executor=executor)
+
+        assert json.loads(await decoder.encode({"a": 1}, size=8)) == {"a": 1}
+        assert executor.submitted == 0
+
+        # documents of unknown size may be large
+        assert json.loads(await decoder.encode({"a": 1})) == {"a": 1}
+        assert executor.submitted == 1
+
+        executor.shutdown()
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_client_decode(self, unlimited_client):
+        respx.get(example_url).mock(return_value=Response(200, json={"a": [1, 2]}))
+
+        response = await unlimited_client.get(example_url)
+
+        assert await unlimited_client.decode_json(response) == {"a": [1, 2]}
+        histogram = unlimited_client.metrics.get_histogram(
+            DECODE_TIME, domain="example"
+        )
+        assert histogram.count == 1
@@ -0,0 +1,140 @@
+import pytest
+import respx
+from httpx import Response
+
+from src.database.models import Bookmaker, ReferenceSport
+from src.web.api.sportsbet import Sportsbet
+from src.web.conditional import ValidatorStore
+from src.web.enums import WebRequestStatus
+
+example_url = "https://test.example.com"
+
+sportsbet_contests_url = (
+    "https://www.sportsbet.com.au/apigw/sportsbook-sports/Sportsbook/Sports/16"
+    "/Competitions"
+)
+sportsbet_contests = [{"id": 6927, "name": "NBA", "startTime": 1698190200}]
+
+
+class TestConditionalRequests(object):
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_validators_sent(self, unlimited_client):
+        """
+        Check that the validators of the last response are sent with the next
+        conditional request to the same url, and that a 304 is not retried.
+        """
+        route = respx.get(example_url)
+        route.side_effect = [
+            Response(200, json={}, headers={"ETag": '"abc"', "Last-Modified": "x"}),
+            Response(304),
+        ]
+        extensions = {"conditional": True}
+
+        response = await unlimited_client.get(example_url, extensions=extensions)
+        unlimited_client.validators.commit(ValidatorStore.get_key(response.request))
+        response = await unlimited_client.get(example_url, extensions=extensions)
+
+        request = route.calls.last.request
+        assert request.headers["If-None-Match"] == '"abc"'
+        assert request.headers["If-Modified-Since"] == "x"
+        assert response.extensions["unchanged"]
+        assert route.call_count == 2
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_unconditional(self, unlimited_client):
+        route = respx.get(example_url)
+        route.mock(return_value=Response(200, json={}, headers={"ETag": '"abc"'}))
+
+        await unlimited_client.get(example_url)
+        response = await unlimited_client.get(example_url)
+
+        assert "If-None-Match" not in route.calls.last.request.headers
+        assert not response.extensions.get("unchanged", False)
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_same_body_unchanged(self, unlimited_client):
+        """
+        Check that a response with the same body as the last one is marked as
+        unchanged, even if the server doesn't support validators.
+        """
+        route = respx.get(example_url)
+        route.side_effect = [
+            Response(200, json={"value": 1}),
+            Response(200, json={"value": 1}),
+            Response(200, json={"value": 2}),
+        ]
+        extensions = {"conditional": True}
+
+        responses = []
+        for _ in range(3):
+            response = await unlimited_client.get(example_url, extensions=extensions)
+            unlimited_client.validators.commit(ValidatorStore.get_key(response.request))
+            responses.append(response)
+
+        unchanged = [r.extensions.get("unchanged", False) for r in responses]
+        assert unchanged == [False, True, False]
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_uncommitted(self, unlimited_client):
+        """
+        Check that a response whose validators weren't committed (as it failed to be
+        processed) isn't compared against, so the same response is processed again.
+        """
+        route = respx.get(example_url)
+        route.mock(return_value=Response(200, json={}, headers={"ETag": '"abc"'}))
+        extensions = {"conditional": True}
+
+        await unlimited_client.get(example_url, extensions=extensions)
+        response = await unlimited_client.get(example_url, extensions=extensions)
+
+        assert "If-None-Match" not in route.calls.last.request.headers
+        assert not response.extensions.get("unchanged", False)
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_retrieve_contests_unchanged(self, unlimited_client):
+        """
+        Check that an unchanged contest listing is not formatted again.
+        """
+        route = respx.get(url__startswith=sportsbet_contests_url)
+        route.side_effect = [
+            Response(200, json=sportsbet_contests, headers={"ETag": '"abc"'}),
+            Response(304),
+        ]
+        api = Sportsbet(unlimited_client)
+        sport = ReferenceSport(Bookmaker("Sportsbet"), refnum="16")
+
+        status, contests = await api.retrieve_contests(sport)
+        assert status is WebRequestStatus.SUCCESS
+        assert len(contests) == 1
+        api.commit_validators()
+
+        status, contests = await api.retrieve_contests(sport)
+        assert status is WebRequestStatus.UNCHANGED
+        assert contests == []
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_retrieve_contests_not_committed(self, unlimited_client):
+        """
+        Check that a contest listing is retrieved in full again if the last one
+        wasn't processed (its validators weren't committed).
+        """
+        route = respx.get(url__startswith=sportsbet_contests_url)
+        route.mock(
+            return_value=Response(
+                200, json=sportsbet_contests, headers={"ETag": '"abc"'}
+            )
+        )
+        api = Sportsbet(unlimited_client)
+        sport = ReferenceSport(Bookmaker("Sportsbet"), refnum="16")
+
+        for _ in range(2):
+            status, contests = await api.retrieve_contests(sport)
+            assert status is WebRequestStatus.SUCCESS
+            assert len(contests) == 1
+        assert "If-None-Match" not in route.calls.last.request.headers
@@ -0,0 +1,271 @@
+import asyncio
+import timeit
+
+import pytest
+import respx
+from redis.exceptions import ConnectionError
+
+from src.web.adaptive import AdaptiveRateController
+from src.web.limiter import (
+    LocalRateLimitBackend,
+    RateLimiter,
+    RedisRateLimitBackend,
+    TokenBucket,
+)
+from tests import utils
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(object):
+    def test_burst_then_wait(self):
+        """
+        Check that a full bucket allows a burst of `capacity` tokens, after which
+        the caller is told how long until the next token.
+        """
+        clock = FakeClock()
+        bucket = TokenBucket(2, capacity=3, clock=clock)
+
+        assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+        assert bucket.take() == pytest.approx(0.5)
+
+        clock.now += 0.5
+        assert bucket.take() == 0
+
+    def test_refill_capped_at_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(10, capacity=2, clock=clock)
+
+        bucket.take()
+        bucket.take()
+        clock.now += 100
+
+        assert [bucket.take() for _ in range(2)] == [0, 0]
+        assert bucket.take() > 0
+
+    def test_unlimited(self):
+        bucket = TokenBucket(None, capacity=1)
+
+        assert all(bucket.take() == 0 for _ in range(100))
+
+
+class TestRateLimiter(object):
+    @pytest.mark.anyio
+    async def test_rate_adhered(self):
+        """
+        Check that queued acquirers are granted permits at the bucket rate.
+        """
+        limiter = RateLimiter(20, concurrency=1)
+
+        async def acquire_release():
+            await limiter.acquire()
+            limiter.release()
+
+        startTime = timeit.default_timer()
+        await asyncio.gather(*[acquire_release() for _ in range(11)])
+        time_elapsed = timeit.default_timer() - startTime
+
+        # 1 immediately, then 10 more at 20 per second
+        assert time_elapsed >= 0.5
+        assert time_elapsed < 0.75
+
+    @pytest.mark.anyio
+    async def test_concurrency_adhered(self):
+        """
+        Check that no more than `concurrency` permits are held at once, even if
+        the bucket has tokens to spare.
+        """
+        limiter = RateLimiter(None, concurrency=3)
+        maximum = 0
+
+        async def hold():
+            nonlocal maximum
+            await limiter.acquire()
+            maximum = max(maximum, limiter.in_flight)
+            await asyncio.sleep(0.01)
+            limiter.release()
+
+        await asyncio.gather(*[hold() for _ in range(20)])
+
+        assert maximum == 3
+        assert limiter.in_flight == 0
+
+    @pytest.mark.anyio
+    async def test_no_task_per_request(self):
+        """
+        Check that queued requests don't create any tasks of their own.
+        """
+        limiter = RateLimiter(1000, concurrency=1)
+        waiters = [asyncio.ensure_future(limiter.acquire()) for _ in range(100)]
+        await asyncio.sleep(0)
+
+        assert asyncio.all_tasks() - set(waiters) == {asyncio.current_task()}
+        assert limiter.waiting == 99
+
+        for waiter in waiters:
+            await waiter
+            limiter.release()
+
+    @pytest.mark.anyio
+    async def test_cancelled_waiter_skipped(self):
+        limiter = RateLimiter(None, concurrency=1)
+        await limiter.acquire()
+
+        cancelled = asyncio.ensure_future(limiter.acquire())
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        limiter.release()
+
+        await asyncio.wait_for(waiting, 1)
+
+        assert cancelled.cancelled()
+        assert limiter.in_flight == 1
+
+    @pytest.mark.anyio
+    async def test_priority_order(self):
+        """
+        Check that queued requests are granted permits most urgent first.
+        """
+        limiter = RateLimiter(None, concurrency=1, max_slack=300)
+        await limiter.acquire()
+
+        order = []
+
+        async def request(name, priority):
+            await limiter.acquire(priority)
+            order.append(name)
+            limiter.release()
+
+        tasks = [
+            asyncio.ensure_future(request("crawl", None)),
+            asyncio.ensure_future(request("later", 3600)),
+            asyncio.ensure_future(request("soon", 60)),
+            asyncio.ensure_future(request("started", 0)),
+        ]
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+
+        # slack is capped, so "later" is queued alongside "crawl" (in FIFO order)
+        assert order == ["started", "soon", "crawl", "later"]
+
+    @pytest.mark.anyio
+    async def test_low_priority_not_starved(self):
+        """
+        Check that a low priority request is granted a permit once it has waited
+        `max_slack` seconds, even while more urgent requests keep arriving.
+        """
+        limiter = RateLimiter(20, concurrency=1, max_slack=0.5)
+        await limiter.acquire()
+        crawl = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+
+        # urgent requests arrive faster than the rate, so there is always a backlog
+        urgent = []
+        startTime = timeit.default_timer()
+        while not crawl.done() and timeit.default_timer() - startTime < 3:
+            urgent.extend(asyncio.ensure_future(limiter.acquire(0)) for _ in range(2))
+            await asyncio.sleep(0.05)
+            if limiter.in_flight:
+                limiter.release()
+
+        assert crawl.done()
+        # urgent requests queued after the crawl request's deadline are still waiting
+        assert any(not task.done() for task in urgent)
+
+        for task in urgent:
+            task.cancel()
+
+
+class TestRedisRateLimitBackend(object):
+    @pytest.mark.anyio
+    async def test_bucket_shared(self, fake_redis_server):
+        """
+        Check that two backends connected to the same server take tokens from the
+        same bucket.
+        """
+        from fakeredis.aioredis import FakeRedis
+
+        first = RedisRateLimitBackend(FakeRedis(server=fake_redis_server))
+        second = RedisRateLimitBackend(FakeRedis(server=fake_redis_server))
+
+        assert await first.take("example", 1, 2) == 0
+        assert await second.take("example", 1, 2) == 0
+        assert await first.take("example", 1, 2) > 0
+        assert await second.take("example", 1, 2) > 0
+        # a different key has its own bucket
+        assert await second.take("another", 1, 2) == 0
+
+    @pytest.mark.anyio
+    async def test_shared_rate(self, fake_redis_server):
+        """
+        Check that an adjusted rate is shared, and that buckets refill at it rather
+        than at the rate of the worker taking a token.
+        """
+        from fakeredis.aioredis import FakeRedis
+
+        first = RedisRateLimitBackend(FakeRedis(server=fake_redis_server))
+        second = RedisRateLimitBackend(FakeRedis(server=fake_redis_server))
+        controller = AdaptiveRateController(1, 0.25, 1.5, increase=0.1)
+
+        assert await first.adjust_rate("example", controller, True, 0) == 0.5
+        # requests sent before the last decrease don't decrease the rate again
+        assert await second.adjust_rate("example", controller, True, 60) == 0.5
+        assert await second.adjust_rate("example", controller, False, 0) == 0.6
+
+        assert await second.take("example", 10, 1) == 0
+        assert await second.take("example", 10, 1) == pytest.approx(1 / 0.6, 0.01)
+
+    @pytest.mark.anyio
+    async def test_fallback(self):
+        """
+        Check that tokens are taken from the local fallback if redis is unavailable.
+        """
+
+        class UnavailableScript(object):
+            async def __call__(self, *args, **kwargs):
+                raise ConnectionError("unavailable")
+
+        class UnavailableRedis(object):
+            def register_script(self, script):
+                return UnavailableScript()
+
+        fallback = LocalRateLimitBackend()
+        backend = RedisRateLimitBackend(UnavailableRedis(), fallback=fallback)
+
+        assert await backend.take("example", 1, 1) == 0
+        assert await backend.take("example", 1, 1) > 0
+        # adaptive rates are adjusted locally instead
+        controller = AdaptiveRateController(1, 0.25, 1.5)
+        assert await backend.adjust_rate("example", controller, True, 0.1) is None
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_domain_limits_shared(self, shared_limited_clients):
+        """
+        Check that the domain rate limit is adhered to across two clients sharing
+        a backend, rather than each client getting the full rate.
+        """
+        route = respx.get("https://test.example.com")
+        route.mock(side_effect=utils.construct_delayed_response(0))
+
+        startTime = timeit.default_timer()
+
+        async with asyncio.TaskGroup() as tg:
+            for client in shared_limited_clients:
+                for _ in range(8):
+                    tg.create_task(client.get("https://test.example.com"))
+
+        time_elapsed = timeit.default_timer() - startTime
+
+        # 16 requests at 10 per second, with a burst of 1
+        assert route.call_count == 16
+        assert time_elapsed >= 1.5
+        assert time_elapsed < 2.5
@@ -0,0 +1,96 @@
+import pytest
+import respx
+from httpx import Response
+
+from src.web.client import ClientSettings, GLOBAL_LIMIT_KEY, RateLimitedClient
+from src.web.metrics import (
+    InMemoryMetricsSink,
+    PERMIT_WAIT,
+    PERMITS_IN_FLIGHT,
+    PrometheusExporter,
+    REQUEST_LATENCY,
+    RESPONSE_BYTES,
+    RESPONSES,
+    RETRIES,
+)
+
+example_url = "https://test.example.com"
+
+
+class TestInMemoryMetricsSink(object):
+    def test_counters_and_histograms(self):
+        sink = InMemoryMetricsSink(buckets=(0.1, 1, float("inf")))
+
+        sink.increment("requests", domain="example")
+        sink.increment("requests", 2, domain="example")
+        sink.increment("requests", domain="another")
+        for value in (0.05, 0.1, 0.5, 5):
+            sink.observe("latency", value, domain="example")
+
+        assert sink.get("requests", domain="example") == 3
+        assert sink.get("requests", domain="another") == 1
+        assert sink.get("requests", domain="unknown") is None
+
+        histogram = sink.get_histogram("latency", domain="example")
+        assert histogram.cumulative_counts() == [2, 3, 4]
+        assert histogram.sum == pytest.approx(5.65)
+        assert histogram.count == 4
+
+    def test_prometheus_text(self):
+        sink = InMemoryMetricsSink(buckets=(0.1, float("inf")))
+        sink.increment("responses_total", domain="example", status=200)
+        sink.set("permits_in_flight", 2, domain='say "hi"')
+        sink.observe("latency_seconds", 0.25, domain="example")
+
+        text = PrometheusExporter(sink, prefix="test").render()
+
+        assert text.splitlines() == [
+            "# TYPE test_responses_total counter",
+            'test_responses_total{domain="example",status="200"} 1',
+            "# TYPE test_permits_in_flight gauge",
+            'test_permits_in_flight{domain="say \\"hi\\""} 2',
+            "# TYPE test_latency_seconds histogram",
+            'test_latency_seconds_bucket{domain="example",le="0.1"} 0',
+            'test_latency_seconds_bucket{domain="example",le="+Inf"} 1',
+            'test_latency_seconds_sum{domain="example"} 0.25',
+            'test_latency_seconds_count{domain="example"} 1',
+        ]
+
+    def test_write(self, tmp_path):
+        sink = InMemoryMetricsSink()
+        sink.increment("responses_total", domain="example")
+        path = tmp_path / "metrics.prom"
+
+        PrometheusExporter(sink, path=str(path)).write()
+
+        assert "responses_total" in path.read_text()
+
+
+class TestClientMetrics(object):
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_requests_recorded(self):
+        clientSettings: ClientSettings = ClientSettings(10, 10)
+        clientSettings.set_max_retries(1)
+        clientSettings.set_backoff(0, 0)
+        client = RateLimitedClient(clientSettings)
+
+        route = respx.get(example_url)
+        route.side_effect = [Response(503), Response(200, content=b"12345")]
+
+        await client.get(example_url)
+        metrics = client.metrics
+
+        assert metrics.get(RESPONSES, domain="example", status=503) == 1
+        assert metrics.get(RESPONSES, domain="example", status=200) == 1
+        assert metrics.get(RETRIES, domain="example") == 1
+        assert metrics.get(RESPONSE_BYTES, domain="example") == 5
+        assert metrics.get_histogram(REQUEST_LATENCY, domain="example").count == 2
+        assert metrics.get_histogram(PERMIT_WAIT, domain="example").count == 2
+
+        metrics.collect()
+
+        assert metrics.get(PERMITS_IN_FLIGHT, domain="example") == 0
+        assert metrics.get(PERMITS_IN_FLIGHT, domain=GLOBAL_LIMIT_KEY) == 0
+
+        await client.aclose()
@@ -1,10 +1,18 @@
 import asyncio
+import datetime
+import email.utils
 import timeit
 
+import httpx
 import pytest
 import respx
 from httpx import Response
 
+from src.web.api.ladbrokes import Ladbrokes
+from src.web.api.tab import Tab
+from src.web.client import ClientSettings, get_top_level_domain, RateLimitedClient
+from src.web.retry import get_retry_after
+
 from tests import utils
 
 example_urls = [
@@ -74,6 +82,116 @@ class TestRetries(object):
         assert response.status_code == 403
         assert route.call_count == 3
 
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_not_retryable(self, retry_client):
+        """
+        Check that responses which won't succeed on a retry (e.g. 404) are
+        returned without retrying.
+        """
+        route = respx.get(example_urls[0])
+        route.side_effect = [Response(404), Response(200)]
+
+        response = await retry_client.get(example_urls[0])
+
+        assert response.status_code == 404
+        assert route.call_count == 1
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_transport_errors_retried(self, retry_client):
+        route = respx.get(example_urls[0])
+        route.side_effect = [httpx.ConnectTimeout, httpx.ReadError, Response(200)]
+
+        response = await retry_client.get(example_urls[0])
+
+        assert response.status_code == 200
+        assert route.call_count == 3
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_transport_errors_raised(self, retry_client):
+        route = respx.get(example_urls[0])
+        route.side_effect = httpx.ConnectTimeout
+
+        with pytest.raises(httpx.ConnectTimeout):
+            await retry_client.get(example_urls[0])
+
+        assert route.call_count == 3
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_retry_after(self, retry_client):
+        """
+        Check that Retry-After is honoured, unless it exceeds the maximum backoff.
+        """
+        route = respx.get(example_urls[0])
+        route.side_effect = [
+            Response(429, headers={"Retry-After": "1"}),
+            Response(200),
+            Response(503, headers={"Retry-After": "3600"}),
+        ]
+
+        startTime = timeit.default_timer()
+        response = await retry_client.get(example_urls[0])
+        time_elapsed = timeit.default_timer() - startTime
+
+        assert response.status_code == 200
+        assert 1 <= time_elapsed < 1.5
+
+        response = await retry_client.get(example_urls[0])
+
+        assert response.status_code == 503
+        assert route.call_count == 3
+
+    def test_retry_after_dates(self):
+        """
+        Check that Retry-After dates are parsed whatever their zone (dates in
+        "-0000" are naive, and taken as UTC), and that invalid ones are ignored.
+        """
+        later = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            seconds=60
+        )
+        # "... GMT" and "... -0000" (formatted from a naive datetime)
+        for value in [
+            email.utils.format_datetime(later, usegmt=True),
+            email.utils.format_datetime(later.replace(tzinfo=None)),
+        ]:
+            response = Response(429, headers={"Retry-After": value})
+            assert 55 < get_retry_after(response) <= 60
+
+        past = "Mon, 01 Jan 2001 00:00:00 -0000"
+        assert get_retry_after(Response(503, headers={"Retry-After": past})) == 0
+        assert get_retry_after(Response(503, headers={"Retry-After": "soon"})) is None
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_permits_released_during_backoff(self):
+        """
+        Check that a request waiting to retry doesn't hold the permits for its
+        domain, so that other requests to the domain can proceed.
+        """
+        clientSettings = ClientSettings(None, 100)
+        clientSettings.set_max_retries(1)
+        client = RateLimitedClient(clientSettings)
+
+        flaky = respx.get(example_urls[0] + "/flaky")
+        flaky.side_effect = [Response(503, headers={"Retry-After": "1"}), Response(200)]
+        healthy = respx.get(example_urls[0] + "/healthy")
+        healthy.mock(return_value=Response(200))
+
+        flaky_request = asyncio.create_task(client.get(example_urls[0] + "/flaky"))
+        await asyncio.sleep(0.1)
+
+        startTime = timeit.default_timer()
+        await client.get(example_urls[0] + "/healthy")
+        time_elapsed = timeit.default_timer() - startTime
+
+        assert (await flaky_request).status_code == 200
+        assert time_elapsed < 0.5
+
+        await client.aclose()
+
 
 class TestRateLimits(object):
     @respx.mock
@@ -152,3 +270,84 @@ class TestRateLimits(object):
 
         assert time_elapsed >= time_needed
         assert time_elapsed < time_needed + 1
+
+
+class TestConnections(object):
+    def test_limits_from_settings(self):
+        clientSettings: ClientSettings = ClientSettings(10, 1)
+        clientSettings.set_global_concurrency(6)
+        clientSettings.set_http2(False, keepalive_expiry=30)
+
+        limits = clientSettings.get_limits()
+
+        assert limits.max_connections == 6
+        assert limits.max_keepalive_connections == 6
+        assert limits.keepalive_expiry == 30
+
+    @pytest.mark.anyio
+    async def test_http2_fallback(self, monkeypatch):
+        """
+        Check that the client falls back to HTTP/1.1 if h2 isn't installed.
+        """
+        monkeypatch.setattr("src.web.client.h2", None)
+        clientSettings: ClientSettings = ClientSettings(None, None)
+        clientSettings.set_http2(True)
+
+        async with RateLimitedClient(clientSettings) as client:
+            assert client._transport._pool._http2 is False
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_warm_up(self, retry_client):
+        """
+        Check that each url is requested once, and that failures are ignored.
+        """
+        first = respx.head(example_urls[0]).mock(return_value=Response(404))
+        second = respx.head(example_urls[1]).mock(side_effect=httpx.ConnectError)
+
+        await retry_client.warm_up(example_urls)
+
+        assert first.call_count == 1
+        assert second.call_count == 1
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_warm_up_not_limited(self):
+        """
+        Check that warming up doesn't take permits from the domain's rate limit.
+        """
+        respx.head(example_urls[0]).mock(return_value=Response(200))
+
+        async with RateLimitedClient(ClientSettings(None, 1)) as client:
+            await client.warm_up(example_urls[:1])
+
+            assert client.domain_rates == {}
+
+
+class TestRateLimitKeys(object):
+    def test_top_level_domain(self):
+        assert get_top_level_domain("https://api.beta.tab.com.au/v1") == "tab"
+        assert get_top_level_domain("https://www.example.co.uk/a?b=1") == "example"
+        assert get_top_level_domain("test.example.com/path") == "example"
+
+    def test_bookmaker_keys(self):
+        assert Tab.get_rate_limit_key() == "tab"
+        assert Ladbrokes.get_rate_limit_key() == "ladbrokes"
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_rate_limit_key_extension(self, domain_limited_client):
+        """
+        Check that requests with the same rate limit key share a limiter, whatever
+        their domain.
+        """
+        respx.get(url__startswith=example_urls[0]).mock(return_value=Response(200))
+        respx.get(url__startswith=example_urls[1]).mock(return_value=Response(200))
+
+        for url in example_urls:
+            await domain_limited_client.get(
+                url, extensions={"rate_limit_key": "shared"}
+            )
+        await domain_limited_client.get(example_urls[0])
+
+        assert set(domain_limited_client.domain_rates) == {"shared", "example"}
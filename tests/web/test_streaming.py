@@ -0,0 +1,117 @@
+import pytest
+import respx
+from httpx import Response
+
+from src.web.api.ladbrokes import Ladbrokes
+from src.web.api.tab import Tab
+from src.web.client import ClientSettings, RateLimitedClient
+from src.web.metrics import RESPONSE_BYTES
+from src.web.streaming import select_items
+
+example_url = "https://test.example.com"
+
+tab_markets = {
+    "markets": [
+        {"betOption": "Head To Head", "isFuture": False, "propositions": []},
+        {"betOption": "Line", "isFuture": False, "propositions": []},
+        {"betOption": "Head To Head", "isFuture": True, "propositions": []},
+    ]
+}
+
+ladbrokes_markets = {
+    "SSResponse": {
+        "children": [
+            {
+                "event": {
+                    "id": "1",
+                    "children": [{"market": {"id": "2", "price": 1.5}}],
+                }
+            },
+            {"responseFooter": {}},
+        ]
+    }
+}
+
+
+class TestSelectItems(object):
+    def test_prefixes(self):
+        assert select_items(tab_markets, "markets.item") == tab_markets["markets"]
+        assert select_items([1, 2], "item") == [1, 2]
+        assert select_items({"a": 1}, "") == [{"a": 1}]
+        assert select_items({"a": 1}, "b.item") == []
+        assert select_items(ladbrokes_markets, Ladbrokes.__markets_prefix__) == [
+            {"market": {"id": "2", "price": 1.5}}
+        ]
+
+
+class TestStreamingRequests(object):
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_relevant_markets_kept(self, unlimited_client):
+        respx.get(example_url).mock(return_value=Response(200, json=tab_markets))
+        api = Tab(unlimited_client)
+
+        markets = await api.make_streaming_request(
+            example_url, dict(), api.__markets_prefix__, api.is_relevant_market
+        )
+
+        assert markets == [tab_markets["markets"][0]]
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_numbers_parsed_as_floats(self, unlimited_client):
+        respx.get(example_url).mock(return_value=Response(200, json=ladbrokes_markets))
+        api = Ladbrokes(unlimited_client)
+
+        markets = await api.make_streaming_request(
+            example_url, dict(), api.__markets_prefix__
+        )
+
+        assert isinstance(markets[0]["market"]["price"], float)
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_full_parse_fallback(self, monkeypatch, unlimited_client):
+        """
+        Check that the same items are returned if ijson isn't installed.
+        """
+        monkeypatch.setattr("src.web.streaming.ijson", None)
+        respx.get(example_url).mock(return_value=Response(200, json=tab_markets))
+        api = Tab(unlimited_client)
+
+        markets = await api.make_streaming_request(
+            example_url, dict(), api.__markets_prefix__, api.is_relevant_market
+        )
+
+        assert markets == [tab_markets["markets"][0]]
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_not_found(self, unlimited_client):
+        respx.get(example_url).mock(return_value=Response(404))
+        api = Tab(unlimited_client)
+
+        markets = await api.make_streaming_request(
+            example_url, dict(), api.__markets_prefix__
+        )
+
+        assert markets is None
+
+    @respx.mock
+    @pytest.mark.anyio
+    async def test_permits_held_until_closed(self):
+        """
+        Check that a streamed response holds its permit until it is closed, and that
+        its size is recorded then.
+        """
+        respx.get(example_url).mock(return_value=Response(200, json=tab_markets))
+
+        async with RateLimitedClient(ClientSettings(None, 100)) as client:
+            limiter = client._get_domain_limiter("example")
+            async with client.stream("GET", example_url) as response:
+                assert limiter.in_flight == 1
+                content = await response.aread()
+
+            assert limiter.in_flight == 0
+            recorded = client.metrics.get(RESPONSE_BYTES, domain="example")
+            assert recorded == len(content)